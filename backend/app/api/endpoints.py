@@ -1,56 +1,299 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from typing import List
-from app.models.schemas import Track, TrackListResponse, UserEdits
+import asyncio
+import json
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+from app.config import PREVIEW_ENABLED
+from app.models.schemas import (
+    Track, TrackListResponse, TrackQuery, TrackStatusResponse, UserEdits, BatchUploadResponse, ExportRequest,
+    SearchResponse, BulkEditRequest, BulkEditResponse,
+)
 from app.services.storage import StorageService
-# We will import analysis service later
-# from app.services.analysis import AnalysisService
+from app.services.ingest import UploadRejected
+from app.services.engine import AnalysisEngine
+from app.services.job_queue import QUEUE_CONCURRENCY, JobQueue, JobDispatcher
+from app.services.result_cache import ResultCache
+from app.services.export import ExportService, MEDIA_TYPES
+from app.services.events import EventBus
+from app.services.startup import Startup
+from app.services.rescore import RescoreJob
+from app.services.metrics import ANALYSES_IN_PROGRESS, ANALYSES_TOTAL, observe_analysis
 
 router = APIRouter()
 
+# Comment line sent on idle /events streams so proxies keep the connection open
+EVENT_KEEPALIVE_SECONDS = 15
+
+# Upper bound for `limit` on similar-track and text search
+MAX_SEARCH_RESULTS = 500
+
+# Tracks per bulk edit request
+MAX_BULK_EDIT_TRACKS = 10000
+
+def queue_new_tracks(tracks: List[Track], priority: int = 0, background_tasks: Optional[BackgroundTasks] = None):
+    """
+    Reuse cached results for known audio and enqueue the rest in one go. A
+    process that should analyze but has no dispatcher running (Lambda) works
+    the queue itself once the response is sent.
+    """
+    to_queue = []
+    for track in tracks:
+        # Same audio analyzed before (by this model/vocabulary): reuse the result
+        cached = ResultCache.lookup(track.content_hash)
+        if cached:
+            print(f"[UPLOAD] {track.filename} matches track {cached['source_track_id']}, reusing analysis")
+            ResultCache.apply(track, cached)
+            StorageService.save_track(track)
+            ANALYSES_TOTAL.inc(result="cached")
+        else:
+            to_queue.append(track.id)
+
+    # Queue analysis (durable; picked up by JobDispatcher). The preview queue
+    # has its own workers, so first results show up even behind a long backlog.
+    if to_queue:
+        if PREVIEW_ENABLED:
+            JobQueue.enqueue_many(to_queue, priority=priority, queue="preview")
+        JobQueue.enqueue_many(to_queue, priority=priority)
+        JobDispatcher.wake()
+        if background_tasks is not None and Startup.runs_worker() and not JobDispatcher.running():
+            background_tasks.add_task(JobDispatcher.run_inline, {"full": run_analysis_task}, on_retry=requeue_track)
+
 @router.post("/upload", response_model=Track)
-async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
-    # Validate extension
-    allowed_ext = {'.mp3', '.wav', '.flac', '.m4a'}
-    lower_name = file.filename.lower()
-    if not any(lower_name.endswith(ext) for ext in allowed_ext):
-        raise HTTPException(status_code=400, detail="Supported formats: MP3, WAV, FLAC, M4A")
-    
-    track = await StorageService.save_upload(file)
-    
-    # Trigger analysis in background
-    background_tasks.add_task(run_analysis_task, track.id)
+async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...), priority: int = 0):
+    try:
+        track = await StorageService.save_upload(file)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.reason)
     
+    queue_new_tracks([track], priority, background_tasks)
     return track
 
-async def run_analysis_task(track_id: str):
+@router.post("/upload/batch", response_model=BatchUploadResponse)
+async def upload_batch(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...), priority: int = 0):
+    """Upload many audio files and/or zip archives in one request."""
+    tracks, rejected = await StorageService.save_batch(files)
+    if not tracks and rejected:
+        raise HTTPException(status_code=rejected[0].status_code, detail=f"{rejected[0].filename}: {rejected[0].reason}")
+    
+    queue_new_tracks(tracks, priority, background_tasks)
+    print(f"[UPLOAD] Batch ingested {len(tracks)} track(s), rejected {len(rejected)}")
+    return {
+        "tracks": tracks,
+        "rejected": [{"filename": r.filename, "reason": r.reason} for r in rejected],
+    }
+
+async def run_analysis_task(track_id: str) -> bool:
+    """Job handler: analyze one track. Returns False so the queue can retry."""
     try:
         print(f"[ANALYSIS] Starting analysis for track {track_id}")
-        from app.services.analysis import AnalysisService
         track = StorageService.get_track(track_id)
         if track:
-            track.status = "analyzing"
-            StorageService.save_track(track)
-            print(f"[ANALYSIS] Track status set to 'analyzing'")
-            
-            # Run analysis
-            await AnalysisService.analyze_track(track)
-            print(f"[ANALYSIS] Analysis complete for {track.filename}")
-            StorageService.save_track(track)
-            print(f"[ANALYSIS] Track saved with status: {track.status}")
+            # A duplicate may have finished while this job was queued
+            cached = ResultCache.lookup(track.content_hash)
+            if cached:
+                StorageService.update_track(track_id, lambda current: ResultCache.apply(current, cached))
+                ANALYSES_TOTAL.inc(result="cached")
+                return True
+
+            track = await analyze_and_save(track)
+            return track.status == "complete"
         else:
             print(f"[ANALYSIS ERROR] Track {track_id} not found")
+            # Nothing to retry
+            return True
     except Exception as e:
         print(f"[ANALYSIS ERROR] Failed to analyze track {track_id}: {e}")
         import traceback
         traceback.print_exc()
+        StorageService.update_track_status(track_id, "failed")
+        ANALYSES_TOTAL.inc(result="failed")
+        return False
+
+# A preview is only worth saving until the full analysis has finished
+PREVIEW_STATUSES = ("queued", "analyzing")
 
+async def run_preview_task(track_id: str) -> bool:
+    """
+    Job handler for the preview queue. Previews are best effort: a failure is
+    logged and never retried, since the full analysis follows anyway.
+    """
+    track = StorageService.get_track(track_id)
+    if track is None or track.status not in PREVIEW_STATUSES:
+        # Already analyzed in full
+        return True
+    try:
+        preview = await AnalysisEngine.preview(track)
+    except Exception as e:
+        print(f"[PREVIEW ERROR] Failed to preview track {track_id}: {e}")
+        return True
+
+    # Applied to the current record: the full analysis may have finished or edits been saved meanwhile
+    def apply_preview(current: Track) -> Optional[Track]:
+        if current.status not in PREVIEW_STATUSES:
+            return None
+        current.analysis = preview.analysis
+        current.duration = preview.duration
+        current.final_bpm = preview.final_bpm
+        current.final_key = preview.final_key
+        current.suggested_genres = preview.suggested_genres
+        current.provenance = preview.provenance
+        if current.status == "queued":
+            current.status = "preview"
+        return current.apply_edit_overrides()
+
+    if StorageService.update_track(track_id, apply_preview):
+        ANALYSES_TOTAL.inc(result="preview")
+        print(f"[PREVIEW] Preview ready for {track.filename}")
+    return True
+
+async def analyze_and_save(track: Track, profile: bool = False) -> Track:
+    """Run one analysis in the worker pool and persist the updated copy."""
+    StorageService.update_track_status(track.id, "analyzing")
+    track.status = "analyzing"
+    print(f"[ANALYSIS] Track status set to 'analyzing'")
+
+    ANALYSES_IN_PROGRESS.inc()
+    try:
+        # Run analysis in the worker pool (returns the updated copy)
+        track = await AnalysisEngine.run(track, profile=profile)
+    finally:
+        ANALYSES_IN_PROGRESS.dec()
+    print(f"[ANALYSIS] Analysis complete for {track.filename}")
+    observe_analysis(track.diagnostics)
+    ANALYSES_TOTAL.inc(result=track.status)
+    # The worker had a snapshot from before the analysis; keep edits saved since then
+    result = track
+
+    def keep_edits(current: Track) -> Track:
+        return result.model_copy(update={"edits": current.edits}).apply_edit_overrides()
+
+    track = StorageService.update_track(track.id, keep_edits) or result
+    print(f"[ANALYSIS] Track saved with status: {track.status}")
+    ResultCache.store(track)
+    return track
+
+def requeue_track(track_id: str):
+    """Retry hook: show the track as queued again while it waits out its backoff."""
+    StorageService.update_track_status(track_id, "queued")
+
+@router.get("/queue")
+def get_queue_stats():
+    """Job counts by status, overall and per queue."""
+    stats = JobQueue.stats()
+    stats["queues"] = {queue: JobQueue.stats(queue) for queue in QUEUE_CONCURRENCY}
+    return stats
+
+@router.get("/rescore")
+def get_rescore_status():
+    return RescoreJob.report()
+
+@router.post("/rescore", status_code=202)
+async def start_rescore(force: bool = False):
+    """
+    Re-tag the library from stored embeddings with the current vocabulary and
+    mapping rules. Only tracks tagged under another vocabulary version are
+    touched unless force is set.
+    """
+    if not Startup.runs_worker():
+        raise HTTPException(status_code=409, detail="Re-scoring needs the CLAP model, which only worker processes load (APP_ROLE=api)")
+    if not RescoreJob.start(force):
+        raise HTTPException(status_code=409, detail="A re-score is already running")
+    return RescoreJob.report()
 
 
 @router.get("/tracks", response_model=TrackListResponse)
-def get_tracks():
-    tracks = StorageService.list_tracks()
+def get_tracks(
+    status: Optional[str] = None, # comma-separated, e.g. "queued,analyzing"
+    bpm_min: Optional[float] = None,
+    bpm_max: Optional[float] = None,
+    key: Optional[str] = None,
+    genre: Optional[str] = None,
+    mood: Optional[str] = None,
+    sort: str = "upload_date",
+    order: str = "desc",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+):
+    if sort not in ("upload_date", "bpm", "filename", "key"):
+        raise HTTPException(status_code=400, detail="sort must be one of: upload_date, bpm, filename, key")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+
+    query = TrackQuery(
+        status=[s for s in status.split(",") if s] if status else [],
+        bpm_min=bpm_min, bpm_max=bpm_max, key=key, genre=genre, mood=mood,
+        sort=sort, order=order, limit=limit, cursor=cursor,
+    )
+    try:
+        tracks, next_cursor = StorageService.query_tracks(query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"tracks": tracks, "next_cursor": next_cursor}
+
+def parse_ids(ids: Optional[str]) -> List[str]:
+    return list(dict.fromkeys(i for i in (ids or "").split(",") if i))
+
+# Declared before /tracks/{track_id} so "status" is not taken for an ID
+@router.get("/tracks/status", response_model=TrackStatusResponse)
+def get_track_statuses(ids: str):
+    """Status (and current analysis stage) for many tracks in one request."""
+    track_ids = parse_ids(ids)
+    statuses = StorageService.get_statuses(track_ids)
+    tracks = []
+    for track_id in track_ids:
+        if track_id not in statuses:
+            continue
+        entry = {"id": track_id, "status": statuses[track_id]}
+        if statuses[track_id] == "analyzing":
+            entry.update(EventBus.last_stage(track_id) or {})
+        tracks.append(entry)
     return {"tracks": tracks}
 
+def sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+@router.get("/events")
+async def track_events(request: Request, ids: Optional[str] = None):
+    """
+    Server-sent events: `status` on every track status change and `stage`
+    while a track is analyzed. `ids` limits the stream to those tracks and
+    starts it with their current status. Events are published in the process
+    that runs the analysis, so a process without a dispatcher (APP_ROLE=api,
+    Lambda) has none to send and answers 409.
+    """
+    if not JobDispatcher.running():
+        raise HTTPException(status_code=409, detail="No analyses run in this process; poll /api/tracks/status instead")
+    track_ids = set(parse_ids(ids))
+
+    async def stream():
+        queue = EventBus.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            if track_ids:
+                for status in get_track_statuses(",".join(track_ids))["tracks"]:
+                    yield sse({"type": "status", "track_id": status["id"], "status": status["status"]})
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                if not track_ids or event["track_id"] in track_ids:
+                    yield sse(event)
+        finally:
+            EventBus.unsubscribe(queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get("/tracks/{track_id}", response_model=Track)
 def get_track(track_id: str):
     track = StorageService.get_track(track_id)
@@ -58,64 +301,87 @@ def get_track(track_id: str):
         raise HTTPException(status_code=404, detail="Track not found")
     return track
 
+def search_index(query, limit: int, exclude: List[str] = ()):
+    """Top-k over the embedding index, resolved to (still existing) tracks."""
+    from app.services.embedding_index import EmbeddingIndex
+    if not 1 <= limit <= MAX_SEARCH_RESULTS:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_SEARCH_RESULTS}")
+    hits = EmbeddingIndex.instance().search(query, limit, exclude=exclude)
+    by_id = {t.id: t for t in StorageService.get_tracks([track_id for track_id, _ in hits])}
+    return {"results": [{"track": by_id[tid], "score": score} for tid, score in hits if tid in by_id]}
+
+@router.get("/tracks/{track_id}/similar", response_model=SearchResponse)
+def similar_tracks(track_id: str, limit: int = 10):
+    """Tracks whose CLAP audio embedding is closest to this one's."""
+    from app.services.embedding_index import EmbeddingIndex
+    if not StorageService.get_track(track_id):
+        raise HTTPException(status_code=404, detail="Track not found")
+    embedding = EmbeddingIndex.instance().get(track_id)
+    if embedding is None:
+        raise HTTPException(status_code=409, detail="Track has no stored embedding yet; analyze it first")
+    return search_index(embedding, limit, exclude=[track_id])
+
+@router.get("/search", response_model=SearchResponse)
+async def search_tracks(q: str, limit: int = 20):
+    """Free-text search ("dark cinematic strings") against the library's audio embeddings."""
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q must not be empty")
+    if not Startup.runs_worker():
+        raise HTTPException(status_code=409, detail="Text search needs the CLAP model, which only worker processes load (APP_ROLE=api)")
+    embedding = await AnalysisEngine.embed_text(q.strip())
+    return await run_in_threadpool(search_index, embedding, limit)
+
+@router.post("/tracks/{track_id}/profile", response_model=Track)
+async def profile_track(track_id: str):
+    """
+    Re-analyze one track under the profiler (outside the job queue). The report
+    path is returned in diagnostics.profile_path, next to the stage timings.
+    """
+    if not Startup.runs_worker():
+        raise HTTPException(status_code=409, detail="Profiling runs in worker processes (APP_ROLE=api)")
+    track = StorageService.get_track(track_id)
+    if not track:
+        raise HTTPException(status_code=404, detail="Track not found")
+    if track.status == "analyzing":
+        raise HTTPException(status_code=409, detail="Track is being analyzed")
+    return await analyze_and_save(track, profile=True)
+
 @router.put("/tracks/{track_id}/edits", response_model=Track)
 def update_edits(track_id: str, edits: UserEdits):
-    track = StorageService.get_track(track_id)
+    def set_edits(track: Track) -> Track:
+        track.edits = edits
+        # Logic: final = edit if present else analysis
+        return track.apply_edit_overrides()
+
+    track = StorageService.update_track(track_id, set_edits)
     if not track:
         raise HTTPException(status_code=404, detail="Track not found")
-    
-    track.edits = edits
-    
-    # Update final display values based on edits or raw analysis?
-    # Logic: final = edit if present else analysis
-    if edits.bpm:
-        track.final_bpm = edits.bpm
-    if edits.key:
-        track.final_key = edits.key
-        
-    StorageService.save_track(track)
     return track
 
-@router.get("/export/csv")
-def export_csv(track_ids: str):
-    import csv
-    import io
-    from fastapi.responses import StreamingResponse
-    
-    ids = track_ids.split(',')
-    
-    # Create CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Headers
-    writer.writerow(['Filename', 'BPM', 'Key', 'Genres', 'Moods', 'Styles', 'Notes'])
-    
-    for tid in ids:
-        track = StorageService.get_track(tid)
-        if track:
-            # Determine values (User edits > Analysis > Default)
-            bpm = track.final_bpm or (track.edits.bpm if track.edits else 0)
-            key = track.final_key or (track.edits.key if track.edits else "")
-            
-            genres = (track.edits.genres if track.edits and track.edits.genres else track.suggested_genres) or []
-            moods = (track.edits.moods if track.edits and track.edits.moods else track.suggested_moods) or []
-            styles = (track.edits.styles if track.edits and track.edits.styles else track.suggested_styles) or []
-            notes = track.edits.notes if track.edits else ""
-            
-            writer.writerow([
-                track.filename,
-                round(bpm),
-                key,
-                ", ".join(genres),
-                ", ".join(moods),
-                ", ".join(styles),
-                notes
-            ])
-            
-    output.seek(0)
-    
-    response = StreamingResponse(iter([output.getvalue()]), media_type="text/csv")
-    response.headers["Content-Disposition"] = "attachment; filename=export.csv"
+@router.patch("/tracks/edits", response_model=BulkEditResponse)
+def bulk_edit(request: BulkEditRequest):
+    """
+    Apply one patch (add/remove genres, moods and styles, set BPM, key or
+    notes) to the edits of many tracks, in a single transaction.
+    """
+    if len(request.track_ids) > MAX_BULK_EDIT_TRACKS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_EDIT_TRACKS} tracks per request")
+    updated = StorageService.update_tracks(request.track_ids, request.patch.apply)
+    found = {t.id for t in updated}
+    return BulkEditResponse(updated=len(updated), missing=[tid for tid in dict.fromkeys(request.track_ids) if tid not in found])
+
+def export_response(request: ExportRequest) -> StreamingResponse:
+    response = StreamingResponse(ExportService.stream(request), media_type=MEDIA_TYPES[request.format])
+    response.headers["Content-Disposition"] = f"attachment; filename=export.{request.format}"
     return response
 
+@router.post("/export")
+def export_tracks(request: ExportRequest):
+    """Stream an export for explicit IDs or a filter selection (CSV, NDJSON or JSON)."""
+    return export_response(request)
+
+@router.get("/export/csv")
+def export_csv(track_ids: str):
+    """Legacy query-string export; prefer POST /export for large selections."""
+    ids = [tid for tid in track_ids.split(',') if tid]
+    return export_response(ExportRequest(format="csv", track_ids=ids))
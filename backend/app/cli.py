@@ -0,0 +1,59 @@
+"""
+Command-line entry points (run from backend/).
+
+    python -m app.cli scan /music/archive [/more/paths] [--workers N] [--force]
+
+scan analyzes audio files in place through the same worker pool and storage
+as the API; see app/services/scanner.py.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+
+async def run_scan(paths: List[Path], force: bool) -> dict:
+    # Imported after argument parsing so --workers reaches app.config
+    from app.config import JOB_CONCURRENCY, SCAN_MANIFEST_DB
+    from app.services.engine import AnalysisEngine
+    from app.services.scanner import LibraryScanner, ScanManifest
+
+    manifest = ScanManifest(SCAN_MANIFEST_DB)
+    try:
+        return await LibraryScanner(manifest, JOB_CONCURRENCY, force=force).scan(paths)
+    finally:
+        AnalysisEngine.close()
+        manifest.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="MP3 Meta Tagger Analyzer tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    scan = commands.add_parser("scan", help="Analyze audio files in place (incremental, resumable)")
+    scan.add_argument("paths", nargs="+", type=Path, help="Directories to walk")
+    scan.add_argument("--workers", type=int, help="Analysis workers (default: ANALYSIS_WORKERS)")
+    scan.add_argument("--force", action="store_true", help="Re-hash and re-check files the manifest marks as done")
+    args = parser.parse_args(argv)
+
+    for path in args.paths:
+        if not path.is_dir():
+            parser.error(f"not a directory: {path}")
+    if args.workers:
+        os.environ["ANALYSIS_WORKERS"] = str(args.workers)
+
+    start = time.perf_counter()
+    try:
+        counts = asyncio.run(run_scan(args.paths, args.force))
+    except KeyboardInterrupt:
+        print("[SCAN] Interrupted; run the same command again to resume")
+        return 130
+    summary = ", ".join(f"{k} {v}" for k, v in counts.items())
+    print(f"[SCAN] Done in {time.perf_counter() - start:.1f}s: {summary}")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
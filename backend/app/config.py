@@ -0,0 +1,109 @@
+"""
+Runtime configuration for the backend.
+Values come from environment variables so the same image works locally,
+in Docker and on Lambda without code changes.
+"""
+import os
+from pathlib import Path
+
+# Define paths
+BASE_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = Path(os.getenv("DATA_DIR", BASE_DIR / "data"))
+CACHE_DIR = DATA_DIR / "cache"
+
+# Process role: "api" serves HTTP and only enqueues analysis (never imports the
+# ML stack), "worker" runs the job dispatcher with a warmed-up model, "all" does both.
+# Progress events (/api/events) stay in the process that analyzes, so an "api"
+# process serves none and clients poll /api/tracks/status instead.
+APP_ROLE = os.getenv("APP_ROLE", "all").lower()
+# Push a dummy clip through DSP and CLAP at startup so the first track is not slow
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "1").lower() not in ("0", "false", "no")
+
+# Tagging vocabulary (prompts, thresholds) and style mapping rules
+VOCABULARY_PATH = Path(os.getenv("VOCABULARY_PATH", BASE_DIR / "vocabulary.yaml"))
+MAPPING_RULES_PATH = Path(os.getenv("MAPPING_RULES_PATH", BASE_DIR / "mapping_rules.yaml"))
+# Tracks re-tagged per batch by the library re-score job
+RESCORE_BATCH_SIZE = int(os.getenv("RESCORE_BATCH_SIZE", "1024"))
+
+# Model
+CLAP_MODEL_NAME = os.getenv("CLAP_MODEL_NAME", "laion/clap-htsat-unfused")
+PROMPT_CACHE_DIR = CACHE_DIR / "prompt_embeddings"
+
+# CLAP inference backend: "torch" (fp32), "int8" (dynamically quantized torch),
+# "onnx" or "onnx-int8" (ONNX Runtime; exported once into ONNX_CACHE_DIR)
+CLAP_BACKEND = os.getenv("CLAP_BACKEND", "torch").lower()
+ONNX_CACHE_DIR = CACHE_DIR / "onnx"
+# Threads per inference runtime. 0 = cores / ANALYSIS_WORKERS for intra-op;
+# inter-op parallelism rarely helps a single encoder, so it defaults to 1
+CLAP_INTRA_OP_THREADS = int(os.getenv("CLAP_INTRA_OP_THREADS", "0"))
+CLAP_INTER_OP_THREADS = int(os.getenv("CLAP_INTER_OP_THREADS", "1"))
+
+# Stored CLAP audio embeddings (similar-track and text search)
+EMBEDDING_INDEX_DIR = DATA_DIR / "index"
+
+# Batched CLAP inference: clips per forward pass and how long to wait for a batch to fill.
+# Only analyses in one process share a batch, so tracks batch together with
+# ANALYSIS_EXECUTOR=thread; each process-pool worker batches one track's windows.
+CLAP_BATCH_SIZE = int(os.getenv("CLAP_BATCH_SIZE", "8"))
+CLAP_BATCH_MAX_WAIT_MS = float(os.getenv("CLAP_BATCH_MAX_WAIT_MS", "50"))
+
+# Analysis engine: "process" (one model per worker, uses every core) or
+# "thread" (one shared model, for low-memory hosts)
+ANALYSIS_EXECUTOR = os.getenv("ANALYSIS_EXECUTOR", "process").lower()
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(min(os.cpu_count() or 1, 4))))
+
+# Durable job queue
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", str(ANALYSIS_WORKERS)))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "30"))
+# A claimed job is leased to its worker for this long and renewed while it runs;
+# only jobs whose lease ran out (their worker died) are handed to another worker
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+# Preview tier: BPM, key and a coarse genre guess from a PREVIEW_SECONDS excerpt,
+# shown (status "preview") while the full analysis waits its turn. Previews have
+# their own queue and worker pool so a deep full-analysis backlog cannot delay them.
+PREVIEW_ENABLED = os.getenv("PREVIEW_ENABLED", "1").lower() not in ("0", "false", "no")
+PREVIEW_SECONDS = float(os.getenv("PREVIEW_SECONDS", "15"))
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "1"))
+PREVIEW_CONCURRENCY = int(os.getenv("PREVIEW_CONCURRENCY", str(PREVIEW_WORKERS)))
+
+# Track metadata store: "sqlite" (indexed, default) or "json" (one file per track)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite").lower()
+# Serialized records the json backend keeps in memory (LRU, write-through); 0 disables it
+TRACK_CACHE_SIZE = int(os.getenv("TRACK_CACHE_SIZE", "4096"))
+
+# Long files: above this duration, DSP streams the file in blocks of STREAM_BLOCK_FRAMES
+# STFT frames and CLAP scores CLAP_WINDOW_COUNT evenly spaced CLAP_WINDOW_SECONDS windows
+CLAP_SAMPLE_RATE = 48000
+STREAMING_THRESHOLD_SECONDS = float(os.getenv("STREAMING_THRESHOLD_SECONDS", "600"))
+STREAM_BLOCK_FRAMES = int(os.getenv("STREAM_BLOCK_FRAMES", "2048"))
+CLAP_WINDOW_COUNT = int(os.getenv("CLAP_WINDOW_COUNT", "6"))
+CLAP_WINDOW_SECONDS = float(os.getenv("CLAP_WINDOW_SECONDS", "10"))
+
+# DSP features (BPM, key, brightness) run at this rate; only CLAP gets the 48k signal.
+# CHROMA_MODE "stft" reuses the shared STFT, "cqt" computes a separate constant-Q chroma.
+DSP_SAMPLE_RATE = int(os.getenv("DSP_SAMPLE_RATE", "22050"))
+CHROMA_MODE = os.getenv("CHROMA_MODE", "stft").lower()
+
+# Decoded PCM (float32 mono .npy per content hash and sample rate), memory-mapped by
+# later analyses instead of decoding again. Least recently used files are evicted
+# above PCM_CACHE_MAX_BYTES; 0 disables the cache.
+PCM_CACHE_DIR = DATA_DIR / "pcm"
+PCM_CACHE_MAX_BYTES = int(os.getenv("PCM_CACHE_MAX_BYTES", "0"))
+
+# Upload limits
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+MAX_ARCHIVE_BYTES = int(os.getenv("MAX_ARCHIVE_BYTES", str(10 * 1024 * 1024 * 1024)))
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "1000"))
+
+# Manifest of files seen by the in-place library scanner (python -m app.cli scan)
+SCAN_MANIFEST_DB = DATA_DIR / "scan_manifest.db"
+
+# Tracks read from storage per page while streaming an export
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+
+# Single-track profiling (POST /api/tracks/{id}/profile): "auto" uses pyinstrument
+# when installed and falls back to cProfile
+PROFILER = os.getenv("PROFILER", "auto").lower()
+PROFILE_DIR = DATA_DIR / "profiles"
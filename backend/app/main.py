@@ -1,7 +1,52 @@
-from fastapi import FastAPI
+import time
+_import_started = time.perf_counter()
+
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from app.config import MODEL_WARMUP, PREVIEW_ENABLED
+from app.services.engine import AnalysisEngine
+from app.services.events import EventBus
+from app.services.job_queue import QUEUE_CONCURRENCY, JobDispatcher, JobQueue
+from app.services.metrics import CONTENT_TYPE, QUEUE_JOBS, REGISTRY
+from app.services.startup import Startup
+from app.services.storage import StorageService
+from app.models.schemas import TrackQuery
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from app.api.endpoints import run_analysis_task, run_preview_task, requeue_track
+    Startup.check_role()
+    EventBus.attach(asyncio.get_running_loop())
+    warm_up = None
+    if Startup.runs_worker():
+        # Tracks stuck in queued/preview/analyzing from a previous run get their jobs back
+        orphaned = [t.id for t in StorageService.list_tracks(TrackQuery(status=["queued", "preview", "analyzing"]))]
+        handlers = {"full": run_analysis_task}
+        if PREVIEW_ENABLED:
+            handlers["preview"] = run_preview_task
+        JobDispatcher.start(handlers, orphaned_track_ids=orphaned, on_retry=requeue_track)
+        if MODEL_WARMUP:
+            # In the background so /ready can answer "warming" meanwhile
+            warm_up = asyncio.create_task(Startup.warm_up())
+        else:
+            Startup.mark_ready()
+    else:
+        StorageService.backend()
+        Startup.mark_ready()
+        heavy = Startup.loaded_heavy_modules()
+        if heavy:
+            print(f"[STARTUP] Warning: API-only process imported {', '.join(heavy)}")
+    yield
+    if warm_up is not None:
+        warm_up.cancel()
+    await JobDispatcher.stop()
+    AnalysisEngine.close()
+    EventBus.detach()
 
-app = FastAPI(title="MP3 Meta Tagger Analyzer")
+app = FastAPI(title="MP3 Meta Tagger Analyzer", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -16,6 +61,23 @@ app.add_middleware(
 def read_root():
     return {"message": "MP3 Meta Tagger Analyzer API"}
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 503 until startup (and model warm-up, for workers) has finished."""
+    report = Startup.report()
+    # Status/stage events exist only where analyses run; clients poll /api/tracks/status otherwise
+    report["live_events"] = JobDispatcher.running()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint."""
+    for queue in QUEUE_CONCURRENCY:
+        for status, count in JobQueue.stats(queue).items():
+            QUEUE_JOBS.set(count, queue=queue, status=status)
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 from app.api.endpoints import router as api_router
 app.include_router(api_router, prefix="/api")
 
+Startup.record_import("app.main", time.perf_counter() - _import_started)
@@ -1,4 +1,4 @@
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Literal
 from pydantic import BaseModel, Field
 from uuid import UUID, uuid4
 from datetime import datetime
@@ -16,6 +16,14 @@ class AnalysisResult(BaseModel):
     # Musicnn / Raw tags
     model_tags: Dict[str, Any] = {} # e.g. {"rock": 0.9, "happy": 0.5, "instruments": {...}}
 
+class AnalysisDiagnostics(BaseModel):
+    # Seconds per timing span (repeated spans are summed; see counts)
+    stages: Dict[str, float] = {}
+    counts: Dict[str, int] = {}
+    total_seconds: float = 0.0
+    worker_pid: Optional[int] = None
+    profile_path: Optional[str] = None # set when the analysis ran under the profiler
+
 class UserEdits(BaseModel):
     bpm: Optional[float] = None
     key: Optional[str] = None
@@ -30,13 +38,22 @@ class Track(BaseModel):
     filepath: str
     upload_date: datetime = Field(default_factory=datetime.now)
     duration: float = 0.0
-    status: str = "queued" # queued, analyzing, complete, failed, error
+    status: str = "queued" # queued, preview, analyzing, complete, failed, error
+    content_hash: Optional[str] = None # sha256 of the uploaded bytes
     
     analysis: Optional[AnalysisResult] = None
+    diagnostics: Optional[AnalysisDiagnostics] = None # timings of the last analysis
+    # Normalized CLAP audio embedding, handed from the worker to the embedding
+    # index. Never stored on the record or returned by the API.
+    embedding: Optional[List[float]] = Field(default=None, exclude=True)
     
     # Mapped tags (The suggested generic ones)
     suggested_genres: List[str] = []
     suggested_moods: List[str] = []
+    suggested_styles: List[str] = [] # from mapping_rules.yaml
+    tag_version: Optional[str] = None # VOCABULARY_VERSION the suggestions were computed with
+    # Which tier produced each analyzed field: "preview" (excerpt) or "full"
+    provenance: Dict[str, str] = {}
     
     # Final User edits (Source of truth for export)
     edits: UserEdits = Field(default_factory=UserEdits)
@@ -44,9 +61,129 @@ class Track(BaseModel):
     # Cached display values (merged/mapped)
     final_bpm: float = 0.0
     final_key: str = ""
+
+    def merged(self) -> Dict[str, Any]:
+        """Values for display/export: user edits win over analysis suggestions."""
+        edits = self.edits or UserEdits()
+        return {
+            "bpm": edits.bpm or self.final_bpm,
+            "key": edits.key or self.final_key,
+            "genres": edits.genres or self.suggested_genres,
+            "moods": edits.moods or self.suggested_moods,
+            "styles": edits.styles or self.suggested_styles,
+            "notes": edits.notes,
+        }
+
+    def apply_edit_overrides(self) -> "Track":
+        """
+        Put the user's BPM/key edits back on final_bpm/final_key (which the
+        store indexes) after analysis results have replaced them.
+        """
+        if self.edits.bpm:
+            self.final_bpm = self.edits.bpm
+        if self.edits.key:
+            self.final_key = self.edits.key
+        return self
     
+class EditPatch(BaseModel):
+    """Changes applied to the edits of every track in a bulk edit."""
+    add_genres: List[str] = []
+    remove_genres: List[str] = []
+    add_moods: List[str] = []
+    remove_moods: List[str] = []
+    add_styles: List[str] = []
+    remove_styles: List[str] = []
+    bpm: Optional[float] = None
+    key: Optional[str] = None
+    notes: Optional[str] = None
+
+    def apply(self, track: "Track") -> "Track":
+        """
+        Tag changes start from what the track shows (its edits, or the
+        suggestions while it has none), so adding a genre keeps the others.
+        """
+        merged = track.merged()
+        edits = track.edits
+        for field in ("genres", "moods", "styles"):
+            add = getattr(self, f"add_{field}")
+            remove = {t.lower() for t in getattr(self, f"remove_{field}")}
+            if add or remove:
+                tags = [t for t in merged[field] if t.lower() not in remove]
+                seen = {t.lower() for t in tags}
+                for tag in add:
+                    if tag.lower() not in seen:
+                        tags.append(tag)
+                        seen.add(tag.lower())
+                setattr(edits, field, tags)
+        if self.bpm:
+            edits.bpm = self.bpm
+        if self.key:
+            edits.key = self.key
+        if self.notes is not None:
+            edits.notes = self.notes
+        return track.apply_edit_overrides()
+
+class BulkEditRequest(BaseModel):
+    track_ids: List[str]
+    patch: EditPatch
+
+class BulkEditResponse(BaseModel):
+    updated: int
+    missing: List[str] = [] # IDs with no track
+
+class TrackQuery(BaseModel):
+    status: List[str] = [] # any of these statuses
+    bpm_min: Optional[float] = None
+    bpm_max: Optional[float] = None
+    key: Optional[str] = None
+    genre: Optional[str] = None
+    mood: Optional[str] = None
+    sort: str = "upload_date" # upload_date, bpm, filename, key
+    order: str = "desc" # asc, desc
+    limit: Optional[int] = None # None = everything
+    cursor: Optional[str] = None # next_cursor from the previous page
+
 class TrackListResponse(BaseModel):
     tracks: List[Track]
+    next_cursor: Optional[str] = None
+
+class TrackStatus(BaseModel):
+    id: str
+    status: str
+    stage: Optional[str] = None  # set while analyzing, e.g. "features", "embedding"
+    progress: Optional[float] = None
+
+class TrackStatusResponse(BaseModel):
+    tracks: List[TrackStatus]
+
+class SearchHit(BaseModel):
+    track: Track
+    score: float # cosine similarity of the CLAP embeddings
+
+class SearchResponse(BaseModel):
+    results: List[SearchHit]
+
+class RejectedUpload(BaseModel):
+    filename: str
+    reason: str
+
+class BatchUploadResponse(BaseModel):
+    tracks: List[Track]
+    rejected: List[RejectedUpload] = []
+
+class ExportFilter(BaseModel):
+    status: Optional[List[str]] = None
+    genre: Optional[str] = None
+    mood: Optional[str] = None
+    key: Optional[str] = None
+    bpm_min: Optional[float] = None
+    bpm_max: Optional[float] = None
+
+class ExportRequest(BaseModel):
+    format: Literal["csv", "ndjson", "json"] = "csv"
+    track_ids: Optional[List[str]] = None # explicit selection; takes precedence over filter
+    filter: Optional[ExportFilter] = None
+    all_complete: bool = False # shorthand for filter status=complete
 
 class TrackExport(BaseModel):
     filename: str
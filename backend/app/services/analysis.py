@@ -1,10 +1,28 @@
+import os
 import librosa
 import numpy as np
-from transformers import ClapModel, ClapProcessor
 import torch
 import warnings
 from typing import Dict, List, Tuple, Optional, Any
-from app.models.schemas import Track, AnalysisResult
+from app.models.schemas import Track, AnalysisResult, AnalysisDiagnostics
+from app.config import (
+    CLAP_BACKEND, CLAP_MODEL_NAME, CLAP_SAMPLE_RATE, CLAP_WINDOW_COUNT, CLAP_WINDOW_SECONDS,
+    DSP_SAMPLE_RATE, PREVIEW_SECONDS, STREAMING_THRESHOLD_SECONDS, STREAM_BLOCK_FRAMES,
+)
+from app.services.features import decode, extract_features, load_windows, probe_duration, stream_features
+from app.services.pcm_cache import PcmCache
+from app.services.prompt_cache import PromptEmbeddingCache, as_embedding
+from app.services.events import report_stage
+from app.services.timing import recording, span
+from app.services.inference_worker import ClapInferenceWorker
+from app.services.clap_runtime import load_clap
+from app.services.vocabulary import (
+    ALL_PROMPT_TEXTS, GENRE_TEXT_MAP, INSTRUMENT_PROMPTS, MODEL_ID, MOOD_PROMPTS, PROMPT_GROUP_SLICES, THRESHOLDS,
+    apply_tags, map_styles,
+)
+
+# Fields a full analysis produces (Track.provenance keys)
+ANALYZED_FIELDS = ("bpm", "key", "duration", "genres", "moods", "styles", "energy", "danceability")
 
 class AnalysisService:
     _clap_model = None
@@ -12,188 +30,271 @@ class AnalysisService:
 
     @classmethod
     def get_clap_model(cls):
-        """Lazy load LAION-CLAP model"""
+        """Lazy load LAION-CLAP model (CLAP_BACKEND picks fp32, int8 or ONNX)"""
         if cls._clap_model is None:
             try:
-                print("Loading LAION-CLAP Model...")
-                model_name = "laion/clap-htsat-unfused"
-                cls._clap_processor = ClapProcessor.from_pretrained(model_name)
-                cls._clap_model = ClapModel.from_pretrained(model_name)
+                print(f"Loading LAION-CLAP Model ({CLAP_BACKEND} backend)...")
+                with span("model_load"):
+                    cls._clap_model, cls._clap_processor = load_clap(CLAP_MODEL_NAME, CLAP_BACKEND)
                 print("LAION-CLAP Model Loaded successfully.")
             except Exception as e:
                 print(f"Error loading CLAP model: {e}")
                 return None, None
         return cls._clap_model, cls._clap_processor
 
+    @classmethod
+    def warm_up(cls):
+        """
+        Load the model and push a dummy clip through DSP and CLAP, so numba JIT,
+        prompt embeddings and the inference thread are ready before real tracks.
+        """
+        y = (np.random.default_rng(0).standard_normal(CLAP_SAMPLE_RATE * 2) * 0.01).astype(np.float32)
+        extract_features(librosa.resample(y, orig_sr=CLAP_SAMPLE_RATE, target_sr=DSP_SAMPLE_RATE), DSP_SAMPLE_RATE)
+        model, processor = cls.get_clap_model()
+        if model is None:
+            raise RuntimeError("CLAP model failed to load")
+        PromptEmbeddingCache.get(model, processor, MODEL_ID, ALL_PROMPT_TEXTS)
+        ClapInferenceWorker.instance(model, processor).submit(y, CLAP_SAMPLE_RATE).result()
+
+    @classmethod
+    def embed_text(cls, text: str) -> List[float]:
+        """Normalized CLAP text embedding of a free-text query (for search)."""
+        model, processor = cls.get_clap_model()
+        if model is None:
+            raise RuntimeError("CLAP model failed to load")
+        inputs = processor(text=[text], return_tensors="pt", padding=True)
+        with torch.no_grad():
+            return as_embedding(model.get_text_features(**inputs))[0].tolist()
+
+    @staticmethod
+    def score_embeddings(audio_embeds: torch.Tensor, text_embeds: torch.Tensor, logit_scale) -> Dict[str, torch.Tensor]:
+        """
+        Score audio embeddings against the stacked prompt matrix in one matmul.
+        Softmax is applied per prompt group, so each group's probabilities are
+        identical to running that group through ClapModel on its own.
+        Returns {group: [num_audio, group_size]}.
+        """
+        with torch.no_grad():
+            logits = torch.matmul(audio_embeds, text_embeds.t()) * logit_scale
+            return {
+                group: logits[:, sl].softmax(dim=-1)
+                for group, sl in PROMPT_GROUP_SLICES.items()
+            }
+
+    @classmethod
+    def tag_embeddings(cls, audio_embeds) -> List[Dict[str, Any]]:
+        """
+        Tags for each row of a [num_tracks, dim] matrix of normalized track
+        embeddings. Used by analysis (one row) and by the library re-score job.
+        """
+        model, processor = cls.get_clap_model()
+        if model is None:
+            raise RuntimeError("CLAP model failed to load")
+        with span("prompt_embeddings"):
+            text_embeds = PromptEmbeddingCache.get(model, processor, MODEL_ID, ALL_PROMPT_TEXTS)
+        with span("scoring"):
+            audio_embeds = torch.as_tensor(audio_embeds, dtype=torch.float32)
+            scores = AnalysisService.score_embeddings(audio_embeds, text_embeds, model.logit_scale_a.exp())
+            scores = {g: p.numpy() for g, p in scores.items()}
+            return [
+                AnalysisService.tags_from_scores({g: p[i] for g, p in scores.items()})
+                for i in range(audio_embeds.shape[0])
+            ]
+
+    @staticmethod
+    def tags_from_scores(scores: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn per-group probabilities for one track into display tags."""
+        clap_genres = []
+        clap_moods = []
+        clap_instruments = {}
+
+        # 1. Genres
+        # Aggregate scores by Genre (Max pooling across variations)
+        genre_scores = {}
+        for idx, score in enumerate(scores["genres"].tolist()):
+            target_genre = GENRE_TEXT_MAP[idx]
+            current = genre_scores.get(target_genre, 0.0)
+            genre_scores[target_genre] = max(current, score)
+
+        # Filter top genres
+        sorted_genres = sorted(genre_scores.items(), key=lambda x: x[1], reverse=True)
+        # CLAP is very confident, so we take the top few distinct
+        for g, s in sorted_genres[:THRESHOLDS["max_genres"]]:
+            if s > THRESHOLDS["genre_min_score"]: # Low threshold because softmax distributes across many prompts
+                clap_genres.append(g)
+
+        # 2. Moods
+        sorted_moods = list(zip(MOOD_PROMPTS, scores["moods"].tolist()))
+        sorted_moods.sort(key=lambda x: x[1], reverse=True)
+        for m, s in sorted_moods[:THRESHOLDS["max_moods"]]:
+            clap_moods.append(m)
+
+        # 3. Instruments
+        for idx, score in enumerate(scores["instruments"].tolist()):
+            if score > THRESHOLDS["instrument_min_score"]:
+                clap_instruments[INSTRUMENT_PROMPTS[idx]] = round(score, 3)
+
+        # 4. ENERGY & DANCEABILITY (AI-Based)
+        # Instead of RMS/PLP, we ask the AI.
+        p_high, p_low, p_dance, p_no_dance = scores["metrics"].tolist()
+        # Energy Score: High vs Low
+        ai_energy = p_high / (p_high + p_low + 1e-6) # Normalize relative to the pair
+        # Danceability Score: Danceable vs Not
+        ai_danceability = p_dance / (p_dance + p_no_dance + 1e-6)
+
+        # FUSION LOGIC (Mood + Genre)
+        # Example: "Dark" + "Trap" -> "Dark Trap"
+        # Only if they aren't already explicit genres
+        top_genre = clap_genres[0] if clap_genres else ""
+        top_mood = clap_moods[0] if clap_moods else ""
+
+        fusion = f"{top_mood} {top_genre}"
+        # Check if this fusion already exists as a main genre (e.g. "Dark Trap" is in our prompt list)
+        # If it's a novel combination, add it.
+        if top_genre and top_mood:
+            clap_genres.insert(0, fusion)
+
+        return {
+            "genres": clap_genres,
+            "moods": clap_moods,
+            "instruments": clap_instruments,
+            "styles": map_styles(clap_genres, clap_moods, clap_instruments),
+            "energy": ai_energy,
+            "danceability": ai_danceability,
+        }
+
+    @staticmethod
+    async def analyze_track(track: Track) -> Track:
+        """Run analysis on the executor-backed engine without blocking the event loop."""
+        from app.services.engine import AnalysisEngine
+        return await AnalysisEngine.run(track)
+
+    @staticmethod
+    def preview_track_sync(track: Track) -> Track:
+        """
+        Preview tier: BPM, key and a coarse genre guess from one PREVIEW_SECONDS
+        excerpt in the middle of the track, with a single CLAP pass. Nothing is
+        stored in the embedding index; the full analysis replaces every field.
+        Blocking; runs inside an AnalysisEngine preview worker.
+        """
+        sr = CLAP_SAMPLE_RATE
+        # Intros are a poor sample of tempo and key; seek past them when the length is known
+        cached = PcmCache.get(track.content_hash, sr)
+        if cached is not None:
+            duration = len(cached) / sr
+            offset = max(0.0, (duration - PREVIEW_SECONDS) / 2)
+            y = cached[int(offset * sr):int((offset + PREVIEW_SECONDS) * sr)]
+        else:
+            duration = probe_duration(track.filepath)
+            offset = max(0.0, (duration - PREVIEW_SECONDS) / 2) if duration else 0.0
+            with span("decode"):
+                y, _ = librosa.load(track.filepath, sr=sr, offset=offset, duration=PREVIEW_SECONDS)
+        with span("resample"):
+            y_dsp = librosa.resample(y, orig_sr=sr, target_sr=DSP_SAMPLE_RATE)
+        stats = extract_features(y_dsp, DSP_SAMPLE_RATE)
+
+        genres = []
+        model, processor = AnalysisService.get_clap_model()
+        if model and processor:
+            try:
+                embed = ClapInferenceWorker.instance(model, processor).submit(y, sr).result()[0]
+                tags = AnalysisService.tag_embeddings((embed / embed.norm()).unsqueeze(0))[0]
+                genres = list(dict.fromkeys(tags["genres"]))[:THRESHOLDS["max_genres"]]
+            except Exception as e:
+                # BPM and key are still worth showing
+                print(f"CLAP Preview Error: {e}")
+
+        track.analysis = AnalysisResult(
+            bpm=stats["bpm"],
+            bpm_confidence=stats["bpm_confidence"],
+            key_key=stats["key"],
+            key_scale=stats["key_scale"],
+            loudness=0,
+        )
+        track.final_bpm = stats["bpm"]
+        track.final_key = stats["key"]
+        track.suggested_genres = genres
+        track.provenance = {"bpm": "preview", "key": "preview", "genres": "preview"}
+        if duration:
+            track.duration = duration
+            track.provenance["duration"] = "preview"
+        track.status = "preview"
+        return track
+
     @staticmethod
-    async def analyze_track(track: Track):
+    def analyze_track_sync(track: Track) -> Track:
         """
         Zero-Shot Audio Analysis using LAION-CLAP
         Matches audio against natural language descriptions.
+        Blocking; runs inside an AnalysisEngine worker. Stage timings are
+        recorded on track.diagnostics.
         """
+        with recording() as spans:
+            track = AnalysisService._analyze(track)
+        track.diagnostics = AnalysisDiagnostics(
+            stages={k: round(v, 6) for k, v in spans.stages.items()},
+            counts=spans.counts,
+            total_seconds=round(spans.elapsed(), 6),
+            worker_pid=os.getpid(),
+        )
+        return track
+
+    @staticmethod
+    def _analyze(track: Track) -> Track:
         try:
             print(f"Starting CLAP analysis for: {track.filename}")
             
             # --- 1. BASIC FEATURES (Librosa) ---
-            # Load with librosa for signal stats
-            y, sr = librosa.load(track.filepath, sr=48000) # CLAP uses 48k usually, or processor handles it
-            duration = librosa.get_duration(y=y, sr=sr)
+            sr = CLAP_SAMPLE_RATE
+            report_stage(track.id, "decoding", 0.05)
+            duration = probe_duration(track.filepath)
             
-            # BPM & Key
-            onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-            tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr)
-            bpm = float(np.atleast_1d(tempo)[0])
+            if duration is not None and duration > STREAMING_THRESHOLD_SECONDS:
+                # Long file: block-wise DSP, and CLAP only sees a few fixed windows
+                print(f"Streaming analysis ({duration:.0f}s, {CLAP_WINDOW_COUNT} CLAP windows)")
+                report_stage(track.id, "features", 0.1)
+                stats = stream_features(track.filepath, STREAM_BLOCK_FRAMES)
+                clap_audio = load_windows(track.filepath, duration, CLAP_WINDOW_COUNT, CLAP_WINDOW_SECONDS, sr)
+            else:
+                # Decode once: 48k for CLAP, resampled copy for the DSP features
+                y, y_dsp = decode(track.filepath, sr, track.content_hash)
+                duration = librosa.get_duration(y=y, sr=sr)
+                report_stage(track.id, "features", 0.3)
+                stats = extract_features(y_dsp, DSP_SAMPLE_RATE)
+                clap_audio = [y]
             
-            chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-            key_idx = np.argmax(np.mean(chroma, axis=1))
-            keys = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-            detected_key = keys[key_idx]
-            
-            # Spectral/Dynamics (Librosa - Keep basic stats but replace Energy/Dance for final output)
-            spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-            brightness = float(np.mean(spectral_centroid))
+            bpm = stats["bpm"]
+            detected_key = stats["key"]
+            brightness = stats["brightness"]
             
             # --- 2. CLAP ZERO-SHOT CLASSIFICATION ---
-            clap_genres = []
-            clap_moods = []
-            clap_instruments = {}
+            # AI metrics default to 0.5 (should not happen if CLAP loads)
+            tags = {"genres": [], "moods": [], "instruments": {}, "styles": [], "energy": 0.5, "danceability": 0.5}
             
+            report_stage(track.id, "embedding", 0.6)
             model, processor = AnalysisService.get_clap_model()
             
             if model and processor:
                 try:
-                    # DEFINING PROMPTS
-                    # The power of CLAP: We simply describe what we are looking for.
-                    
-                    # Genre Prompts (Text Candidates)
-                    # We map the "Prompt" -> "Display Tag"
-                    genre_prompts = {
-                        "Hip Hop": ["A hip hop song", "A rap song", "Old school hip hop beat", "Modern hip hop"],
-                        "Trap": ["A trap music beat", "Trap music with 808s", "A heavy trap banger"],
-                        "Pop": ["A pop song", "Modern pop music", "A catchy pop track"],
-                        "R&B": ["R&B music", "A smooth R&B song", "Soulful R&B"],
-                        "Rock": ["A rock song", "Electric guitar rock music", "Hard rock"],
-                        "Electronic": ["Electronic music", "EDM track", "Synthesizer music"],
-                        "Techno": ["Techno music", "Four on the floor techno"],
-                        "House": ["House music", "A house music beat"],
-                        "Lofi": ["Lofi hip hop", "Chill lofi beat", "Relaxing lofi music"],
-                        "Dark Trap": ["Dark trap music", "Ominous trap beat", "Scary trap music"],
-                        "Drill": ["Drill music", "UK Drill beat", "Aggressive drill"],
-                        "Alternative": ["Alternative music", "Indie alternative"],
-                        "Jazz": ["Jazz music", "A jazz track"],
-                        "Classical": ["Classical music", "Orchestral music"],
-                        "Reggae": ["Reggae music", "Dub reggae"],
-                        "Metal": ["Heavy metal", "Death metal"],
-                        "Country": ["Country music"],
-                        "Ambient": ["Ambient music", "Atmospheric soundscape"]
-                    }
-                    
-                    # Flatten prompts for inference
-                    all_texts = []
-                    text_map = [] # Index -> (Genre, SpecificPrompt)
-                    
-                    for genre, variations in genre_prompts.items():
-                        for v in variations:
-                            all_texts.append(v)
-                            text_map.append(genre)
-
-                    # Mood Prompts
-                    mood_prompts = [
-                        "Happy", "Sad", "Dark", "Bright", "Chill", "Aggressive", 
-                        "Energetic", "Relaxing", "Tense", "Melancholic", "Uplifting", 
-                        "Romantic", "Eerie", "Sentimental", "Groovy", "Dreamy"
-                    ]
-                    # Convert moods to sentences for better CLAP accuracy
-                    mood_texts = [f"A {m.lower()} song" for m in mood_prompts]
-                    
-                    # Instrument Prompts
-                    inst_prompts = ["Piano", "Guitar", "Drums", "Bass", "Synthesizer", "Violin", "Saxophone", "808 Bass"]
-                    inst_texts = [f"The sound of {i.lower()}" for i in inst_prompts]
-
                     # --- INFERENCE ---
-                    # We process inputs. CLAP handles audio resampling internally via processor if I passed raw bytes,
-                    # but since I have 'y' at 48k (or whatever librosa loaded), I should ensure it matches or let processor handle it.
-                    # Verify processor sampling rate. Usually 48000.
-                    
-                    # 1. Genres
-                    inputs = processor(text=all_texts, audios=y, return_tensors="pt", sampling_rate=sr, padding=True)
-                    with torch.no_grad():
-                        outputs = model(**inputs)
-                    
-                    # Get similarity scores (logits_per_audio)
-                    logits = outputs.logits_per_audio # [1, num_texts]
-                    probs = logits.softmax(dim=-1)
-                    
-                    # Aggregate scores by Genre (Max pooling across variations)
-                    genre_scores = {}
-                    for idx, score in enumerate(probs[0]):
-                        target_genre = text_map[idx]
-                        current = genre_scores.get(target_genre, 0.0)
-                        genre_scores[target_genre] = max(current, float(score))
-                        
-                    # Filter top genres
-                    sorted_genres = sorted(genre_scores.items(), key=lambda x: x[1], reverse=True)
-                    # CLAP is very confident, so we take top 3 distinct
-                    for g, s in sorted_genres[:5]:
-                        if s > 0.01: # Low threshold because softmax distributes across many prompts
-                            clap_genres.append(g)
-
-                    # 2. Moods
-                    inputs_m = processor(text=mood_texts, audios=y, return_tensors="pt", sampling_rate=sr, padding=True)
-                    with torch.no_grad():
-                        outputs_m = model(**inputs_m)
-                    probs_m = outputs_m.logits_per_audio.softmax(dim=-1)
-                    
-                    sorted_moods = []
-                    for idx, score in enumerate(probs_m[0]):
-                        sorted_moods.append((mood_prompts[idx], float(score)))
-                    sorted_moods.sort(key=lambda x: x[1], reverse=True)
-                    
-                    for m, s in sorted_moods[:5]:
-                        clap_moods.append(m)
-
-                    # 3. Instruments
-                    inputs_i = processor(text=inst_texts, audios=y, return_tensors="pt", sampling_rate=sr, padding=True)
-                    with torch.no_grad():
-                        outputs_i = model(**inputs_i)
-                    probs_i = outputs_i.logits_per_audio.softmax(dim=-1)
-                    
-                    for idx, score in enumerate(probs_i[0]):
-                        if score > 0.05:
-                            clap_instruments[inst_prompts[idx]] = round(float(score), 3)
-
-                    # 4. ENERGY & DANCEABILITY (AI-Based)
-                    # Instead of RMS/PLP, we ask the AI.
-                    metric_prompts = [
-                        "High energy music", "Low energy music",
-                        "Danceable music", "Not danceable music"
-                    ]
-                    inputs_met = processor(text=metric_prompts, audios=y, return_tensors="pt", sampling_rate=sr, padding=True)
-                    with torch.no_grad():
-                        outputs_met = model(**inputs_met)
-                    probs_met = outputs_met.logits_per_audio.softmax(dim=-1) # [1, 4]
-                    
-                    # Energy Score: High vs Low
-                    p_high = float(probs_met[0][0])
-                    p_low = float(probs_met[0][1])
-                    ai_energy = p_high / (p_high + p_low + 1e-6) # Normalize relative to the pair
-                    
-                    # Danceability Score: Danceable vs Not
-                    p_dance = float(probs_met[0][2])
-                    p_no_dance = float(probs_met[0][3])
-                    ai_danceability = p_dance / (p_dance + p_no_dance + 1e-6)
-
-                    # FUSION LOGIC (Mood + Genre)
-                    # Example: "Dark" + "Trap" -> "Dark Trap"
-                    # Only if they aren't already explicit genres
-                    top_genre = clap_genres[0] if clap_genres else ""
-                    top_mood = clap_moods[0] if clap_moods else ""
-                    
-                    fusion = f"{top_mood} {top_genre}"
-                    # Check if this fusion already exists as a main genre (e.g. "Dark Trap" is in our prompt list)
-                    # If it's a novel combination, add it.
-                    if top_genre and top_mood:
-                        clap_genres.insert(0, fusion)
+                    # One audio embedding per clip (the whole track, or each window of a
+                    # long one); the audio encoder runs in the shared worker so concurrent
+                    # tracks and windows batch together.
+                    worker = ClapInferenceWorker.instance(model, processor)
+                    futures = [worker.submit(clip, sr) for clip in clap_audio]
+                    embeds = []
+                    for future in futures:
+                        # Includes time queued behind other tracks' clips in the shared batch
+                        with span("clap_inference"):
+                            embeds.append(future.result())
+                    # Windows are averaged into one track embedding. It is stored in the
+                    # search index, and tags come from it alone, so a re-score from the
+                    # index gives the same tags as a full analysis.
+                    track_embed = torch.cat(embeds).mean(dim=0)
+                    track_embed = track_embed / track_embed.norm()
+                    track.embedding = track_embed.tolist()
+                    report_stage(track.id, "tagging", 0.9)
+                    tags = AnalysisService.tag_embeddings(track_embed.unsqueeze(0))[0]
 
                 except Exception as e:
                     print(f"CLAP Inference Error: {e}")
@@ -201,42 +302,27 @@ class AnalysisService:
                     traceback.print_exc()
 
             # Fallbacks
-            if not clap_genres:
-                clap_genres = ["Unknown"]
-            
-            # Use AI metrics if available, otherwise 0.5 default (should not happen if CLAP loads)
-            final_energy = ai_energy if 'ai_energy' in locals() else 0.5
-            final_dance = ai_danceability if 'ai_danceability' in locals() else 0.5
+            if not tags["genres"]:
+                tags["genres"] = ["Unknown"]
 
             # 3. CONSTRUCT RESULT
             # User requested removal of valence, brightness, warmth, tension.
-            model_tags = {
-                "energy": round(final_energy * 10, 1), 
-                "danceability": round(final_dance, 2),
-                "instruments": clap_instruments,
-                "ai_moods": {m: 0.9 for m in clap_moods} 
-            }
-
-            analysis = AnalysisResult(
+            track.analysis = AnalysisResult(
                 bpm=bpm,
-                bpm_confidence=0.9,
+                bpm_confidence=stats["bpm_confidence"],
                 key_key=detected_key,
-                key_scale="Major", 
-                energy=min(final_energy * 10, 10.0),
-                danceability=min(final_dance, 1.0),
+                key_scale=stats["key_scale"],
                 loudness=0,
-                model_tags=model_tags
             )
+            # Suggestions, energy/danceability and model_tags
+            apply_tags(track, tags)
             
-            track.analysis = analysis
             track.status = "complete"
             track.duration = duration
+            track.provenance = {field: "full" for field in ANALYZED_FIELDS}
             
             track.final_bpm = bpm
             track.final_key = detected_key
-            # Deduplicate and limit
-            track.suggested_genres = list(dict.fromkeys(clap_genres))[:5]
-            track.suggested_moods = list(dict.fromkeys(clap_moods))[:5]
             
             return track
             
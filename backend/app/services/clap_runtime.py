@@ -0,0 +1,193 @@
+"""
+CLAP inference backends for CPU hosts.
+Every backend returns an object with the parts of ClapModel the pipeline uses
+(get_audio_features, get_text_features, logit_scale_a), so the prompt cache and
+the batching worker do not care which one is loaded:
+- "torch":     the fp32 transformers ClapModel
+- "int8":      the same model with nn.Linear layers dynamically quantized to int8
+- "onnx":      audio and text encoders exported to ONNX, run by ONNX Runtime
+- "onnx-int8": the ONNX encoders with int8 dynamic quantization
+The ONNX files are exported once per model into ONNX_CACHE_DIR. Every pool
+worker loads the model at startup, so export and quantization run under a file
+lock: the first worker writes the files and the others wait and reuse them.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import torch
+
+from app.config import ANALYSIS_WORKERS, CLAP_INTER_OP_THREADS, CLAP_INTRA_OP_THREADS, ONNX_CACHE_DIR
+from app.services.file_lock import FileLock
+
+BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+
+ONNX_OPSET = 17
+
+# (intra, inter) op threads for this process, set once by configure_threads()
+_threads: Optional[Tuple[int, int]] = None
+
+
+def configure_threads(intra: int = 0, inter: int = 0) -> Tuple[int, int]:
+    """
+    Apply thread settings to torch and remember them for ONNX Runtime sessions.
+    0 falls back to the config values; intra-op then defaults to an even share of
+    the cores across ANALYSIS_WORKERS so pool workers do not oversubscribe the CPU.
+    torch only accepts the inter-op setting before its first parallel op, so
+    call this before loading the model.
+    """
+    global _threads
+    if _threads is not None:
+        return _threads
+    intra = intra or CLAP_INTRA_OP_THREADS or max(1, (os.cpu_count() or 1) // max(1, ANALYSIS_WORKERS))
+    inter = inter or CLAP_INTER_OP_THREADS or 1
+    torch.set_num_threads(intra)
+    try:
+        torch.set_num_interop_threads(inter)
+    except RuntimeError:
+        # Already started; keep whatever torch is using
+        inter = torch.get_num_interop_threads()
+    _threads = (intra, inter)
+    return _threads
+
+
+def load_clap(model_name: str, backend: str):
+    """Return (model, processor) for `backend`."""
+    from transformers import ClapModel, ClapProcessor
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown CLAP_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+    configure_threads()
+    processor = ClapProcessor.from_pretrained(model_name)
+
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxClapModel.load(model_name, processor, quantized=backend == "onnx-int8"), processor
+
+    model = ClapModel.from_pretrained(model_name).eval()
+    if backend == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model, processor
+
+
+# --- ONNX ---
+
+class _AudioEncoder(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_features, is_longer):
+        return _projected(self.model.get_audio_features(input_features=input_features, is_longer=is_longer))
+
+
+class _TextEncoder(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return _projected(self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask))
+
+
+def _projected(output) -> torch.Tensor:
+    # transformers 5.x wraps the projection in a model output
+    return output if isinstance(output, torch.Tensor) else output.pooler_output
+
+
+class OnnxClapModel:
+    """ClapModel stand-in backed by two ONNX Runtime sessions."""
+
+    def __init__(self, audio_path: Path, text_path: Path, logit_scale_a: float):
+        import onnxruntime as ort
+
+        intra, inter = configure_threads()
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra
+        options.inter_op_num_threads = inter
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = ["CPUExecutionProvider"]
+        self.audio_session = ort.InferenceSession(str(audio_path), options, providers=providers)
+        self.text_session = ort.InferenceSession(str(text_path), options, providers=providers)
+        self.logit_scale_a = torch.tensor(logit_scale_a)
+
+    @staticmethod
+    def model_dir(model_name: str) -> Path:
+        return ONNX_CACHE_DIR / model_name.replace("/", "__")
+
+    @classmethod
+    def load(cls, model_name: str, processor, quantized: bool = False) -> "OnnxClapModel":
+        out_dir = cls.model_dir(model_name)
+        meta_path = out_dir / "meta.json"
+        if not meta_path.exists() or quantized:
+            # Checked again under the lock: another worker may have exported meanwhile
+            with FileLock(out_dir.parent / f"{out_dir.name}.lock"):
+                if not meta_path.exists():
+                    cls.export(model_name, processor, out_dir)
+                if quantized:
+                    cls.quantize(out_dir)
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        suffix = ".int8.onnx" if quantized else ".onnx"
+        return cls(out_dir / f"audio{suffix}", out_dir / f"text{suffix}", meta["logit_scale_a"])
+
+    @staticmethod
+    def export(model_name: str, processor, out_dir: Path):
+        """Trace both encoders of the fp32 model to ONNX (one-off, takes a minute)."""
+        import numpy as np
+        from transformers import ClapModel
+
+        print(f"[ONNX] Exporting {model_name} encoders to {out_dir}")
+        os.makedirs(out_dir, exist_ok=True)
+        model = ClapModel.from_pretrained(model_name).eval()
+
+        audio_inputs = processor(audios=[np.zeros(48000, dtype=np.float32)] * 2, sampling_rate=48000, return_tensors="pt")
+        text_inputs = processor(text=["a song", "a short example prompt"], return_tensors="pt", padding=True)
+
+        exports = (
+            ("audio", _AudioEncoder(model), (audio_inputs["input_features"], audio_inputs["is_longer"]),
+             ["input_features", "is_longer"], {"input_features": {0: "batch"}, "is_longer": {0: "batch"}}),
+            ("text", _TextEncoder(model), (text_inputs["input_ids"], text_inputs["attention_mask"]),
+             ["input_ids", "attention_mask"], {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"}}),
+        )
+        for name, module, args, input_names, dynamic_axes in exports:
+            tmp_path = out_dir / f"{name}.onnx.{os.getpid()}.tmp"
+            with torch.no_grad():
+                torch.onnx.export(
+                    module, args, str(tmp_path),
+                    input_names=input_names,
+                    output_names=["embeds"],
+                    dynamic_axes={**dynamic_axes, "embeds": {0: "batch"}},
+                    opset_version=ONNX_OPSET,
+                )
+            os.replace(tmp_path, out_dir / f"{name}.onnx")
+
+        # Written last (and renamed into place): its presence marks a complete export
+        tmp_path = out_dir / f"meta.json.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": model_name, "opset": ONNX_OPSET, "logit_scale_a": float(model.logit_scale_a.item())}, f)
+        os.replace(tmp_path, out_dir / "meta.json")
+
+    @staticmethod
+    def quantize(out_dir: Path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        for name in ("audio", "text"):
+            target = out_dir / f"{name}.int8.onnx"
+            if not target.exists():
+                print(f"[ONNX] Quantizing {name} encoder to int8")
+                tmp_path = out_dir / f"{name}.int8.onnx.{os.getpid()}.tmp"
+                quantize_dynamic(str(out_dir / f"{name}.onnx"), str(tmp_path), weight_type=QuantType.QInt8)
+                os.replace(tmp_path, target)
+
+    @staticmethod
+    def _feeds(session, inputs: Dict) -> Dict:
+        names = {i.name for i in session.get_inputs()}
+        return {k: v.numpy() for k, v in inputs.items() if k in names}
+
+    def get_audio_features(self, **inputs) -> torch.Tensor:
+        return torch.from_numpy(self.audio_session.run(None, self._feeds(self.audio_session, inputs))[0])
+
+    def get_text_features(self, **inputs) -> torch.Tensor:
+        return torch.from_numpy(self.text_session.run(None, self._feeds(self.text_session, inputs))[0])
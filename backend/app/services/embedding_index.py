@@ -0,0 +1,198 @@
+"""
+Vector index of CLAP audio embeddings for similar-track and text search.
+Layout on disk: EMBEDDING_INDEX_DIR/<MODEL_ID>/ (one index per model and
+inference backend, whose embeddings differ slightly and must not be mixed)
+- vectors.npy: float16 [capacity, dim] matrix, memory-mapped; row i is one track
+- ids.log:     append-only "row<TAB>track_id" lines (later lines win)
+A query is one normalized vector; scoring is one matmul over the library plus
+an argpartition top-k, so nothing is decoded or re-analyzed. Searching uses a
+float32 working copy of the matrix (numpy converts float16 slowly), built on
+the first query and rebuilt only when another process changed the file.
+Writers append under a file lock; readers in other processes (API vs worker
+role) notice the change and pick up the new rows on their next query.
+"""
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import EMBEDDING_INDEX_DIR
+from app.services.file_lock import FileLock
+from app.services.vocabulary import MODEL_ID
+
+# Rows allocated up front, doubled whenever the matrix is full
+INITIAL_CAPACITY = 1024
+
+
+class EmbeddingIndex:
+    _instance: Optional["EmbeddingIndex"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.vectors_path = directory / "vectors.npy"
+        self.log_path = directory / "ids.log"
+        self.lock_path = directory / "ids.lock"
+        self._lock = threading.RLock()
+        self._ids: List[str] = []          # row -> track id ("" = unassigned)
+        self._rows: Dict[str, int] = {}    # track id -> row
+        self._log_offset = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_key: Optional[Tuple[int, int, int]] = None  # (inode, size, mtime) of the mapped file
+        self._dense: Optional[np.ndarray] = None  # float32 copy of _matrix for searching
+
+    @classmethod
+    def instance(cls) -> "EmbeddingIndex":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(EMBEDDING_INDEX_DIR / MODEL_ID.replace("/", "__"))
+            return cls._instance
+
+    # --- Reading ---
+
+    def _refresh(self):
+        """Replay new log lines and remap the matrix if another process grew it."""
+        size = self.log_path.stat().st_size if self.log_path.exists() else 0
+        if size > self._log_offset:
+            with open(self.log_path, "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+            # Only whole lines; a writer may be mid-append
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].decode("utf-8").splitlines():
+                row, track_id = line.split("\t", 1)
+                self._assign(int(row), track_id)
+            self._log_offset += end
+        key = self._file_key()
+        if key is not None and key != self._matrix_key:
+            self._matrix = np.load(self.vectors_path, mmap_mode="r+")
+            self._matrix_key = key
+            self._dense = None
+
+    def _file_key(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = self.vectors_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _assign(self, row: int, track_id: str):
+        while len(self._ids) <= row:
+            self._ids.append("")
+        previous = self._ids[row]
+        if previous and self._rows.get(previous) == row:
+            del self._rows[previous]
+        self._ids[row] = track_id
+        if track_id:
+            self._rows[track_id] = row
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._rows)
+
+    def get(self, track_id: str) -> Optional[np.ndarray]:
+        with self._lock:
+            self._refresh()
+            row = self._rows.get(track_id)
+            if row is None or self._matrix is None:
+                return None
+            return np.asarray(self._matrix[row], dtype=np.float32)
+
+    def get_many(self, track_ids: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+        """The indexed subset of track_ids and their embeddings as a float32 [n, dim] matrix."""
+        with self._lock:
+            self._refresh()
+            found = [t for t in track_ids if t in self._rows] if self._matrix is not None else []
+            if not found:
+                return [], np.zeros((0, self._matrix.shape[1] if self._matrix is not None else 0), dtype=np.float32)
+            rows = [self._rows[t] for t in found]
+            return found, np.asarray(self._matrix[rows], dtype=np.float32)
+
+    def search(self, query: Sequence[float], limit: int = 10, exclude: Sequence[str] = ()) -> List[Tuple[str, float]]:
+        """Top `limit` (track_id, cosine similarity) pairs for a query vector."""
+        with self._lock:
+            self._refresh()
+            if self._matrix is None or not self._rows:
+                return []
+            if self._dense is None:
+                self._dense = np.asarray(self._matrix, dtype=np.float32)
+            q = _normalize(np.asarray(query, dtype=np.float32))
+            rows = min(len(self._ids), len(self._dense))
+            skip = {self._rows[t] for t in exclude if t in self._rows}
+
+            scores = self._dense[:rows] @ q
+            k = min(limit + len(skip), rows)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+
+            results = []
+            for row in top.tolist():
+                track_id = self._ids[row]
+                # Rows never logged (a writer died after growing the matrix) stay unassigned
+                if not track_id or row in skip:
+                    continue
+                results.append((track_id, round(float(scores[row]), 4)))
+                if len(results) >= limit:
+                    break
+            return results
+
+    # --- Writing ---
+
+    def add(self, track_id: str, embedding: Sequence[float]):
+        """Store (or replace) a track's embedding."""
+        vector = _normalize(np.asarray(embedding, dtype=np.float32))
+        with self._lock, FileLock(self.lock_path):
+            self._refresh()
+            row = self._rows.get(track_id)
+            if row is None:
+                row = len(self._ids)
+            self._ensure_capacity(row + 1, len(vector))
+            stored = vector.astype(np.float16)
+            self._matrix[row] = stored
+            self._matrix.flush()
+            if self._dense is not None:
+                self._dense[row] = stored
+            # Our own write must not look like another process's change
+            self._matrix_key = self._file_key()
+            if self._rows.get(track_id) != row:
+                self._append_log(row, track_id)
+
+    def _ensure_capacity(self, rows: int, dim: int):
+        if self._matrix is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._write_matrix(np.zeros((max(INITIAL_CAPACITY, rows), dim), dtype=np.float16))
+            return
+        if self._matrix.shape[1] != dim:
+            raise ValueError(f"Embedding has {dim} dimensions, index stores {self._matrix.shape[1]}")
+        if rows > self._matrix.shape[0]:
+            capacity = self._matrix.shape[0]
+            while capacity < rows:
+                capacity *= 2
+            grown = np.zeros((capacity, dim), dtype=np.float16)
+            grown[:self._matrix.shape[0]] = self._matrix
+            self._write_matrix(grown)
+
+    def _write_matrix(self, matrix: np.ndarray):
+        # Written aside and swapped in, so readers keep a consistent mapping
+        tmp_path = self.vectors_path.with_suffix(".tmp.npy")
+        np.save(tmp_path, matrix)
+        os.replace(tmp_path, self.vectors_path)
+        self._matrix = None
+        self._matrix_key = None
+        self._refresh()
+
+    def _append_log(self, row: int, track_id: str):
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(f"{row}\t{track_id}\n")
+        self._refresh()
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    if vector.ndim != 1:
+        vector = vector.reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
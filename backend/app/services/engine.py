@@ -0,0 +1,251 @@
+"""
+Executor-backed analysis engine.
+librosa DSP and torch inference are CPU-bound and synchronous, so they run in
+a worker pool instead of on the asyncio event loop. Each worker process loads
+its own CLAP model once; the thread pool variant shares a single model and is
+meant for hosts that cannot afford one model copy per core.
+Stage progress reported inside workers is forwarded to the EventBus; process
+workers send it back over a multiprocessing queue drained by a thread here.
+"""
+import asyncio
+import importlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+from app.config import (
+    ANALYSIS_EXECUTOR, ANALYSIS_WORKERS, CLAP_INTER_OP_THREADS, CLAP_INTRA_OP_THREADS, MODEL_WARMUP,
+    PREVIEW_ENABLED, PREVIEW_WORKERS,
+)
+from app.models.schemas import Track
+from app.services.events import EventBus, set_stage_sink
+from app.services.startup import HEAVY_MODULES
+
+# Startup report of the worker (this process): import, model load and warm-up seconds
+_worker_report: Dict[str, object] = {}
+
+
+def _prepare_worker(warm_up: bool):
+    """Import the ML stack and load (optionally warm up) the model, timing each step."""
+    if _worker_report:
+        return
+    report: Dict[str, object] = {"pid": os.getpid(), "imports": {}}
+    try:
+        for module in HEAVY_MODULES + ("app.services.analysis",):
+            start = time.perf_counter()
+            importlib.import_module(module)
+            report["imports"][module] = round(time.perf_counter() - start, 3)
+
+        from app.services.analysis import AnalysisService
+        start = time.perf_counter()
+        if warm_up:
+            AnalysisService.warm_up()
+        else:
+            AnalysisService.get_clap_model()
+        report["model_seconds"] = round(time.perf_counter() - start, 3)
+    except Exception as e:
+        # Jobs still run (and fail or degrade on their own); readiness reports the error
+        print(f"[ENGINE] Worker {os.getpid()} failed to prepare: {e}")
+        report["error"] = str(e)
+    _worker_report.update(report)
+
+
+def _worker_status(hold_seconds: float = 0.0) -> Dict[str, object]:
+    # Holding the call briefly makes concurrent pings land on different workers
+    time.sleep(hold_seconds)
+    return dict(_worker_report)
+
+
+def _prepare_and_report(warm_up: bool) -> Dict[str, object]:
+    _prepare_worker(warm_up)
+    return _worker_status()
+
+
+def _init_worker(intra_threads: int, inter_threads: int, progress_queue=None):
+    """Per-process initializer: split cores between workers and load the model."""
+    from app.services.clap_runtime import configure_threads
+
+    if progress_queue is not None:
+        set_stage_sink(lambda track_id, stage, progress: progress_queue.put_nowait((track_id, stage, progress)))
+    configure_threads(intra_threads, inter_threads)
+    _prepare_worker(MODEL_WARMUP)
+
+
+def _drain_progress(progress_queue):
+    """Forward stage reports from worker processes until the None sentinel."""
+    while True:
+        item = progress_queue.get()
+        if item is None:
+            return
+        EventBus.publish_stage(*item)
+
+
+def _analyze_in_worker(track: Track, profile: bool = False) -> Track:
+    from app.services.inference_worker import ClapInferenceWorker
+    with ClapInferenceWorker.caller():
+        if profile:
+            from app.services.profiling import profile_analysis
+            return profile_analysis(track)
+        from app.services.analysis import AnalysisService
+        return AnalysisService.analyze_track_sync(track)
+
+
+def _preview_in_worker(track: Track) -> Track:
+    from app.services.analysis import AnalysisService
+    from app.services.inference_worker import ClapInferenceWorker
+    with ClapInferenceWorker.caller():
+        return AnalysisService.preview_track_sync(track)
+
+
+def _embed_text_in_worker(text: str) -> List[float]:
+    from app.services.analysis import AnalysisService
+    return AnalysisService.embed_text(text)
+
+
+def _tag_in_worker(embeddings) -> List[Dict[str, object]]:
+    from app.services.analysis import AnalysisService
+    return AnalysisService.tag_embeddings(embeddings)
+
+
+class AnalysisEngine:
+    """
+    One worker pool per tier: "full" (ANALYSIS_WORKERS) for complete analyses
+    and "preview" (PREVIEW_WORKERS) for quick excerpt previews, so a backlog of
+    full analyses never delays a preview.
+    """
+    _executors: Dict[str, Executor] = {}
+    _progress_queue = None
+    _progress_thread: Optional[threading.Thread] = None
+    mode: str = ""
+
+    @staticmethod
+    def tiers() -> List[str]:
+        return ["full", "preview"] if PREVIEW_ENABLED else ["full"]
+
+    @staticmethod
+    def pool_size(tier: str) -> int:
+        return max(1, PREVIEW_WORKERS if tier == "preview" else ANALYSIS_WORKERS)
+
+    @classmethod
+    def _progress_channel(cls, ctx):
+        """One queue + drain thread per engine, shared by the pools and reused when a broken pool is replaced."""
+        if cls._progress_queue is None:
+            cls._progress_queue = ctx.Queue()
+            cls._progress_thread = threading.Thread(
+                target=_drain_progress, args=(cls._progress_queue,), name="analysis-progress", daemon=True
+            )
+            cls._progress_thread.start()
+        return cls._progress_queue
+
+    @classmethod
+    def get_executor(cls, tier: str = "full") -> Executor:
+        executor = cls._executors.get(tier)
+        if executor is None:
+            workers = cls.pool_size(tier)
+            if ANALYSIS_EXECUTOR == "process" and cls.mode != "thread":
+                try:
+                    # Cores are split between the full-analysis workers; preview workers use the same share
+                    intra_threads = CLAP_INTRA_OP_THREADS or max(1, (os.cpu_count() or 1) // cls.pool_size("full"))
+                    # spawn: torch and forked interpreters do not mix well
+                    ctx = multiprocessing.get_context("spawn")
+                    executor = ProcessPoolExecutor(
+                        max_workers=workers,
+                        mp_context=ctx,
+                        initializer=_init_worker,
+                        initargs=(intra_threads, CLAP_INTER_OP_THREADS, cls._progress_channel(ctx)),
+                    )
+                    cls.mode = "process"
+                except (OSError, NotImplementedError) as e:
+                    # e.g. no /dev/shm on AWS Lambda
+                    print(f"[ENGINE] Process pool unavailable ({e}), falling back to threads")
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"analysis-{tier}")
+                cls.mode = "thread"
+                # Same process: report straight to the bus
+                set_stage_sink(EventBus.publish_stage)
+            cls._executors[tier] = executor
+            print(f"[ENGINE] Analysis engine started: {cls.mode} pool with {workers} {tier} worker(s)")
+        return executor
+
+    @classmethod
+    async def run(cls, track: Track, profile: bool = False) -> Track:
+        """Analyze a track off the event loop and return the updated copy."""
+        return await cls._submit("full", _analyze_in_worker, track, profile)
+
+    @classmethod
+    async def preview(cls, track: Track) -> Track:
+        """Quick excerpt analysis on the preview pool; returns the updated copy."""
+        return await cls._submit("preview", _preview_in_worker, track)
+
+    @classmethod
+    async def embed_text(cls, text: str) -> List[float]:
+        """Normalized CLAP text embedding, computed by a worker that has the model loaded."""
+        # Interactive, so it takes the low-latency pool when there is one
+        return await cls._submit(cls.tiers()[-1], _embed_text_in_worker, text)
+
+    @classmethod
+    async def tag_embeddings(cls, embeddings) -> List[Dict[str, object]]:
+        """Tags for a [num_tracks, dim] matrix of stored track embeddings."""
+        return await cls._submit("full", _tag_in_worker, embeddings)
+
+    @classmethod
+    async def _submit(cls, tier: str, fn, *args):
+        loop = asyncio.get_running_loop()
+        executor = cls.get_executor(tier)
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # A worker died (OOM, crash in native code, failed initializer). The pool
+            # is unusable from here on, so drop it and let the next job start a new one.
+            if cls._executors.get(tier) is executor:
+                print(f"[ENGINE] {tier} worker process died, restarting pool")
+                cls.shutdown(tier)
+            raise
+
+    @classmethod
+    async def warm_up(cls) -> List[Dict[str, object]]:
+        """Start every worker of every pool (each loads and warms its model) and collect their reports."""
+        reports = []
+        for tier in cls.tiers():
+            reports += [{**report, "tier": tier} for report in await cls._warm_up_pool(tier)]
+        return reports
+
+    @classmethod
+    async def _warm_up_pool(cls, tier: str) -> List[Dict[str, object]]:
+        loop = asyncio.get_running_loop()
+        executor = cls.get_executor(tier)
+        if cls.mode != "process":
+            return [await loop.run_in_executor(executor, _prepare_and_report, True)]
+
+        # Workers prepare in their initializer. Ping until each one has answered,
+        # which means every process finished loading.
+        workers = cls.pool_size(tier)
+        seen: Dict[int, Dict[str, object]] = {}
+        while len(seen) < workers:
+            reports = await asyncio.gather(*[
+                loop.run_in_executor(executor, _worker_status, 0.2) for _ in range(workers)
+            ])
+            seen.update((r["pid"], r) for r in reports)
+        return list(seen.values())
+
+    @classmethod
+    def shutdown(cls, tier: Optional[str] = None):
+        for name in [tier] if tier else list(cls._executors):
+            executor = cls._executors.pop(name, None)
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def close(cls):
+        """Shut the pools down and stop forwarding progress (application exit)."""
+        cls.shutdown()
+        if cls._progress_queue is not None:
+            cls._progress_queue.put(None)
+            cls._progress_thread.join(timeout=5)
+            cls._progress_queue.close()
+            cls._progress_queue = None
+            cls._progress_thread = None
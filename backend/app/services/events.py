@@ -0,0 +1,108 @@
+"""
+Track progress events.
+Status transitions (queued -> analyzing -> complete/failed) and analysis stage
+updates are published on EventBus and fanned out to every /events subscriber,
+so clients no longer need to poll each track.
+Analysis code calls report_stage(), which works from the API process and from
+engine worker processes (the engine forwards worker reports over a queue).
+"""
+import asyncio
+import threading
+from typing import Callable, Dict, Optional, Set
+
+# Events buffered per subscriber before a slow client starts missing updates
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+StageSink = Callable[[str, str, float], None]
+
+_stage_sink: Optional[StageSink] = None
+
+
+def set_stage_sink(sink: Optional[StageSink]):
+    """Route report_stage() calls in this process to `sink`."""
+    global _stage_sink
+    _stage_sink = sink
+
+
+def report_stage(track_id: str, stage: str, progress: float):
+    """Report analysis progress (0..1) for a track; a no-op if nobody listens."""
+    if _stage_sink is None:
+        return
+    try:
+        _stage_sink(track_id, stage, progress)
+    except Exception:
+        # Progress is best effort and must never fail an analysis
+        pass
+
+
+class EventBus:
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    _subscribers: Set[asyncio.Queue] = set()
+    # Latest stage of each in-flight track, for clients that poll instead
+    _stages: Dict[str, Dict] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def attach(cls, loop: asyncio.AbstractEventLoop):
+        """Bind to the server's event loop; publish() is a no-op until then."""
+        cls._loop = loop
+
+    @classmethod
+    def detach(cls):
+        cls._loop = None
+        cls._subscribers.clear()
+        with cls._lock:
+            cls._stages.clear()
+
+    @classmethod
+    def subscribe(cls) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        cls._subscribers.add(queue)
+        return queue
+
+    @classmethod
+    def unsubscribe(cls, queue: asyncio.Queue):
+        cls._subscribers.discard(queue)
+
+    @classmethod
+    def publish(cls, event: Dict):
+        """Thread-safe: may be called from the loop, worker threads or drain threads."""
+        loop = cls._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            cls._fan_out(event)
+        else:
+            loop.call_soon_threadsafe(cls._fan_out, event)
+
+    @classmethod
+    def _fan_out(cls, event: Dict):
+        for queue in list(cls._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow client; it can resync with GET /tracks/status
+                pass
+
+    @classmethod
+    def publish_status(cls, track_id: str, status: str):
+        if status in ("complete", "failed", "queued"):
+            with cls._lock:
+                cls._stages.pop(track_id, None)
+        cls.publish({"type": "status", "track_id": track_id, "status": status})
+
+    @classmethod
+    def publish_stage(cls, track_id: str, stage: str, progress: float):
+        entry = {"stage": stage, "progress": round(progress, 3)}
+        with cls._lock:
+            cls._stages[track_id] = entry
+        cls.publish({"type": "stage", "track_id": track_id, **entry})
+
+    @classmethod
+    def last_stage(cls, track_id: str) -> Optional[Dict]:
+        with cls._lock:
+            return cls._stages.get(track_id)
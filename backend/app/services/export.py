@@ -0,0 +1,112 @@
+"""
+Streaming export engine.
+Tracks are read page by page from the storage index and rows are yielded as
+they are produced, so memory stays flat regardless of library size.
+"""
+import csv
+import io
+import json
+from typing import Any, Dict, Iterator, List
+
+from app.config import EXPORT_PAGE_SIZE
+from app.models.schemas import ExportRequest, Track, TrackQuery
+from app.services.storage import StorageService
+
+CSV_HEADERS = ['Filename', 'BPM', 'Key', 'Genres', 'Moods', 'Styles', 'Notes']
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+class ExportService:
+    @staticmethod
+    def selection_query(request: ExportRequest) -> TrackQuery:
+        """Filter-based selections become a paged TrackQuery (oldest first, stable order)."""
+        query = TrackQuery(sort="upload_date", order="asc", limit=EXPORT_PAGE_SIZE)
+        if request.filter:
+            query = query.model_copy(update=request.filter.model_dump(exclude_none=True))
+        if request.all_complete:
+            query.status = ["complete"]
+        return query
+
+    @staticmethod
+    def iter_tracks(request: ExportRequest) -> Iterator[Track]:
+        if request.track_ids is not None:
+            ids = request.track_ids
+            for start in range(0, len(ids), EXPORT_PAGE_SIZE):
+                yield from StorageService.get_tracks(ids[start:start + EXPORT_PAGE_SIZE])
+            return
+
+        query = ExportService.selection_query(request)
+        while True:
+            tracks, next_cursor = StorageService.query_tracks(query)
+            yield from tracks
+            if not next_cursor:
+                return
+            query.cursor = next_cursor
+
+    @staticmethod
+    def row(track: Track) -> Dict[str, Any]:
+        merged = track.merged()
+        return {
+            "id": track.id,
+            "filename": track.filename,
+            "bpm": round(merged["bpm"] or 0),
+            "key": merged["key"],
+            "genres": merged["genres"],
+            "moods": merged["moods"],
+            "styles": merged["styles"],
+            "notes": merged["notes"],
+        }
+
+    @staticmethod
+    def iter_csv(tracks: Iterator[Track]) -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def flush() -> str:
+            value = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            return value
+
+        writer.writerow(CSV_HEADERS)
+        yield flush()
+        for track in tracks:
+            row = ExportService.row(track)
+            writer.writerow([
+                row["filename"],
+                row["bpm"],
+                row["key"],
+                ", ".join(row["genres"]),
+                ", ".join(row["moods"]),
+                ", ".join(row["styles"]),
+                row["notes"],
+            ])
+            yield flush()
+
+    @staticmethod
+    def iter_ndjson(tracks: Iterator[Track]) -> Iterator[str]:
+        for track in tracks:
+            yield json.dumps(ExportService.row(track), ensure_ascii=False) + "\n"
+
+    @staticmethod
+    def iter_json(tracks: Iterator[Track]) -> Iterator[str]:
+        yield "["
+        separator = ""
+        for track in tracks:
+            yield separator + json.dumps(ExportService.row(track), ensure_ascii=False)
+            separator = ","
+        yield "]"
+
+    @staticmethod
+    def stream(request: ExportRequest) -> Iterator[str]:
+        tracks = ExportService.iter_tracks(request)
+        if request.format == "ndjson":
+            return ExportService.iter_ndjson(tracks)
+        if request.format == "json":
+            return ExportService.iter_json(tracks)
+        return ExportService.iter_csv(tracks)
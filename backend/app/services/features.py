@@ -0,0 +1,222 @@
+"""
+Signal-level feature extraction (librosa).
+The file is decoded once at the CLAP rate; DSP features run on a copy
+resampled to DSP_SAMPLE_RATE and share a single STFT (onset strength,
+spectral centroid and, in "stft" chroma mode, chroma). Both signals can be
+kept in the PcmCache, so a re-analysis skips decoding and resampling.
+Includes a streaming path for long files: audio is decoded block by block and
+BPM / key / brightness are accumulated incrementally, so peak memory depends
+on the block size rather than the track length. Blocks stay at the file's own
+rate, with the STFT frame and hop scaled so each frame spans the same time as
+at DSP_SAMPLE_RATE.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+from app.config import CHROMA_MODE, DSP_SAMPLE_RATE
+from app.services.pcm_cache import PcmCache
+from app.services.timing import span
+
+KEYS = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# Krumhansl-Kessler key profiles (C major / C minor)
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+N_FFT = 2048
+HOP_LENGTH = 512
+
+
+def decode(path: str, sr: int, content_hash: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decode once at `sr` (for CLAP) and derive the DSP_SAMPLE_RATE copy from it.
+    Given the content hash, both signals are read from (or added to) the PcmCache.
+    """
+    y = PcmCache.get(content_hash, sr)
+    if y is None:
+        with span("decode"):
+            y, _ = librosa.load(path, sr=sr)
+        PcmCache.put(content_hash, sr, y)
+    if sr == DSP_SAMPLE_RATE:
+        return y, y
+    y_dsp = PcmCache.get(content_hash, DSP_SAMPLE_RATE)
+    if y_dsp is None:
+        with span("resample"):
+            y_dsp = librosa.resample(y, orig_sr=sr, target_sr=DSP_SAMPLE_RATE)
+        PcmCache.put(content_hash, DSP_SAMPLE_RATE, y_dsp)
+    return y, y_dsp
+
+
+def estimate_key(chroma_profile: np.ndarray) -> Tuple[str, str]:
+    """Best-correlating Krumhansl-Kessler profile over all 24 keys -> (key, scale)."""
+    best = (-2.0, 0, "major")
+    for shift in range(12):
+        for scale, profile in (("major", MAJOR_PROFILE), ("minor", MINOR_PROFILE)):
+            corr = np.corrcoef(chroma_profile, np.roll(profile, shift))[0, 1]
+            if np.isfinite(corr) and corr > best[0]:
+                best = (corr, shift, scale)
+    return KEYS[best[1]], best[2]
+
+
+def estimate_tempo(onset_env: np.ndarray, sr: int) -> Tuple[float, float]:
+    """
+    BPM from beat tracking plus a confidence in [0, 1]: the normalized
+    onset-envelope autocorrelation at the detected beat period.
+    """
+    tempo, _ = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=HOP_LENGTH)
+    bpm = float(np.atleast_1d(tempo)[0])
+    if bpm <= 0 or onset_env.size < 4:
+        return bpm, 0.0
+
+    ac = librosa.autocorrelate(onset_env - onset_env.mean())
+    if ac[0] <= 0:
+        return bpm, 0.0
+    ac = ac / ac[0]
+    lag = int(round(60.0 * sr / (HOP_LENGTH * bpm)))
+    if lag >= ac.size:
+        return bpm, 0.0
+    confidence = float(np.max(ac[max(lag - 1, 1):lag + 2]))
+    return bpm, float(np.clip(confidence, 0.0, 1.0))
+
+
+def _stft_features(
+    y: np.ndarray,
+    sr: int,
+    n_fft: int = N_FFT,
+    hop_length: int = HOP_LENGTH,
+    center: bool = True,
+    prev_mel: Optional[np.ndarray] = None,
+):
+    """
+    One magnitude STFT shared by onset strength, centroid and STFT chroma.
+    For uncentered blocks, `prev_mel` is the last log-mel frame of the previous
+    block, so the first onset value of this block is a real frame difference.
+    Returns (power, onset_env, centroid, last log-mel frame).
+    """
+    with span("stft"):
+        S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length, center=center))
+        power = S ** 2
+    with span("onset"):
+        mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=power, sr=sr))
+        if center:
+            onset_env = librosa.onset.onset_strength(S=mel_db, sr=sr)
+        else:
+            # Uncentered: one leading pad frame, dropped again once prev_mel stands in for it
+            first = mel_db[:, :1] if prev_mel is None else prev_mel
+            onset_env = librosa.onset.onset_strength(S=np.hstack([first, mel_db]), sr=sr, center=False)[1:]
+    with span("centroid"):
+        centroid = librosa.feature.spectral_centroid(S=S, sr=sr)[0]
+    return power, onset_env, centroid, mel_db[:, -1:]
+
+
+def extract_features(y: np.ndarray, sr: int) -> Dict[str, object]:
+    """BPM (+confidence), key (+scale) and brightness for a decoded DSP-rate signal."""
+    power, onset_env, centroid, _ = _stft_features(y, sr)
+    with span("chroma"):
+        if CHROMA_MODE == "cqt":
+            chroma = librosa.feature.chroma_cqt(y=y, sr=sr, hop_length=HOP_LENGTH)
+        else:
+            chroma = librosa.feature.chroma_stft(S=power, sr=sr, tuning=0.0)
+
+    with span("tempo"):
+        bpm, bpm_confidence = estimate_tempo(onset_env, sr)
+    with span("key"):
+        key, scale = estimate_key(chroma.mean(axis=1))
+    return {
+        "bpm": bpm,
+        "bpm_confidence": bpm_confidence,
+        "key": key,
+        "key_scale": scale,
+        "brightness": float(np.mean(centroid)),
+    }
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """Duration from the file header, or None if soundfile cannot open it (e.g. M4A)."""
+    try:
+        with span("probe"):
+            return float(sf.info(path).duration)
+    except Exception:
+        return None
+
+
+def stream_features(path: str, block_frames: int) -> Dict[str, object]:
+    """
+    BPM, key and spectral centroid computed over blocks of `block_frames` STFT
+    frames. Only the onset envelope (a few values per frame) is kept for the
+    whole track; chroma and centroid are running sums.
+    Frame and hop are scaled from DSP_SAMPLE_RATE to the file's rate, so the
+    onset envelope has the frame rate extract_features() would see.
+    """
+    sr = sf.info(path).samplerate
+    ratio = sr / DSP_SAMPLE_RATE
+    hop_length = max(1, int(round(HOP_LENGTH * ratio)))
+    # Even, so chroma/mel/centroid infer the same n_fft back from the spectrum height
+    n_fft = 2 * max(1, int(round(N_FFT * ratio / 2)))
+    blocks = librosa.stream(
+        path,
+        block_length=block_frames,
+        frame_length=n_fft,
+        hop_length=hop_length,
+        mono=True,
+        fill_value=0,
+    )
+
+    onset_parts: List[np.ndarray] = []
+    chroma_sum = np.zeros(12)
+    centroid_sum = 0.0
+    n_frames = 0
+    prev_mel = None
+
+    while True:
+        # Decoding happens inside the generator, so time each pull separately
+        with span("decode"):
+            y_block = next(blocks, None)
+        if y_block is None:
+            break
+        power, onset_env, centroid, prev_mel = _stft_features(
+            y_block, sr, n_fft=n_fft, hop_length=hop_length, center=False, prev_mel=prev_mel
+        )
+        onset_parts.append(onset_env)
+        with span("chroma"):
+            chroma = librosa.feature.chroma_stft(S=power, sr=sr, tuning=0.0)
+        chroma_sum += chroma.sum(axis=1)
+        centroid_sum += float(centroid.sum())
+        n_frames += power.shape[1]
+
+    onset_env = np.concatenate(onset_parts) if onset_parts else np.zeros(1)
+    with span("tempo"):
+        # Frame rate is sr / hop_length == DSP_SAMPLE_RATE / HOP_LENGTH (up to rounding)
+        bpm, bpm_confidence = estimate_tempo(onset_env, DSP_SAMPLE_RATE)
+    with span("key"):
+        key, scale = estimate_key(chroma_sum / max(n_frames, 1))
+
+    return {
+        "bpm": bpm,
+        "bpm_confidence": bpm_confidence,
+        "key": key,
+        "key_scale": scale,
+        "brightness": centroid_sum / max(n_frames, 1),
+    }
+
+
+def window_offsets(duration: float, count: int, seconds: float) -> List[float]:
+    """Start times of `count` evenly spaced windows of `seconds` length."""
+    if duration <= seconds or count <= 1:
+        return [0.0]
+    last_start = duration - seconds
+    return [last_start * i / (count - 1) for i in range(count)]
+
+
+def load_windows(path: str, duration: float, count: int, seconds: float, sr: int) -> List[np.ndarray]:
+    """Decode only the analysis windows (seeking, not reading the whole file)."""
+    windows = []
+    for offset in window_offsets(duration, count, seconds):
+        with span("decode_windows"):
+            y, _ = librosa.load(path, sr=sr, offset=offset, duration=seconds)
+        if y.size:
+            windows.append(y)
+    return windows
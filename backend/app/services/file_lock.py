@@ -0,0 +1,31 @@
+"""
+Exclusive advisory lock on a file, shared by every process on the host
+(fcntl.flock). On Windows there is no fcntl and the lock is a no-op, so only
+single-process use is safe there.
+"""
+import os
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process locking only
+    fcntl = None
+
+
+class FileLock:
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            os.makedirs(self.path.parent, exist_ok=True)
+            self._file = open(self.path, "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
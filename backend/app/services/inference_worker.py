@@ -0,0 +1,101 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from app.config import CLAP_BATCH_SIZE, CLAP_BATCH_MAX_WAIT_MS
+from app.services.prompt_cache import as_embedding
+
+
+class ClapInferenceWorker:
+    """
+    Dedicated CLAP audio-encoder thread that batches work across tracks.
+    Callers submit decoded audio and get a Future for the normalized embedding.
+    The worker takes up to `batch_size` queued clips and runs them through the
+    encoder as one padded batch. It waits up to `max_wait_ms` for a batch to
+    fill only while another analysis in this process could still submit: with
+    ANALYSIS_EXECUTOR=thread the analyses share this worker and batch across
+    tracks; a process-pool worker runs one analysis at a time, so its batches
+    only ever hold one track's windows and never wait.
+    """
+    _instance: Optional["ClapInferenceWorker"] = None
+    _instance_lock = threading.Lock()
+    # Analyses running in this process (see caller())
+    _callers = 0
+    _callers_lock = threading.Lock()
+
+    def __init__(self, model, processor, batch_size: int = CLAP_BATCH_SIZE, max_wait_ms: float = CLAP_BATCH_MAX_WAIT_MS):
+        self.model = model
+        self.processor = processor
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: "queue.Queue[Tuple[np.ndarray, int, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="clap-inference", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def instance(cls, model, processor) -> "ClapInferenceWorker":
+        """Process-wide worker bound to the loaded CLAP model."""
+        with cls._instance_lock:
+            if cls._instance is None or cls._instance.model is not model:
+                cls._instance = cls(model, processor)
+            return cls._instance
+
+    @classmethod
+    @contextmanager
+    def caller(cls) -> Iterator[None]:
+        """Mark one analysis as running, so the worker knows whether waiting for more clips can pay off."""
+        with cls._callers_lock:
+            cls._callers += 1
+        try:
+            yield
+        finally:
+            with cls._callers_lock:
+                cls._callers -= 1
+
+    def submit(self, y: np.ndarray, sr: int) -> Future:
+        future: Future = Future()
+        self._queue.put((y, sr, future))
+        return future
+
+    def _collect(self) -> List[Tuple[np.ndarray, int, Future]]:
+        batch = [self._queue.get()]
+        # With a single analysis in flight nothing else is coming: take what is queued and go
+        max_wait = self.max_wait if ClapInferenceWorker._callers > 1 else 0.0
+        deadline = time.monotonic() + max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # The feature extractor needs one sampling rate per call
+            by_rate = {}
+            for item in batch:
+                by_rate.setdefault(item[1], []).append(item)
+            for sr, items in by_rate.items():
+                self._encode(sr, items)
+
+    def _encode(self, sr: int, items: List[Tuple[np.ndarray, int, Future]]):
+        try:
+            inputs = self.processor(audios=[y for y, _, _ in items], return_tensors="pt", sampling_rate=sr)
+            with torch.no_grad():
+                embeds = as_embedding(self.model.get_audio_features(**inputs))
+            print(f"[INFERENCE] Encoded batch of {len(items)} track(s)")
+            for idx, (_, _, future) in enumerate(items):
+                future.set_result(embeds[idx:idx + 1])
+        except Exception as e:
+            print(f"[INFERENCE ERROR] Batch of {len(items)} failed: {e}")
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
@@ -0,0 +1,148 @@
+"""
+Upload ingest helpers.
+Audio formats are recognised from the file header rather than the name, and
+bytes are hashed and size-checked while they stream to disk.
+"""
+import hashlib
+import os
+import zipfile
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from app.models.schemas import Track
+
+# Format -> extension used for the stored file
+AUDIO_EXTENSIONS = {"mp3": ".mp3", "wav": ".wav", "flac": ".flac", "m4a": ".m4a"}
+
+# Bytes needed to recognise every supported header
+SNIFF_BYTES = 12
+
+# ISO-BMFF major brands accepted as M4A. Other ftyp files (MP4 video, HEIC/AVIF
+# images, 3GP) share the container but are not audio librosa can decode.
+M4A_BRANDS = {b"M4A ", b"M4B ", b"mp42", b"isom", b"dash"}
+
+
+class UploadRejected(Exception):
+    def __init__(self, filename: str, reason: str, status_code: int = 400):
+        super().__init__(reason)
+        self.filename = filename
+        self.reason = reason
+        self.status_code = status_code
+
+
+def detect_format(head: bytes) -> Optional[str]:
+    """Identify mp3 / wav / flac / m4a / zip from the first bytes of a file."""
+    if head.startswith(b"ID3"):
+        return "mp3"
+    if head.startswith(b"fLaC"):
+        return "flac"
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[4:8] == b"ftyp":
+        return "m4a" if head[8:12] in M4A_BRANDS else None
+    if head.startswith(b"PK\x03\x04"):
+        return "zip"
+    # Bare MPEG audio frame sync (11 set bits); layer bits 00 would be AAC/ADTS
+    if len(head) >= 2 and head[0] == 0xFF and (head[1] & 0xE0) == 0xE0 and (head[1] & 0x06) != 0:
+        return "mp3"
+    return None
+
+
+class UploadWriter:
+    """
+    Incrementally writes one audio file into `upload_dir`.
+    feed() chunks, then finish() to get an (unsaved) Track whose file lives at
+    <upload_dir>/<sha256><ext>; identical content is stored only once.
+    Blocking: call from a worker thread when used inside async code.
+    """
+
+    def __init__(self, filename: str, upload_dir: Path, max_bytes: int):
+        self.track = Track(filename=os.path.basename(filename), filepath="")
+        self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self.tmp_path = upload_dir / f"{self.track.id}.part"
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+        self.format: Optional[str] = None
+        self._fh = open(self.tmp_path, "wb")
+
+    def _check_format(self):
+        fmt = detect_format(self.head)
+        if fmt not in AUDIO_EXTENSIONS:
+            raise UploadRejected(self.track.filename, "Supported formats: MP3, WAV, FLAC, M4A")
+        self.format = fmt
+
+    def feed(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadRejected(self.track.filename, f"File exceeds {self.max_bytes} bytes", status_code=413)
+        if self.format is None:
+            self.head += chunk[:SNIFF_BYTES]
+            if len(self.head) >= SNIFF_BYTES:
+                self._check_format()
+        self.digest.update(chunk)
+        self._fh.write(chunk)
+
+    def finish(self) -> Track:
+        self._fh.close()
+        if self.format is None:
+            self._check_format()
+
+        # Content-addressed path: identical uploads share one file on disk
+        self.track.content_hash = self.digest.hexdigest()
+        file_path = self.upload_dir / f"{self.track.content_hash}{AUDIO_EXTENSIONS[self.format]}"
+        if file_path.exists():
+            os.remove(self.tmp_path)
+        else:
+            os.replace(self.tmp_path, file_path)
+
+        self.track.filepath = str(file_path)
+        self.track.status = "queued"
+        return self.track
+
+    def abort(self):
+        self._fh.close()
+        if self.tmp_path.exists():
+            os.remove(self.tmp_path)
+
+
+def extract_archive(
+    archive_path: Path,
+    upload_dir: Path,
+    max_bytes: int,
+    max_files: int,
+    chunk_size: int,
+) -> Tuple[List[Track], List[UploadRejected]]:
+    """Ingest every audio file in a zip archive (blocking)."""
+    tracks: List[Track] = []
+    rejected: List[UploadRejected] = []
+
+    with zipfile.ZipFile(archive_path) as zf:
+        for info in zf.infolist():
+            name = info.filename
+            base = os.path.basename(name)
+            # Folders and OS metadata (__MACOSX/, .DS_Store, ._foo.mp3)
+            if info.is_dir() or not base or base.startswith(".") or name.startswith("__MACOSX"):
+                continue
+            if len(tracks) >= max_files:
+                rejected.append(UploadRejected(base, f"Batch limit of {max_files} files reached", status_code=413))
+                continue
+            if info.file_size > max_bytes:
+                rejected.append(UploadRejected(base, f"File exceeds {max_bytes} bytes", status_code=413))
+                continue
+
+            writer = UploadWriter(base, upload_dir, max_bytes)
+            try:
+                with zf.open(info) as src:
+                    for chunk in iter(lambda: src.read(chunk_size), b""):
+                        writer.feed(chunk)
+                tracks.append(writer.finish())
+            except UploadRejected as e:
+                writer.abort()
+                rejected.append(e)
+            except (zipfile.BadZipFile, OSError) as e:
+                writer.abort()
+                rejected.append(UploadRejected(base, f"Unreadable archive member: {e}"))
+
+    return tracks, rejected
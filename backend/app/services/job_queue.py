@@ -0,0 +1,399 @@
+"""
+Durable analysis job queue.
+Jobs are rows in a local SQLite database, so queued work survives restarts.
+Each job belongs to a named queue ("preview" or "full"); JobDispatcher pulls
+from every queue with its own concurrency limit, retries failures with
+exponential backoff and re-queues jobs orphaned by a crash.
+A claimed job is leased to the claiming process (host:pid) for
+JOB_LEASE_SECONDS and renewed while it runs, so several workers can share one
+database: only jobs whose lease expired are taken back.
+"""
+import asyncio
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from app.config import (
+    DATA_DIR, JOB_CONCURRENCY, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_RETRY_BACKOFF_SECONDS, PREVIEW_CONCURRENCY,
+)
+from app.services.metrics import JOB_FAILURES_TOTAL
+
+JOBS_DB = DATA_DIR / "jobs.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    track_id TEXT NOT NULL,
+    queue TEXT NOT NULL DEFAULT 'full',
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    last_error TEXT,
+    owner TEXT,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs (status, priority DESC, available_at, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_track ON jobs (track_id);
+"""
+
+# Created after the migration below, which adds `queue` (and the lease columns) to older databases
+_QUEUE_INDEX = "CREATE INDEX IF NOT EXISTS idx_jobs_queue_pending ON jobs (queue, status, priority DESC, available_at, id)"
+
+# queued -> running -> done
+#                   -> queued (retry, after backoff)
+#                   -> failed (attempts exhausted)
+ACTIVE_STATUSES = ("queued", "running")
+
+# Queue name -> handlers running at once
+QUEUE_CONCURRENCY = {"full": JOB_CONCURRENCY, "preview": PREVIEW_CONCURRENCY}
+
+# Leases held by this process are tagged with it
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    _conn: Optional[sqlite3.Connection] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _db(cls) -> sqlite3.Connection:
+        if cls._conn is None:
+            JOBS_DB.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(JOBS_DB, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+            if "queue" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN queue TEXT NOT NULL DEFAULT 'full'")
+            if "owner" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+                conn.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL")
+            conn.execute(_QUEUE_INDEX)
+            cls._conn = conn
+        return cls._conn
+
+    @classmethod
+    def enqueue(cls, track_id: str, priority: int = 0, queue: str = "full") -> int:
+        """Queue a track for analysis. A track with an active job in that queue is not queued twice."""
+        now = time.time()
+        with cls._lock:
+            db = cls._db()
+            row = db.execute(
+                "SELECT id FROM jobs WHERE track_id = ? AND queue = ? AND status IN (?, ?)",
+                (track_id, queue, *ACTIVE_STATUSES),
+            ).fetchone()
+            if row:
+                return row["id"]
+            cur = db.execute(
+                "INSERT INTO jobs (track_id, queue, priority, status, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (track_id, queue, priority, now, now, now),
+            )
+            return cur.lastrowid
+
+    @classmethod
+    def enqueue_many(cls, track_ids: List[str], priority: int = 0, queue: str = "full") -> int:
+        """Queue many tracks in a single transaction; returns how many were added."""
+        now = time.time()
+        with cls._lock:
+            db = cls._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                active = {
+                    r["track_id"] for r in db.execute(
+                        "SELECT track_id FROM jobs WHERE queue = ? AND status IN (?, ?)", (queue, *ACTIVE_STATUSES)
+                    ).fetchall()
+                }
+                rows = [
+                    (track_id, queue, priority, now, now, now)
+                    for track_id in dict.fromkeys(track_ids) if track_id not in active
+                ]
+                db.executemany(
+                    "INSERT INTO jobs (track_id, queue, priority, status, available_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                    rows,
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    @classmethod
+    def claim(cls, queue: str = "full") -> Optional[Dict]:
+        """Take the highest-priority job in `queue` that is due and lease it to this process."""
+        now = time.time()
+        with cls._lock:
+            db = cls._db()
+            # Write lock up front: API and worker processes may share this database
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    "SELECT * FROM jobs WHERE queue = ? AND status = 'queued' AND available_at <= ? "
+                    "ORDER BY priority DESC, id ASC LIMIT 1",
+                    (queue, now),
+                ).fetchone()
+                if row is not None:
+                    db.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, owner = ?, lease_until = ?, "
+                        "updated_at = ? WHERE id = ?",
+                        (WORKER_ID, now + JOB_LEASE_SECONDS, now, row["id"]),
+                    )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            if row is None:
+                return None
+            job = dict(row)
+            job["attempts"] += 1
+            job["owner"] = WORKER_ID
+            return job
+
+    @classmethod
+    def renew(cls, job_ids: List[int]) -> int:
+        """Extend this process's leases on running jobs; returns how many it still holds."""
+        if not job_ids:
+            return 0
+        now = time.time()
+        placeholders = ", ".join("?" for _ in job_ids)
+        with cls._lock:
+            cur = cls._db().execute(
+                f"UPDATE jobs SET lease_until = ?, updated_at = ? "
+                f"WHERE status = 'running' AND owner = ? AND id IN ({placeholders})",
+                (now + JOB_LEASE_SECONDS, now, WORKER_ID, *job_ids),
+            )
+            return cur.rowcount
+
+    @classmethod
+    def complete(cls, job: Dict):
+        # A job whose lease was lost has been handed to another worker, which owns it now
+        with cls._lock:
+            cls._db().execute(
+                "UPDATE jobs SET status = 'done', last_error = NULL, owner = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (time.time(), job["id"], job["owner"]),
+            )
+
+    @classmethod
+    def fail(cls, job: Dict, error: str) -> str:
+        """
+        Record a failed attempt. Returns "retry" if the job was re-queued with
+        backoff, "failed" once JOB_MAX_ATTEMPTS is exhausted, or "lost" if this
+        process no longer holds the lease (another worker owns the job now and
+        nothing was changed).
+        """
+        now = time.time()
+        retry = job["attempts"] < JOB_MAX_ATTEMPTS
+        with cls._lock:
+            if retry:
+                delay = JOB_RETRY_BACKOFF_SECONDS * (2 ** (job["attempts"] - 1))
+                cur = cls._db().execute(
+                    "UPDATE jobs SET status = 'queued', available_at = ?, last_error = ?, owner = NULL, lease_until = NULL, "
+                    "updated_at = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                    (now + delay, error, now, job["id"], job["owner"]),
+                )
+            else:
+                cur = cls._db().execute(
+                    "UPDATE jobs SET status = 'failed', last_error = ?, owner = NULL, lease_until = NULL, updated_at = ? "
+                    "WHERE id = ? AND owner = ? AND status = 'running'",
+                    (error, now, job["id"], job["owner"]),
+                )
+        if cur.rowcount == 0:
+            return "lost"
+        return "retry" if retry else "failed"
+
+    @classmethod
+    def recover(cls) -> int:
+        """
+        Re-queue running jobs whose lease expired: their worker died without
+        finishing. Jobs leased to live workers (renewed in time) are left alone.
+        """
+        now = time.time()
+        with cls._lock:
+            cur = cls._db().execute(
+                "UPDATE jobs SET status = 'queued', available_at = ?, owner = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE status = 'running' AND (lease_until IS NULL OR lease_until < ?)",
+                (now, now, now),
+            )
+            return cur.rowcount
+
+    @classmethod
+    def active_track_ids(cls, queue: str = "full") -> List[str]:
+        with cls._lock:
+            rows = cls._db().execute(
+                "SELECT track_id FROM jobs WHERE queue = ? AND status IN (?, ?)", (queue, *ACTIVE_STATUSES)
+            ).fetchall()
+        return [r["track_id"] for r in rows]
+
+    @classmethod
+    def stats(cls, queue: Optional[str] = None) -> Dict[str, int]:
+        """Job counts by status, for one queue or all of them."""
+        with cls._lock:
+            if queue is None:
+                rows = cls._db().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+            else:
+                rows = cls._db().execute(
+                    "SELECT status, COUNT(*) AS n FROM jobs WHERE queue = ? GROUP BY status", (queue,)
+                ).fetchall()
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+        counts.update({r["status"]: r["n"] for r in rows})
+        return counts
+
+
+JobHandler = Callable[[str], Awaitable[bool]]
+
+
+class JobDispatcher:
+    """
+    Async consumer for JobQueue. Runs one loop per queue it has a handler for,
+    each with at most QUEUE_CONCURRENCY[queue] handlers at a time; the handler
+    returns True on success and False (or raises) to retry. A heartbeat renews
+    the leases of the jobs in flight and re-queues jobs whose lease expired.
+    """
+    _tasks: Dict[str, asyncio.Task] = {}
+    _heartbeat: Optional[asyncio.Task] = None
+    _held: Set[int] = set()
+    _wakeups: Dict[str, asyncio.Event] = {}
+    _handlers: Dict[str, JobHandler] = {}
+    _on_retry: Optional[Callable[[str], None]] = None
+    _poll_interval = 1.0
+
+    @classmethod
+    def start(cls, handlers: Dict[str, JobHandler], orphaned_track_ids: List[str] = (), on_retry: Optional[Callable[[str], None]] = None):
+        """handlers: queue name -> handler. Orphaned tracks go back on the full queue."""
+        cls._handlers = dict(handlers)
+        cls._on_retry = on_retry
+        cls._wakeups = {queue: asyncio.Event() for queue in cls._handlers}
+
+        recovered = JobQueue.recover()
+        active = set(JobQueue.active_track_ids())
+        for track_id in orphaned_track_ids:
+            if track_id not in active:
+                JobQueue.enqueue(track_id)
+                recovered += 1
+        if recovered:
+            print(f"[QUEUE] Re-queued {recovered} orphaned job(s)")
+
+        cls._tasks = {queue: asyncio.create_task(cls._run(queue)) for queue in cls._handlers}
+        cls._heartbeat = asyncio.create_task(cls._keep_leases(recover=True))
+
+    @classmethod
+    def running(cls) -> bool:
+        return bool(cls._tasks)
+
+    @classmethod
+    async def run_inline(cls, handlers: Dict[str, JobHandler], queue: str = "full", on_retry: Optional[Callable[[str], None]] = None) -> int:
+        """
+        Work through the due jobs of one queue, one at a time, until none are
+        left. For processes with no running dispatcher (Lambda has no lifespan
+        and no loop between invocations); returns how many jobs ran.
+        """
+        cls._handlers = dict(handlers)
+        cls._on_retry = on_retry
+        slots = asyncio.Semaphore(1)
+        ran = 0
+        heartbeat = asyncio.create_task(cls._keep_leases(recover=False))
+        try:
+            while True:
+                await slots.acquire()
+                job = JobQueue.claim(queue)
+                if job is None:
+                    slots.release()
+                    return ran
+                # Failed jobs go back with a future available_at, so this always ends
+                await cls._execute(job, slots)
+                ran += 1
+        finally:
+            heartbeat.cancel()
+
+    @classmethod
+    async def stop(cls):
+        tasks = list(cls._tasks.values())
+        if cls._heartbeat is not None:
+            tasks.append(cls._heartbeat)
+        for task in tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        cls._tasks = {}
+        cls._heartbeat = None
+
+    @classmethod
+    def wake(cls, queue: Optional[str] = None):
+        """Nudge the dispatcher after an enqueue instead of waiting for the next poll."""
+        for name, event in cls._wakeups.items():
+            if queue is None or name == queue:
+                event.set()
+
+    @classmethod
+    async def _run(cls, queue: str):
+        running = set()
+        slots = asyncio.Semaphore(max(1, QUEUE_CONCURRENCY.get(queue, 1)))
+        wakeup = cls._wakeups[queue]
+        while True:
+            await slots.acquire()
+            wakeup.clear()
+            job = JobQueue.claim(queue)
+            if job is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=cls._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(cls._execute(job, slots))
+            running.add(task)
+            task.add_done_callback(running.discard)
+
+    @classmethod
+    async def _keep_leases(cls, recover: bool):
+        """Renew leases well before they run out; optionally take back jobs of dead workers."""
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                JobQueue.renew(list(cls._held))
+                if recover and JobQueue.recover():
+                    print("[QUEUE] Re-queued job(s) whose worker stopped renewing its lease")
+                    cls.wake()
+            except Exception as e:
+                print(f"[QUEUE] Lease heartbeat failed: {e}")
+
+    @classmethod
+    async def _execute(cls, job: Dict, slots: asyncio.Semaphore):
+        cls._held.add(job["id"])
+        try:
+            ok = await cls._handlers[job["queue"]](job["track_id"])
+            error = "" if ok else "analysis failed"
+        except Exception as e:
+            ok = False
+            error = str(e)
+        finally:
+            cls._held.discard(job["id"])
+            slots.release()
+
+        if ok:
+            JobQueue.complete(job)
+            cls.wake(job["queue"])
+            return
+        outcome = JobQueue.fail(job, error)
+        if outcome == "retry":
+            JOB_FAILURES_TOTAL.inc(final="false")
+            print(f"[QUEUE] Job {job['id']} for track {job['track_id']} failed (attempt {job['attempts']}), retrying")
+            if cls._on_retry is not None:
+                cls._on_retry(job["track_id"])
+        elif outcome == "failed":
+            JOB_FAILURES_TOTAL.inc(final="true")
+            print(f"[QUEUE] Job {job['id']} for track {job['track_id']} failed permanently: {error}")
+        else:
+            print(f"[QUEUE] Job {job['id']} for track {job['track_id']} failed after its lease was lost; left to its new worker")
+        cls.wake(job["queue"])
@@ -0,0 +1,177 @@
+"""
+Prometheus metrics in the text exposition format (served at /metrics).
+A small in-process registry rather than a client library: counters, gauges
+and histograms with labels, which is all the app needs. Values live in the
+API process; analysis workers report through Track.diagnostics instead.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Latency buckets in seconds: sub-millisecond storage calls up to multi-minute analyses
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+LabelValues = Tuple[str, ...]
+
+INF_LABEL = 'le="+Inf"'
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        if not self.label_names:
+            # Unlabelled series are exported as 0 from the start
+            self._values[()] = 0.0
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts, sum, count)
+        self._series: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, n = self._series.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._series[key] = (counts, total + value, n + 1)
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s, n)) for k, (c, s, n) in self._series.items())
+        lines = self.header()
+        for key, (counts, total, n) in items:
+            for bound, count in zip(self.buckets, counts):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, INF_LABEL)} {n}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- Application metrics ---
+
+QUEUE_JOBS = REGISTRY.register(Gauge(
+    "mp3tagger_queue_jobs", "Analysis jobs by queue and status", ["queue", "status"]))
+ANALYSES_IN_PROGRESS = REGISTRY.register(Gauge(
+    "mp3tagger_analyses_in_progress", "Analyses currently running"))
+ANALYSES_TOTAL = REGISTRY.register(Counter(
+    "mp3tagger_analyses_total", "Finished analyses by result (complete, failed, cached, preview)", ["result"]))
+JOB_FAILURES_TOTAL = REGISTRY.register(Counter(
+    "mp3tagger_job_failures_total", "Failed job attempts; final=true once retries are exhausted", ["final"]))
+ANALYSIS_SECONDS = REGISTRY.register(Histogram(
+    "mp3tagger_analysis_seconds", "Wall time of one track analysis in the worker"))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "mp3tagger_analysis_stage_seconds", "Time per analysis stage (decode, DSP features, model load, inference)", ["stage"]))
+STORAGE_SECONDS = REGISTRY.register(Histogram(
+    "mp3tagger_storage_seconds", "Track store latency by operation", ["operation"]))
+
+
+def observe_analysis(diagnostics) -> None:
+    """Feed the spans a worker recorded on Track.diagnostics into the histograms."""
+    if diagnostics is None:
+        return
+    ANALYSIS_SECONDS.observe(diagnostics.total_seconds)
+    for stage, seconds in diagnostics.stages.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
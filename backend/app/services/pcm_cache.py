@@ -0,0 +1,103 @@
+"""
+Decoded-PCM cache.
+Decoding MP3/M4A and resampling to 48 kHz is a large share of an analysis.
+The first analysis of some audio writes each decoded signal as a float32 mono
+.npy file keyed by content hash and sample rate. Re-analyses (retries,
+profiling, a new model or vocabulary) open it with np.load(mmap_mode="r") and
+read pages straight from the file instead of decoding again.
+A hit touches the file's mtime, and stores evict the oldest files once the
+directory grows past PCM_CACHE_MAX_BYTES, which keeps it least recently used.
+Files are shared by all worker processes; a file evicted while another process
+has it mapped stays readable until that mapping is closed.
+"""
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from app.config import PCM_CACHE_DIR, PCM_CACHE_MAX_BYTES
+from app.services.timing import span
+
+
+class PcmCache:
+
+    @staticmethod
+    def enabled() -> bool:
+        return PCM_CACHE_MAX_BYTES > 0
+
+    @staticmethod
+    def _path(content_hash: str, sr: int) -> Path:
+        return PCM_CACHE_DIR / f"{content_hash}_{sr}.npy"
+
+    @staticmethod
+    def get(content_hash: Optional[str], sr: int) -> Optional[np.ndarray]:
+        """Read-only memory-mapped signal, or None on a miss."""
+        if not content_hash or not PcmCache.enabled():
+            return None
+        path = PcmCache._path(content_hash, sr)
+        try:
+            with span("pcm_cache"):
+                y = np.load(path, mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"[PCM CACHE] Ignoring unreadable cache file {path}: {e}")
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # Evicted meanwhile; the mapping stays valid
+            pass
+        # Plain ndarray view of the mapping (no copy)
+        return np.asarray(y)
+
+    @staticmethod
+    def put(content_hash: Optional[str], sr: int, y: np.ndarray):
+        if not content_hash or not PcmCache.enabled():
+            return
+        if y.nbytes > PCM_CACHE_MAX_BYTES:
+            return
+        path = PcmCache._path(content_hash, sr)
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+        try:
+            os.makedirs(path.parent, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.ascontiguousarray(y, dtype=np.float32))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # A full disk should not fail the analysis
+            print(f"[PCM CACHE] Could not store {path.name}: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        PcmCache.evict(PCM_CACHE_MAX_BYTES)
+
+    @staticmethod
+    def evict(max_bytes: int) -> int:
+        """Delete least recently used files until the cache fits in max_bytes; returns how many."""
+        entries = []
+        total = 0
+        try:
+            with os.scandir(PCM_CACHE_DIR) as it:
+                for entry in it:
+                    if not entry.name.endswith(".npy"):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                    total += st.st_size
+        except FileNotFoundError:
+            return 0
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        return removed
@@ -0,0 +1,58 @@
+"""
+Opt-in profiler for a single analysis.
+Runs AnalysisService.analyze_track_sync under pyinstrument (HTML call tree) or
+cProfile (text report sorted by cumulative time, plus the raw .prof for
+snakeviz and friends) and records the report path on track.diagnostics.
+"""
+import cProfile
+import io
+import os
+import pstats
+import time
+from pathlib import Path
+
+from app.config import PROFILER, PROFILE_DIR
+from app.models.schemas import Track
+
+
+def _use_pyinstrument() -> bool:
+    if PROFILER == "cprofile":
+        return False
+    try:
+        import pyinstrument  # noqa: F401
+        return True
+    except ImportError:
+        if PROFILER == "pyinstrument":
+            print("[PROFILE] pyinstrument is not installed, using cProfile")
+        return False
+
+
+def profile_analysis(track: Track, out_dir: Path = PROFILE_DIR) -> Track:
+    from app.services.analysis import AnalysisService
+
+    os.makedirs(out_dir, exist_ok=True)
+    stem = out_dir / f"{track.id}-{time.strftime('%Y%m%d-%H%M%S')}"
+
+    if _use_pyinstrument():
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            track = AnalysisService.analyze_track_sync(track)
+        finally:
+            profiler.stop()
+        report_path = stem.with_suffix(".html")
+        report_path.write_text(profiler.output_html(), encoding="utf-8")
+    else:
+        profiler = cProfile.Profile()
+        track = profiler.runcall(AnalysisService.analyze_track_sync, track)
+        profiler.dump_stats(str(stem.with_suffix(".prof")))
+        buffer = io.StringIO()
+        pstats.Stats(profiler, stream=buffer).sort_stats("cumulative").print_stats(60)
+        report_path = stem.with_suffix(".txt")
+        report_path.write_text(buffer.getvalue(), encoding="utf-8")
+
+    print(f"[PROFILE] {track.filename}: report written to {report_path}")
+    if track.diagnostics is not None:
+        track.diagnostics.profile_path = str(report_path)
+    return track
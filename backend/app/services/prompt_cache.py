@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Tuple
+
+import torch
+
+from app.config import PROMPT_CACHE_DIR
+
+
+def as_embedding(output) -> torch.Tensor:
+    """
+    Normalize the return value of ClapModel.get_*_features.
+    Older transformers return the projected tensor, newer ones wrap it in a
+    BaseModelOutputWithPooling. Either way we hand back L2-normalized rows.
+    """
+    if not isinstance(output, torch.Tensor):
+        output = output.pooler_output
+    return output / output.norm(p=2, dim=-1, keepdim=True)
+
+
+class PromptEmbeddingCache:
+    """
+    Text-side embeddings for the fixed prompt vocabularies.
+    The prompts never change between tracks, so they go through the text tower
+    once per model and are reused for every upload.
+    Layout on disk: PROMPT_CACHE_DIR/<model>/<prompt hash>.pt
+    """
+    _memory: Dict[Tuple[str, str], torch.Tensor] = {}
+
+    @staticmethod
+    def prompt_hash(texts: List[str]) -> str:
+        payload = json.dumps(texts, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()[:16]
+
+    @staticmethod
+    def _cache_path(model_name: str, digest: str):
+        safe_model = model_name.replace("/", "__")
+        return PROMPT_CACHE_DIR / safe_model / f"{digest}.pt"
+
+    @classmethod
+    def get(cls, model, processor, model_name: str, texts: List[str]) -> torch.Tensor:
+        """Return a [len(texts), dim] tensor of normalized text embeddings."""
+        digest = cls.prompt_hash(texts)
+        key = (model_name, digest)
+
+        cached = cls._memory.get(key)
+        if cached is not None:
+            return cached
+
+        path = cls._cache_path(model_name, digest)
+        if path.exists():
+            try:
+                embeds = torch.load(path, map_location="cpu")
+                if embeds.shape[0] == len(texts):
+                    cls._memory[key] = embeds
+                    return embeds
+            except Exception as e:
+                print(f"[PROMPT CACHE] Ignoring unreadable cache file {path}: {e}")
+
+        print(f"[PROMPT CACHE] Encoding {len(texts)} prompts for {model_name}")
+        inputs = processor(text=texts, return_tensors="pt", padding=True)
+        with torch.no_grad():
+            embeds = as_embedding(model.get_text_features(**inputs)).detach().cpu()
+
+        try:
+            os.makedirs(path.parent, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            torch.save(embeds, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[PROMPT CACHE] Could not persist embeddings: {e}")
+
+        cls._memory[key] = embeds
+        return embeds
+
+    @classmethod
+    def clear(cls):
+        cls._memory.clear()
@@ -0,0 +1,99 @@
+"""
+Library-wide re-tagging from stored embeddings.
+Editing vocabulary.yaml or mapping_rules.yaml changes VOCABULARY_VERSION.
+The re-score job then walks the complete tracks a page at a time and, for those
+tagged under another version, takes their embeddings from the EmbeddingIndex,
+has a worker score the whole page against the prompt matrix in one matmul and
+writes the new suggestions back in one transaction. No audio is decoded.
+User edits are never touched; tracks without a stored embedding keep their
+tags until they are analyzed again.
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.config import RESCORE_BATCH_SIZE
+from app.models.schemas import Track, TrackQuery
+from app.services.storage import StorageService
+from app.services.vocabulary import VOCABULARY_VERSION, apply_tags
+
+
+class RescoreJob:
+    state: str = "idle"  # idle -> running -> complete | failed
+    force: bool = False
+    scanned: int = 0
+    rescored: int = 0
+    missing_embedding: int = 0
+    seconds: Optional[float] = None
+    error: Optional[str] = None
+    _task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def start(cls, force: bool = False) -> bool:
+        """Start a run in the background; False if one is already running."""
+        if cls.state == "running":
+            return False
+        cls.state = "running"
+        cls.force = force
+        cls.scanned = cls.rescored = cls.missing_embedding = 0
+        cls.seconds = None
+        cls.error = None
+        cls._task = asyncio.create_task(cls.run(force))
+        return True
+
+    @classmethod
+    async def run(cls, force: bool = False):
+        """Re-tag every complete track whose tag_version is stale (or all, with force)."""
+        from app.services.embedding_index import EmbeddingIndex
+        from app.services.engine import AnalysisEngine
+
+        start = time.perf_counter()
+        print(f"[RESCORE] Re-tagging library with vocabulary {VOCABULARY_VERSION}")
+        try:
+            cursor = None
+            while True:
+                query = TrackQuery(status=["complete"], sort="upload_date", order="asc",
+                                   limit=RESCORE_BATCH_SIZE, cursor=cursor)
+                tracks, cursor = await run_in_threadpool(StorageService.query_tracks, query)
+                cls.scanned += len(tracks)
+                stale = [t.id for t in tracks if force or t.tag_version != VOCABULARY_VERSION]
+                ids, embeddings = await run_in_threadpool(EmbeddingIndex.instance().get_many, stale)
+                cls.missing_embedding += len(stale) - len(ids)
+                if ids:
+                    tags = dict(zip(ids, await AnalysisEngine.tag_embeddings(embeddings)))
+                    cls.rescored += await run_in_threadpool(cls._save, tags)
+                if not cursor:
+                    break
+            cls.state = "complete"
+        except Exception as e:
+            print(f"[RESCORE ERROR] {e}")
+            cls.state = "failed"
+            cls.error = str(e)
+        cls.seconds = round(time.perf_counter() - start, 3)
+        print(f"[RESCORE] {cls.state}: {cls.rescored} re-tagged, {cls.missing_embedding} without embedding, "
+              f"{cls.scanned} scanned in {cls.seconds}s")
+
+    @staticmethod
+    def _save(tags: Dict[str, Dict]) -> int:
+        # Applied to the current records, so edits made while the batch was scored survive
+        def retag(track: Track) -> Optional[Track]:
+            if track.status != "complete":
+                return None
+            apply_tags(track, tags[track.id])
+            return track
+        return len(StorageService.update_tracks(list(tags), retag))
+
+    @classmethod
+    def report(cls) -> Dict:
+        return {
+            "state": cls.state,
+            "vocabulary_version": VOCABULARY_VERSION,
+            "force": cls.force,
+            "scanned": cls.scanned,
+            "rescored": cls.rescored,
+            "missing_embedding": cls.missing_embedding,
+            "seconds": cls.seconds,
+            "error": cls.error,
+        }
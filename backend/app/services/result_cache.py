@@ -0,0 +1,78 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from app.config import CACHE_DIR
+from app.models.schemas import AnalysisResult, Track
+from app.services.vocabulary import ANALYSIS_VERSION
+
+RESULT_CACHE_DIR = CACHE_DIR / "results"
+
+# Track fields produced by analysis; everything else (edits, filename...) stays per-track
+CACHED_FIELDS = (
+    "duration", "analysis", "suggested_genres", "suggested_moods", "suggested_styles", "tag_version",
+    "final_bpm", "final_key", "provenance",
+)
+
+
+class ResultCache:
+    """
+    Finished analyses indexed by content hash + ANALYSIS_VERSION.
+    Re-uploads of the same audio reuse the stored result instead of re-running
+    the pipeline; a new model or prompt vocabulary changes the version and
+    naturally misses the cache.
+    """
+
+    @staticmethod
+    def _path(content_hash: str):
+        return RESULT_CACHE_DIR / f"{content_hash}_{ANALYSIS_VERSION}.json"
+
+    @staticmethod
+    def lookup(content_hash: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not content_hash:
+            return None
+        path = ResultCache._path(content_hash)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    @staticmethod
+    def store(track: Track):
+        if not track.content_hash or track.status != "complete":
+            return
+        os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+        entry = {"source_track_id": track.id}
+        entry.update(track.model_dump(mode="json", include=set(CACHED_FIELDS)))
+        # Excluded from model_dump, so copied explicitly
+        entry["embedding"] = track.embedding
+        path = ResultCache._path(track.content_hash)
+        # Per-writer temp name: duplicates of one upload can finish at the same time
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def apply(track: Track, entry: Dict[str, Any]) -> Track:
+        """Copy a cached analysis onto a track, leaving its edits untouched."""
+        track.duration = entry.get("duration", 0.0)
+        track.analysis = AnalysisResult(**entry["analysis"]) if entry.get("analysis") else None
+        track.suggested_genres = entry.get("suggested_genres", [])
+        track.suggested_moods = entry.get("suggested_moods", [])
+        track.suggested_styles = entry.get("suggested_styles", [])
+        track.tag_version = entry.get("tag_version")
+        track.final_bpm = entry.get("final_bpm", 0.0)
+        track.final_key = entry.get("final_key", "")
+        track.provenance = entry.get("provenance", {})
+        track.embedding = entry.get("embedding")
+        track.status = "complete"
+        return track.apply_edit_overrides()
@@ -0,0 +1,196 @@
+"""
+In-place library scanner (python -m app.cli scan).
+Walks directory trees and analyzes audio files where they are: nothing is
+copied into data/uploads and HTTP is not involved. Results are written through
+StorageService, so scanned tracks appear in the UI and exports like uploads.
+A manifest keyed by path records size, mtime, content hash and track ID.
+A re-run skips unchanged files on the stat alone, re-hashes files whose stat
+changed, and re-analyzes only new or modified content. Each file is marked
+pending before and complete/failed after its analysis, so an interrupted
+scan resumes where it stopped and keeps the same track IDs.
+"""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.services.ingest import AUDIO_EXTENSIONS, SNIFF_BYTES, detect_format
+
+# Extensions worth opening; the header still decides (see detect_format)
+SCAN_EXTENSIONS = set(AUDIO_EXTENSIONS.values()) | {".mp4", ".aac"}
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_MANIFEST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_manifest (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    content_hash TEXT,
+    track_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    scanned_at REAL NOT NULL
+);
+"""
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_audio(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            fmt = detect_format(f.read(SNIFF_BYTES))
+    except OSError:
+        return False
+    return fmt in AUDIO_EXTENSIONS
+
+
+def walk_audio(root: Path) -> Iterator[Tuple[str, os.stat_result]]:
+    """(absolute path, stat) for every candidate audio file under root, hidden entries skipped."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            if name.startswith(".") or os.path.splitext(name)[1].lower() not in SCAN_EXTENSIONS:
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                yield path, os.stat(path)
+            except OSError:
+                continue
+
+
+class ScanManifest:
+    """path -> (size, mtime_ns, content_hash, track_id, status), in its own SQLite file."""
+
+    def __init__(self, db_path: Path):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_MANIFEST_SCHEMA)
+
+    def get(self, path: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, content_hash, track_id, status FROM scan_manifest WHERE path = ?", (path,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("size", "mtime_ns", "content_hash", "track_id", "status"), row))
+
+    def put(self, path: str, st: os.stat_result, content_hash: Optional[str], track_id: str, status: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scan_manifest VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, content_hash, track_id, status, time.time()),
+            )
+
+    def paths_under(self, root: str) -> List[str]:
+        prefix = root.rstrip(os.sep) + os.sep
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM scan_manifest WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def close(self):
+        self._conn.close()
+
+
+class LibraryScanner:
+    def __init__(self, manifest: ScanManifest, concurrency: int, force: bool = False):
+        self.manifest = manifest
+        self.concurrency = max(1, concurrency)
+        self.force = force
+        self.counts = {"found": 0, "unchanged": 0, "analyzed": 0, "failed": 0, "skipped": 0, "missing": 0}
+
+    async def scan(self, roots: List[Path]) -> Dict[str, int]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 4)
+        consumers = [asyncio.create_task(self._consume(queue)) for _ in range(self.concurrency)]
+        loop = asyncio.get_running_loop()
+        try:
+            for root in roots:
+                root = root.resolve()
+                seen = set()
+                # Directory walking is blocking; pull entries from a thread
+                walker = walk_audio(root)
+                while True:
+                    item = await loop.run_in_executor(None, next, walker, None)
+                    if item is None:
+                        break
+                    seen.add(item[0])
+                    self.counts["found"] += 1
+                    await queue.put(item)
+                self.counts["missing"] += sum(1 for p in self.manifest.paths_under(str(root)) if p not in seen)
+            for _ in consumers:
+                await queue.put(None)
+            await asyncio.gather(*consumers)
+        finally:
+            for task in consumers:
+                task.cancel()
+        return self.counts
+
+    async def _consume(self, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            path, st = item
+            try:
+                await self._process(path, st)
+            except Exception as e:
+                print(f"[SCAN ERROR] {path}: {e}")
+                self.counts["failed"] += 1
+
+    async def _process(self, path: str, st: os.stat_result):
+        from app.api.endpoints import run_analysis_task
+
+        entry = self.manifest.get(path)
+        done = entry is not None and entry["status"] == "complete" and not self.force
+        if done and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            self.counts["unchanged"] += 1
+            return
+
+        loop = asyncio.get_running_loop()
+        if entry is None and not await loop.run_in_executor(None, is_audio, path):
+            self.counts["skipped"] += 1
+            return
+        content_hash = await loop.run_in_executor(None, file_sha256, path)
+        if done and entry["content_hash"] == content_hash:
+            # Touched but identical: just remember the new stat
+            self.manifest.put(path, st, content_hash, entry["track_id"], "complete")
+            self.counts["unchanged"] += 1
+            return
+
+        track = await loop.run_in_executor(None, self._prepare_track, path, content_hash, entry)
+        self.manifest.put(path, st, content_hash, track.id, "pending")
+        ok = await run_analysis_task(track.id)
+        self.manifest.put(path, st, content_hash, track.id, "complete" if ok else "failed")
+        self.counts["analyzed" if ok else "failed"] += 1
+        print(f"[SCAN] {'Analyzed' if ok else 'Failed'}: {path}")
+
+    @staticmethod
+    def _prepare_track(path: str, content_hash: str, entry: Optional[Dict]):
+        """New track for a new path; the same track (edits kept) when a known file changed."""
+        from app.models.schemas import Track
+        from app.services.storage import StorageService
+
+        track = StorageService.get_track(entry["track_id"]) if entry else None
+        if track is None:
+            track = Track(filename=os.path.basename(path), filepath=path)
+            if entry:
+                track.id = entry["track_id"]
+        track.content_hash = content_hash
+        track.status = "queued"
+        StorageService.save_track(track)
+        return track
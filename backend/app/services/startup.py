@@ -0,0 +1,83 @@
+"""
+Process role and readiness.
+APP_ROLE decides what a process does at startup:
+- "api":    HTTP only. Uploads are enqueued for a worker; librosa, torch and
+            transformers are never imported, so startup stays fast.
+- "worker": runs the job dispatcher and warms up the model before it reports
+            ready (GET /ready answers 503 until then).
+- "all":    both in one process (default, local development).
+"""
+import sys
+import time
+from typing import Dict, List, Optional
+
+from app.config import APP_ROLE
+
+ROLES = ("api", "worker", "all")
+
+# Modules that must stay out of API-only processes
+HEAVY_MODULES = ("numpy", "librosa", "numba", "torch", "transformers")
+
+
+class Startup:
+    role: str = APP_ROLE
+    state: str = "starting"  # starting -> warming -> ready | failed
+    error: Optional[str] = None
+    import_seconds: Dict[str, float] = {}
+    warmup_seconds: Optional[float] = None
+    workers: List[Dict] = []
+
+    @classmethod
+    def check_role(cls):
+        if cls.role not in ROLES:
+            raise ValueError(f"APP_ROLE must be one of {', '.join(ROLES)}, got {cls.role!r}")
+
+    @classmethod
+    def runs_worker(cls) -> bool:
+        return cls.role in ("worker", "all")
+
+    @classmethod
+    def record_import(cls, name: str, seconds: float):
+        cls.import_seconds[name] = round(seconds, 3)
+
+    @classmethod
+    def mark_ready(cls):
+        cls.state = "ready"
+        print(f"[STARTUP] Ready (role={cls.role}, imports={cls.import_seconds})")
+
+    @classmethod
+    async def warm_up(cls):
+        """Start the analysis workers, each loading and exercising its model."""
+        from app.services.engine import AnalysisEngine
+
+        cls.state = "warming"
+        start = time.perf_counter()
+        try:
+            cls.workers = await AnalysisEngine.warm_up()
+            errors = [w["error"] for w in cls.workers if w.get("error")]
+            if errors:
+                raise RuntimeError(errors[0])
+            cls.warmup_seconds = round(time.perf_counter() - start, 3)
+            print(f"[STARTUP] Warm-up finished in {cls.warmup_seconds}s across {len(cls.workers)} worker(s)")
+            cls.mark_ready()
+        except Exception as e:
+            cls.state = "failed"
+            cls.error = str(e)
+            print(f"[STARTUP] Warm-up failed: {e}")
+
+    @classmethod
+    def loaded_heavy_modules(cls) -> List[str]:
+        return [m for m in HEAVY_MODULES if m in sys.modules]
+
+    @classmethod
+    def report(cls) -> Dict:
+        return {
+            "role": cls.role,
+            "state": cls.state,
+            "ready": cls.state == "ready",
+            "error": cls.error,
+            "import_seconds": cls.import_seconds,
+            "warmup_seconds": cls.warmup_seconds,
+            "workers": cls.workers,
+            "heavy_modules_loaded": cls.loaded_heavy_modules(),
+        }
@@ -1,78 +1,213 @@
 import os
-import json
-import shutil
-from pathlib import Path
-from typing import List, Optional
+import threading
+import zipfile
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import uuid4
 from fastapi import UploadFile
-from app.models.schemas import Track, AnalysisResult
+from starlette.concurrency import run_in_threadpool
+from app.models.schemas import Track, AnalysisResult, TrackQuery
+from app.config import DATA_DIR, STORAGE_BACKEND, MAX_UPLOAD_BYTES, MAX_ARCHIVE_BYTES, MAX_BATCH_FILES, TRACK_CACHE_SIZE
+from app.services.events import EventBus
+from app.services.metrics import STORAGE_SECONDS
+from app.services.ingest import SNIFF_BYTES, UploadRejected, UploadWriter, detect_format, extract_archive
+from app.services.storage_backends import StorageBackend, JsonStorageBackend, SqliteStorageBackend
 
 # Define paths
-BASE_DIR = Path(__file__).resolve().parent.parent.parent
-UPLOAD_DIR = BASE_DIR / "data" / "uploads"
-RESULTS_DIR = BASE_DIR / "data" / "results"
+UPLOAD_DIR = DATA_DIR / "uploads"
+RESULTS_DIR = DATA_DIR / "results"
+LIBRARY_DB = DATA_DIR / "library.db"
+
+# Bytes read per chunk while streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Per-track write locks are striped: a track ID always maps to the same lock
+TRACK_LOCK_STRIPES = 64
 
 # Ensure directories exist
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(RESULTS_DIR, exist_ok=True)
 
 class StorageService:
+    _backend: Optional[StorageBackend] = None
+    _locks = [threading.Lock() for _ in range(TRACK_LOCK_STRIPES)]
+
+    @staticmethod
+    @contextmanager
+    def _locked(track_ids: Iterable[str]) -> Iterator[None]:
+        """Hold the write locks of these tracks (acquired in a fixed order, so bulk writers cannot deadlock)."""
+        stripes = sorted({hash(tid) % TRACK_LOCK_STRIPES for tid in track_ids})
+        for i in stripes:
+            StorageService._locks[i].acquire()
+        try:
+            yield
+        finally:
+            for i in reversed(stripes):
+                StorageService._locks[i].release()
+
+    @staticmethod
+    def _after_write(track: Track):
+        if track.embedding is not None:
+            # Imported here: numpy stays out of API processes that never index
+            from app.services.embedding_index import EmbeddingIndex
+            EmbeddingIndex.instance().add(track.id, track.embedding)
+        # Every single-track write goes through here, so subscribers see each status change
+        EventBus.publish_status(track.id, track.status)
+
+    @staticmethod
+    async def _stream_audio(file: UploadFile, first_chunk: bytes = b"") -> Track:
+        """Stream one uploaded audio file to disk; file IO runs off the event loop."""
+        writer = await run_in_threadpool(UploadWriter, file.filename, UPLOAD_DIR, MAX_UPLOAD_BYTES)
+        try:
+            chunk = first_chunk or await file.read(UPLOAD_CHUNK_SIZE)
+            while chunk:
+                await run_in_threadpool(writer.feed, chunk)
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            return await run_in_threadpool(writer.finish)
+        except BaseException:
+            await run_in_threadpool(writer.abort)
+            raise
+
+    @staticmethod
+    async def _stream_archive(file: UploadFile, first_chunk: bytes, max_files: int) -> Tuple[List[Track], List[UploadRejected]]:
+        """Spool a zip upload to disk, then ingest its audio members in a worker thread."""
+        archive_path = UPLOAD_DIR / f"{uuid4()}.zip.part"
+        size = 0
+        try:
+            with open(archive_path, "wb") as buffer:
+                chunk = first_chunk
+                while chunk:
+                    size += len(chunk)
+                    if size > MAX_ARCHIVE_BYTES:
+                        raise UploadRejected(file.filename, f"Archive exceeds {MAX_ARCHIVE_BYTES} bytes", status_code=413)
+                    await run_in_threadpool(buffer.write, chunk)
+                    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            return await run_in_threadpool(
+                extract_archive, archive_path, UPLOAD_DIR, MAX_UPLOAD_BYTES, max_files, UPLOAD_CHUNK_SIZE
+            )
+        except zipfile.BadZipFile:
+            raise UploadRejected(file.filename, "Corrupt zip archive")
+        finally:
+            if archive_path.exists():
+                os.remove(archive_path)
+
     @staticmethod
     async def save_upload(file: UploadFile) -> Track:
-        # Create track object to generate ID
-        # Initialize with dummy filepath, will update after save
-        track = Track(filename=file.filename, filepath="")
-        
-        # Define paths
-        file_ext = os.path.splitext(file.filename)[1]
-        safe_filename = f"{track.id}{file_ext}"
-        file_path = UPLOAD_DIR / safe_filename
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        track.filepath = str(file_path)
-        track.status = "queued"
-        
-        # Save initial JSON record
-        StorageService.save_track(track)
-        
+        """Store a single audio upload (format checked from its header) and its record."""
+        track = await StorageService._stream_audio(file)
+        await run_in_threadpool(StorageService.save_track, track)
         return track
 
+    @staticmethod
+    async def save_batch(files: List[UploadFile]) -> Tuple[List[Track], List[UploadRejected]]:
+        """
+        Store many uploads at once. Zip archives are expanded; files that fail
+        validation are reported in the rejected list instead of failing the batch.
+        """
+        tracks: List[Track] = []
+        rejected: List[UploadRejected] = []
+        for file in files:
+            if len(tracks) >= MAX_BATCH_FILES:
+                rejected.append(UploadRejected(file.filename, f"Batch limit of {MAX_BATCH_FILES} files reached", status_code=413))
+                continue
+            try:
+                first_chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if detect_format(first_chunk[:SNIFF_BYTES]) == "zip":
+                    archive_tracks, archive_rejected = await StorageService._stream_archive(
+                        file, first_chunk, MAX_BATCH_FILES - len(tracks)
+                    )
+                    tracks.extend(archive_tracks)
+                    rejected.extend(archive_rejected)
+                else:
+                    tracks.append(await StorageService._stream_audio(file, first_chunk))
+            except UploadRejected as e:
+                rejected.append(e)
+
+        for track in tracks:
+            await run_in_threadpool(StorageService.save_track, track)
+        return tracks, rejected
+
+    @staticmethod
+    def backend() -> StorageBackend:
+        if StorageService._backend is None:
+            if STORAGE_BACKEND == "json":
+                StorageService._backend = JsonStorageBackend(RESULTS_DIR, cache_size=TRACK_CACHE_SIZE)
+            else:
+                # Picks up any records written by the JSON backend on first open
+                StorageService._backend = SqliteStorageBackend(LIBRARY_DB, legacy_results_dir=RESULTS_DIR)
+        return StorageService._backend
+
     @staticmethod
     def save_track(track: Track):
-        json_path = RESULTS_DIR / f"{track.id}.json"
-        with open(json_path, "w", encoding="utf-8") as f:
-            f.write(track.model_dump_json(indent=2))
+        """
+        Overwrite a record. Only for records nobody else can be writing (new
+        tracks); anything that read the record earlier should use update_track.
+        """
+        with StorageService._locked([track.id]), STORAGE_SECONDS.time(operation="write"):
+            StorageService.backend().save_track(track)
+        StorageService._after_write(track)
 
     @staticmethod
-    def get_track(track_id: str) -> Optional[Track]:
-        json_path = RESULTS_DIR / f"{track_id}.json"
-        if not json_path.exists():
-            return None
-        try:
-            with open(json_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            return Track(**data)
-        except Exception:
+    def save_tracks(tracks: List[Track]):
+        """
+        Bulk write in one transaction. No status events and no index updates.
+        """
+        with StorageService._locked(t.id for t in tracks), STORAGE_SECONDS.time(operation="write_many"):
+            StorageService.backend().save_tracks(tracks)
+
+    @staticmethod
+    def update_track(track_id: str, fn: Callable[[Track], Optional[Track]]) -> Optional[Track]:
+        """
+        Read-modify-write of one record under its lock: fn gets the current
+        record and returns the one to save, or None to leave it unchanged.
+        Returns the saved track (None if missing or left unchanged).
+        """
+        updated = StorageService.update_tracks([track_id], fn)
+        if not updated:
             return None
+        StorageService._after_write(updated[0])
+        return updated[0]
+
+    @staticmethod
+    def update_tracks(track_ids: List[str], fn: Callable[[Track], Optional[Track]]) -> List[Track]:
+        """
+        update_track for many records, written in one transaction (bulk edits,
+        re-scoring). No status events and no index updates. fn runs under the
+        storage locks and must not call StorageService itself.
+        """
+        track_ids = list(dict.fromkeys(track_ids))
+        with StorageService._locked(track_ids), STORAGE_SECONDS.time(operation="update"):
+            return StorageService.backend().update_tracks(track_ids, fn)
+
+    @staticmethod
+    def get_track(track_id: str) -> Optional[Track]:
+        with STORAGE_SECONDS.time(operation="read"):
+            return StorageService.backend().get_track(track_id)
+
+    @staticmethod
+    def get_tracks(track_ids: List[str]) -> List[Track]:
+        with STORAGE_SECONDS.time(operation="read_many"):
+            return StorageService.backend().get_tracks(track_ids)
+
+    @staticmethod
+    def get_statuses(track_ids: List[str]) -> Dict[str, str]:
+        with STORAGE_SECONDS.time(operation="status"):
+            return StorageService.backend().get_statuses(track_ids)
+
+    @staticmethod
+    def query_tracks(query: TrackQuery) -> Tuple[List[Track], Optional[str]]:
+        with STORAGE_SECONDS.time(operation="query"):
+            return StorageService.backend().query_tracks(query)
 
     @staticmethod
-    def list_tracks() -> List[Track]:
-        tracks = []
-        for file in os.listdir(RESULTS_DIR):
-            if file.endswith(".json"):
-                track_id = file.replace(".json", "")
-                track = StorageService.get_track(track_id)
-                if track:
-                    tracks.append(track)
-        # Sort by upload date desc
-        tracks.sort(key=lambda x: x.upload_date, reverse=True)
+    def list_tracks(query: Optional[TrackQuery] = None) -> List[Track]:
+        """All matching tracks, newest first by default."""
+        tracks, _ = StorageService.query_tracks(query or TrackQuery())
         return tracks
 
     @staticmethod
     def update_track_status(track_id: str, status: str):
-        track = StorageService.get_track(track_id)
-        if track:
+        def set_status(track: Track) -> Track:
             track.status = status
-            StorageService.save_track(track)
+            return track
+        StorageService.update_track(track_id, set_status)
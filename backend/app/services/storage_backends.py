@@ -0,0 +1,383 @@
+"""
+Track metadata storage backends.
+StorageService delegates to one of these (STORAGE_BACKEND):
+- "sqlite": embedded database with indexed status/date/BPM/key/tag columns,
+  so /tracks filters and pages without parsing every record.
+- "json": the original one-file-per-track layout under data/results, with
+  an in-memory cache of records keyed by each file's stat.
+update_tracks is the read-modify-write used by every writer that can race with
+another (edits, analysis results, re-scoring); StorageService holds per-track
+locks around it, and the SQLite backend also runs it in one transaction so it
+is atomic across processes.
+"""
+import base64
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.models.schemas import Track, TrackQuery
+from app.services.track_cache import TrackCache
+
+SORT_COLUMNS = {
+    "upload_date": "upload_date",
+    "bpm": "bpm",
+    "filename": "filename",
+    "key": "musical_key",
+}
+
+
+def encode_cursor(value: Any, track_id: str) -> str:
+    payload = json.dumps([value, track_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, str]:
+    try:
+        value, track_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return value, track_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def effective_tags(track: Track, kind: str) -> List[str]:
+    """Indexed tags follow Track.merged(): user edits win over suggestions."""
+    return track.merged()[kind]
+
+
+def sort_value(track: Track, sort: str) -> Any:
+    if sort == "bpm":
+        return track.final_bpm
+    if sort == "filename":
+        return track.filename
+    if sort == "key":
+        return track.final_key
+    return track.upload_date.isoformat()
+
+
+class StorageBackend:
+    def save_track(self, track: Track):
+        raise NotImplementedError
+
+    def save_tracks(self, tracks: List[Track]):
+        """Write many records; backends that can do it in one transaction override this."""
+        for track in tracks:
+            self.save_track(track)
+
+    def update_tracks(self, track_ids: List[str], fn: Callable[[Track], Optional[Track]]) -> List[Track]:
+        """
+        Read each stored record, pass it to fn and save what fn returns (None
+        leaves the record alone). Returns the saved tracks.
+        """
+        updated = [t for t in (fn(track) for track in self.get_tracks(track_ids)) if t is not None]
+        self.save_tracks(updated)
+        return updated
+
+    def get_track(self, track_id: str) -> Optional[Track]:
+        raise NotImplementedError
+
+    def get_tracks(self, track_ids: List[str]) -> List[Track]:
+        """Tracks for the given IDs in the same order; unknown IDs are skipped."""
+        return [t for t in (self.get_track(tid) for tid in track_ids) if t]
+
+    def get_statuses(self, track_ids: List[str]) -> Dict[str, str]:
+        """{track_id: status} for the known IDs."""
+        return {t.id: t.status for t in self.get_tracks(track_ids)}
+
+    def query_tracks(self, query: TrackQuery) -> Tuple[List[Track], Optional[str]]:
+        """Return one page of tracks and the cursor for the next page (or None)."""
+        raise NotImplementedError
+
+
+def _file_version(st: os.stat_result) -> Hashable:
+    # Every save replaces the file, so the inode changes too
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class JsonStorageBackend(StorageBackend):
+    """
+    One JSON file per track. Queries scan every file. Records are cached under
+    the stat of the very file they were read from or written to (taken on the
+    open handle), so a file replaced by another process is never served stale.
+    """
+
+    def __init__(self, results_dir: Path, cache_size: int = 0):
+        self.results_dir = results_dir
+        self.cache = TrackCache(cache_size)
+        os.makedirs(results_dir, exist_ok=True)
+
+    def save_track(self, track: Track):
+        # Temp file + rename: readers never see a half-written record
+        json_path = self.results_dir / f"{track.id}.json"
+        tmp_path = json_path.with_name(f"{track.id}.{os.getpid()}.{threading.get_ident()}.tmp")
+        data = track.model_dump_json()
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+                f.flush()
+                version = _file_version(os.fstat(f.fileno()))
+            os.replace(tmp_path, json_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        self.cache.put(track.id, version, data)
+
+    def get_track(self, track_id: str) -> Optional[Track]:
+        json_path = self.results_dir / f"{track_id}.json"
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                version = _file_version(os.fstat(f.fileno()))
+                cached = self.cache.get(track_id, version)
+                if cached is not None:
+                    return cached
+                data = f.read()
+            track = Track.model_validate_json(data)
+        except Exception:
+            return None
+        self.cache.put(track_id, version, data)
+        return track
+
+    def all_tracks(self) -> List[Track]:
+        tracks = []
+        for file in os.listdir(self.results_dir):
+            if file.endswith(".json"):
+                track = self.get_track(file[:-len(".json")])
+                if track:
+                    tracks.append(track)
+        return tracks
+
+    def query_tracks(self, query: TrackQuery) -> Tuple[List[Track], Optional[str]]:
+        tracks = [t for t in self.all_tracks() if self._matches(t, query)]
+        reverse = query.order == "desc"
+        tracks.sort(key=lambda t: (sort_value(t, query.sort), t.id), reverse=reverse)
+
+        if query.cursor:
+            after = tuple(decode_cursor(query.cursor))
+            if reverse:
+                tracks = [t for t in tracks if (sort_value(t, query.sort), t.id) < after]
+            else:
+                tracks = [t for t in tracks if (sort_value(t, query.sort), t.id) > after]
+
+        next_cursor = None
+        if query.limit is not None and len(tracks) > query.limit:
+            tracks = tracks[:query.limit]
+            last = tracks[-1]
+            next_cursor = encode_cursor(sort_value(last, query.sort), last.id)
+        return tracks, next_cursor
+
+    @staticmethod
+    def _matches(track: Track, query: TrackQuery) -> bool:
+        if query.status and track.status not in query.status:
+            return False
+        if query.bpm_min is not None and track.final_bpm < query.bpm_min:
+            return False
+        if query.bpm_max is not None and track.final_bpm > query.bpm_max:
+            return False
+        if query.key and track.final_key.lower() != query.key.lower():
+            return False
+        if query.genre and query.genre.lower() not in (g.lower() for g in effective_tags(track, "genres")):
+            return False
+        if query.mood and query.mood.lower() not in (m.lower() for m in effective_tags(track, "moods")):
+            return False
+        return True
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    upload_date TEXT NOT NULL,
+    bpm REAL NOT NULL DEFAULT 0,
+    musical_key TEXT NOT NULL DEFAULT '',
+    content_hash TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tracks_status ON tracks (status);
+CREATE INDEX IF NOT EXISTS idx_tracks_upload_date ON tracks (upload_date, id);
+CREATE INDEX IF NOT EXISTS idx_tracks_bpm ON tracks (bpm, id);
+CREATE INDEX IF NOT EXISTS idx_tracks_key ON tracks (musical_key COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_tracks_filename ON tracks (filename, id);
+
+CREATE TABLE IF NOT EXISTS track_tags (
+    track_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    tag TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (track_id, kind, tag)
+);
+CREATE INDEX IF NOT EXISTS idx_track_tags_lookup ON track_tags (kind, tag);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Bound on IN (...) parameters per statement (older SQLite builds allow 999)
+_IN_CHUNK = 500
+
+
+class SqliteStorageBackend(StorageBackend):
+    """
+    Embedded SQLite store. The full record is kept as JSON in `data`; the
+    columns and track_tags table are an index over it for filtering/sorting.
+    """
+
+    def __init__(self, db_path: Path, legacy_results_dir: Optional[Path] = None):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SQLITE_SCHEMA)
+        if legacy_results_dir is not None:
+            self.migrate_from_json(legacy_results_dir)
+
+    def save_track(self, track: Track):
+        self.save_tracks([track])
+
+    def save_tracks(self, tracks: List[Track]):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._write(tracks)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update_tracks(self, track_ids: List[str], fn: Callable[[Track], Optional[Track]]) -> List[Track]:
+        # Read and write in one write transaction, so other processes cannot interleave
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                updated = [t for t in (fn(track) for track in self._read(track_ids)) if t is not None]
+                self._write(updated)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return updated
+
+    def _write(self, tracks: List[Track]):
+        """Upsert records and their tag index; the caller holds the lock and a transaction."""
+        rows = [
+            (
+                track.id, track.filename, track.status, track.upload_date.isoformat(),
+                track.final_bpm, track.final_key, track.content_hash, track.model_dump_json(),
+            )
+            for track in tracks
+        ]
+        tags = []
+        for track in tracks:
+            tags += [(track.id, "genre", g) for g in effective_tags(track, "genres")]
+            tags += [(track.id, "mood", m) for m in effective_tags(track, "moods")]
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO tracks "
+            "(id, filename, status, upload_date, bpm, musical_key, content_hash, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        self._conn.executemany("DELETE FROM track_tags WHERE track_id = ?", [(t.id,) for t in tracks])
+        self._conn.executemany("INSERT OR IGNORE INTO track_tags VALUES (?, ?, ?)", tags)
+
+    def get_track(self, track_id: str) -> Optional[Track]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM tracks WHERE id = ?", (track_id,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return Track.model_validate_json(row[0])
+        except Exception:
+            return None
+
+    def get_tracks(self, track_ids: List[str]) -> List[Track]:
+        with self._lock:
+            return self._read(track_ids)
+
+    def _read(self, track_ids: List[str]) -> List[Track]:
+        """Records for the IDs, in order; the caller holds the lock."""
+        by_id = {}
+        for start in range(0, len(track_ids), _IN_CHUNK):
+            chunk = track_ids[start:start + _IN_CHUNK]
+            placeholders = ", ".join("?" for _ in chunk)
+            by_id.update(self._conn.execute(
+                f"SELECT id, data FROM tracks WHERE id IN ({placeholders})", chunk
+            ).fetchall())
+        return [Track.model_validate_json(by_id[tid]) for tid in dict.fromkeys(track_ids) if tid in by_id]
+
+    def get_statuses(self, track_ids: List[str]) -> Dict[str, str]:
+        # Reads the indexed column only; no record is parsed
+        statuses: Dict[str, str] = {}
+        for start in range(0, len(track_ids), _IN_CHUNK):
+            chunk = track_ids[start:start + _IN_CHUNK]
+            placeholders = ", ".join("?" for _ in chunk)
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT id, status FROM tracks WHERE id IN ({placeholders})", chunk
+                ).fetchall()
+            statuses.update(rows)
+        return statuses
+
+    def query_tracks(self, query: TrackQuery) -> Tuple[List[Track], Optional[str]]:
+        column = SORT_COLUMNS.get(query.sort, "upload_date")
+        direction = "DESC" if query.order == "desc" else "ASC"
+        where, params = [], []
+
+        if query.status:
+            where.append(f"status IN ({', '.join('?' for _ in query.status)})")
+            params.extend(query.status)
+        if query.bpm_min is not None:
+            where.append("bpm >= ?")
+            params.append(query.bpm_min)
+        if query.bpm_max is not None:
+            where.append("bpm <= ?")
+            params.append(query.bpm_max)
+        if query.key:
+            where.append("musical_key = ? COLLATE NOCASE")
+            params.append(query.key)
+        for kind, tag in (("genre", query.genre), ("mood", query.mood)):
+            if tag:
+                where.append("id IN (SELECT track_id FROM track_tags WHERE kind = ? AND tag = ?)")
+                params.extend([kind, tag])
+        if query.cursor:
+            value, after_id = decode_cursor(query.cursor)
+            op = "<" if direction == "DESC" else ">"
+            where.append(f"({column} {op} ? OR ({column} = ? AND id {op} ?))")
+            params.extend([value, value, after_id])
+
+        sql = f"SELECT data, {column}, id FROM tracks"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {column} {direction}, id {direction}"
+        if query.limit is not None:
+            sql += " LIMIT ?"
+            params.append(query.limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        next_cursor = None
+        if query.limit is not None and len(rows) > query.limit:
+            rows = rows[:query.limit]
+            next_cursor = encode_cursor(rows[-1][1], rows[-1][2])
+        return [Track.model_validate_json(r[0]) for r in rows], next_cursor
+
+    def migrate_from_json(self, results_dir: Path) -> int:
+        """One-shot import of the legacy data/results/*.json records."""
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+        if done or not results_dir.exists():
+            return 0
+
+        legacy = JsonStorageBackend(results_dir)
+        count = 0
+        for track in legacy.all_tracks():
+            self.save_track(track)
+            count += 1
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('json_migrated', '1')")
+        if count:
+            print(f"[STORAGE] Migrated {count} track(s) from {results_dir} into SQLite")
+        return count
@@ -0,0 +1,52 @@
+"""
+Timing spans for one analysis.
+analyze_track_sync opens a recorder with recording(); code anywhere below it
+wraps work in span("name"). Durations of repeated spans (stream blocks,
+inference calls) are summed and counted. Outside a recording span() costs
+one context-variable lookup, so library code can use it unconditionally.
+Spans are plain data, so they travel back from worker processes on the Track.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+
+class SpanRecorder:
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.started = time.perf_counter()
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+_current: ContextVar[Optional[SpanRecorder]] = ContextVar("analysis_spans", default=None)
+
+
+@contextmanager
+def recording() -> Iterator[SpanRecorder]:
+    recorder = SpanRecorder()
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    recorder = _current.get()
+    if recorder is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add(name, time.perf_counter() - start)
@@ -0,0 +1,54 @@
+"""
+In-memory LRU of serialized track records for the JSON storage backend.
+Entries carry a version token (the stat of the record's file) and a hit must
+match the current one, so records changed by another process are read again.
+Entries hold the JSON text rather than Track objects: parsing a record is
+cheaper than deep-copying one, and callers get a private copy they are free
+to mutate. The SQLite backend has no cache: a primary-key read costs about
+as much as a hit would.
+"""
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from app.models.schemas import Track
+
+
+class TrackCache:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._entries: "OrderedDict[str, Tuple[Hashable, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, track_id: str, version: Optional[Hashable]) -> Optional[Track]:
+        if version is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(track_id)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                del self._entries[track_id]
+                return None
+            self._entries.move_to_end(track_id)
+            data = entry[1]
+        return Track.model_validate_json(data)
+
+    def put(self, track_id: str, version: Optional[Hashable], data: str):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            if version is None:
+                self._entries.pop(track_id, None)
+                return
+            self._entries[track_id] = (version, data)
+            self._entries.move_to_end(track_id)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
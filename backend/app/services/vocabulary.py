@@ -0,0 +1,188 @@
+"""
+Prompt vocabularies for CLAP zero-shot tagging.
+Loaded from VOCABULARY_PATH (prompts, thresholds) and MAPPING_RULES_PATH
+(style rules) at import. Kept free of torch imports so the API process can
+reason about the vocabulary (e.g. cache versioning) without loading the ML stack.
+"""
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Set
+
+import yaml
+
+from app.config import CLAP_BACKEND, CLAP_MODEL_NAME, MAPPING_RULES_PATH, VOCABULARY_PATH
+
+DEFAULT_THRESHOLDS = {
+    "genre_min_score": 0.01,
+    "max_genres": 5,
+    "max_moods": 5,
+    "instrument_min_score": 0.05,
+}
+
+# Default share of a rule's source_tags a track must carry
+DEFAULT_RULE_THRESHOLD = 0.5
+
+
+def _load_yaml(path: Path) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        raise ValueError(f"Could not read {path}: {e}")
+    if not isinstance(data, dict):
+        raise ValueError(f"{path} must contain a mapping")
+    return data
+
+
+def _labelled_prompts(section: Dict[str, Any], name: str) -> List[str]:
+    labels = section.get("labels")
+    if not labels:
+        raise ValueError(f"vocabulary: {name}.labels is required")
+    return [str(label) for label in labels]
+
+
+def load_vocabulary(path: Path) -> Dict[str, Any]:
+    data = _load_yaml(path)
+    genres = data.get("genres") or {}
+    if not genres or not all(isinstance(p, list) and p for p in genres.values()):
+        raise ValueError(f"{path}: genres must map each genre to a non-empty list of prompts")
+    metrics = data.get("metrics") or {}
+    for name in ("energy", "danceability"):
+        if len(metrics.get(name) or []) != 2:
+            raise ValueError(f"{path}: metrics.{name} must be a [positive, negative] prompt pair")
+    moods = data.get("moods") or {}
+    instruments = data.get("instruments") or {}
+    return {
+        "genres": {str(g): [str(p) for p in prompts] for g, prompts in genres.items()},
+        "moods": _labelled_prompts(moods, "moods"),
+        "mood_template": moods.get("template", "{}"),
+        "instruments": _labelled_prompts(instruments, "instruments"),
+        "instrument_template": instruments.get("template", "{}"),
+        "metrics": [str(p) for p in metrics["energy"] + metrics["danceability"]],
+        "thresholds": {**DEFAULT_THRESHOLDS, **(data.get("thresholds") or {})},
+    }
+
+
+def load_mapping_rules(path: Path) -> Dict[str, Dict[str, Any]]:
+    if not path.exists():
+        return {}
+    rules = {}
+    for label, rule in (_load_yaml(path).get("mapping") or {}).items():
+        tags = (rule or {}).get("source_tags") or []
+        if not tags:
+            raise ValueError(f"{path}: rule {label!r} needs source_tags")
+        rules[str(label)] = {
+            "source_tags": [_normalize_tag(t) for t in tags],
+            "threshold": float(rule.get("threshold", DEFAULT_RULE_THRESHOLD)),
+        }
+    return rules
+
+
+def _normalize_tag(tag: str) -> str:
+    return re.sub(r"[^0-9a-z]", "", str(tag).lower())
+
+
+def tag_tokens(tags: Iterable[str]) -> Set[str]:
+    """Normalized forms a rule can match: "Dark Trap" -> darktrap, dark, trap."""
+    tokens = set()
+    for tag in tags:
+        tokens.add(_normalize_tag(tag))
+        tokens.update(_normalize_tag(word) for word in str(tag).split())
+    tokens.discard("")
+    return tokens
+
+
+VOCABULARY = load_vocabulary(VOCABULARY_PATH)
+MAPPING_RULES = load_mapping_rules(MAPPING_RULES_PATH)
+THRESHOLDS = VOCABULARY["thresholds"]
+
+# --- PROMPT VOCABULARIES ---
+# The power of CLAP: We simply describe what we are looking for.
+
+# Genre Prompts (Text Candidates)
+# We map the "Prompt" -> "Display Tag"
+GENRE_PROMPTS = VOCABULARY["genres"]
+
+# Flatten prompts for inference
+GENRE_TEXTS = []
+GENRE_TEXT_MAP = [] # Index -> Genre
+for _genre, _variations in GENRE_PROMPTS.items():
+    for _v in _variations:
+        GENRE_TEXTS.append(_v)
+        GENRE_TEXT_MAP.append(_genre)
+
+# Mood Prompts
+MOOD_PROMPTS = VOCABULARY["moods"]
+# Convert moods to sentences for better CLAP accuracy
+MOOD_TEXTS = [VOCABULARY["mood_template"].format(m.lower()) for m in MOOD_PROMPTS]
+
+# Instrument Prompts
+INSTRUMENT_PROMPTS = VOCABULARY["instruments"]
+INSTRUMENT_TEXTS = [VOCABULARY["instrument_template"].format(i.lower()) for i in INSTRUMENT_PROMPTS]
+
+# Energy / Danceability pairs
+METRIC_PROMPTS = VOCABULARY["metrics"]
+
+# Every group stacked into one prompt matrix; slices recover the groups
+PROMPT_GROUPS = {
+    "genres": GENRE_TEXTS,
+    "moods": MOOD_TEXTS,
+    "instruments": INSTRUMENT_TEXTS,
+    "metrics": METRIC_PROMPTS,
+}
+ALL_PROMPT_TEXTS = []
+PROMPT_GROUP_SLICES = {}
+for _group, _texts in PROMPT_GROUPS.items():
+    PROMPT_GROUP_SLICES[_group] = slice(len(ALL_PROMPT_TEXTS), len(ALL_PROMPT_TEXTS) + len(_texts))
+    ALL_PROMPT_TEXTS.extend(_texts)
+
+
+def map_styles(genres: List[str], moods: List[str], instruments: Iterable[str]) -> List[str]:
+    """
+    Style labels from mapping_rules.yaml. A rule's score is the share of its
+    source_tags found among the track's genres, moods and instruments.
+    """
+    tokens = tag_tokens(list(genres) + list(moods) + list(instruments))
+    styles = []
+    for label, rule in MAPPING_RULES.items():
+        score = sum(tag in tokens for tag in rule["source_tags"]) / len(rule["source_tags"])
+        if score >= rule["threshold"]:
+            styles.append(label)
+    return styles
+
+
+def apply_tags(track, tags: Dict[str, Any]):
+    """Write tagger output onto a track's suggestions and scores; edits are never touched."""
+    track.suggested_genres = list(dict.fromkeys(tags["genres"]))[:THRESHOLDS["max_genres"]]
+    track.suggested_moods = list(dict.fromkeys(tags["moods"]))[:THRESHOLDS["max_moods"]]
+    track.suggested_styles = tags["styles"]
+    track.tag_version = VOCABULARY_VERSION
+    if track.analysis is not None:
+        track.analysis.energy = min(tags["energy"] * 10, 10.0)
+        track.analysis.danceability = min(tags["danceability"], 1.0)
+        track.analysis.model_tags = {
+            "energy": round(tags["energy"] * 10, 1),
+            "danceability": round(tags["danceability"], 2),
+            "instruments": tags["instruments"],
+            "ai_moods": {m: 0.9 for m in tags["moods"]},
+        }
+
+
+# Bump when the analysis pipeline changes in a way that invalidates stored results
+PIPELINE_VERSION = 3
+
+# Quantized / ONNX backends give slightly different embeddings than fp32 torch,
+# so they are versioned as a model of their own (fp32 keeps the plain name)
+MODEL_ID = CLAP_MODEL_NAME if CLAP_BACKEND == "torch" else f"{CLAP_MODEL_NAME}+{CLAP_BACKEND}"
+
+# Identifies the prompts, thresholds and style rules behind a track's tags
+VOCABULARY_VERSION = hashlib.sha256(
+    json.dumps([ALL_PROMPT_TEXTS, GENRE_TEXT_MAP, THRESHOLDS, MAPPING_RULES], sort_keys=True).encode("utf-8")
+).hexdigest()[:16]
+
+# Identifies which model + vocabulary + pipeline produced a result
+ANALYSIS_VERSION = hashlib.sha256(
+    json.dumps([MODEL_ID, VOCABULARY_VERSION, PIPELINE_VERSION]).encode("utf-8")
+).hexdigest()[:16]
@@ -0,0 +1,145 @@
+"""
+Compare CLAP inference backends against the fp32 torch model before switching
+CLAP_BACKEND.
+
+    python compare_clap_backends.py <audio files or folders> [--backends int8 onnx onnx-int8] [--json out.json]
+
+Every file is embedded and tagged with fp32 torch and with each candidate.
+Reported per backend: cosine similarity of the audio embeddings, top-genre
+agreement, genre / mood / instrument overlap (Jaccard), energy and
+danceability differences, model load time and seconds per track.
+"""
+import argparse
+import gc
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import torch
+
+from app.config import CLAP_MODEL_NAME, CLAP_SAMPLE_RATE
+from app.services.analysis import AnalysisService
+from app.services.clap_runtime import BACKENDS, load_clap
+from app.services.features import decode
+from app.services.prompt_cache import as_embedding
+from app.services.vocabulary import ALL_PROMPT_TEXTS
+
+AUDIO_SUFFIXES = {".mp3", ".wav", ".flac", ".m4a"}
+
+
+def collect_files(paths: List[str]) -> List[Path]:
+    files = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files.extend(sorted(f for f in p.rglob("*") if f.suffix.lower() in AUDIO_SUFFIXES))
+        elif p.suffix.lower() in AUDIO_SUFFIXES:
+            files.append(p)
+    return files
+
+
+def run_backend(backend: str, clips: Dict[str, np.ndarray]) -> Dict:
+    """Embed and tag every clip with one backend."""
+    start = time.perf_counter()
+    model, processor = load_clap(CLAP_MODEL_NAME, backend)
+    load_seconds = time.perf_counter() - start
+
+    with torch.no_grad():
+        text_inputs = processor(text=ALL_PROMPT_TEXTS, return_tensors="pt", padding=True)
+        text_embeds = as_embedding(model.get_text_features(**text_inputs))
+        logit_scale = model.logit_scale_a.exp()
+
+        embeds, tags, seconds = {}, {}, []
+        for name, y in clips.items():
+            start = time.perf_counter()
+            inputs = processor(audios=[y], sampling_rate=CLAP_SAMPLE_RATE, return_tensors="pt")
+            audio_embeds = as_embedding(model.get_audio_features(**inputs))
+            seconds.append(time.perf_counter() - start)
+
+            scores = AnalysisService.score_embeddings(audio_embeds, text_embeds, logit_scale)
+            embeds[name] = audio_embeds[0]
+            tags[name] = AnalysisService.tags_from_scores({g: p[0] for g, p in scores.items()})
+
+    del model
+    gc.collect()
+    return {"embeds": embeds, "tags": tags, "load_seconds": load_seconds, "seconds": seconds}
+
+
+def jaccard(a, b) -> float:
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def compare(reference: Dict, candidate: Dict) -> Dict:
+    names = list(reference["tags"])
+    cosine, top_genre, genres, moods, instruments, energy, dance = [], [], [], [], [], [], []
+    for name in names:
+        ref, cand = reference["tags"][name], candidate["tags"][name]
+        cosine.append(float(torch.dot(reference["embeds"][name], candidate["embeds"][name])))
+        # genres[0] is the mood+genre fusion; the first plain genre follows it
+        top_genre.append(ref["genres"][1:2] == cand["genres"][1:2])
+        genres.append(jaccard(ref["genres"], cand["genres"]))
+        moods.append(jaccard(ref["moods"], cand["moods"]))
+        instruments.append(jaccard(ref["instruments"], cand["instruments"]))
+        energy.append(abs(ref["energy"] - cand["energy"]))
+        dance.append(abs(ref["danceability"] - cand["danceability"]))
+
+    mean = lambda xs: sum(xs) / len(xs) if xs else 0.0
+    return {
+        "cosine_mean": mean(cosine),
+        "cosine_min": min(cosine, default=0.0),
+        "top_genre_agreement": mean(top_genre),
+        "genre_jaccard": mean(genres),
+        "mood_jaccard": mean(moods),
+        "instrument_jaccard": mean(instruments),
+        "energy_abs_diff": mean(energy),
+        "danceability_abs_diff": mean(dance),
+        "load_seconds": candidate["load_seconds"],
+        "seconds_per_track": mean(candidate["seconds"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="Audio files or folders")
+    parser.add_argument("--backends", nargs="+", default=["int8", "onnx", "onnx-int8"],
+                        choices=[b for b in BACKENDS if b != "torch"])
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    files = collect_files(args.paths)
+    if not files:
+        raise SystemExit("No audio files found")
+    print(f"Decoding {len(files)} file(s)...")
+    clips = {str(f): decode(str(f), CLAP_SAMPLE_RATE)[0] for f in files}
+
+    reference = run_backend("torch", clips)
+    report = {"files": len(files), "torch": {
+        "load_seconds": reference["load_seconds"],
+        "seconds_per_track": sum(reference["seconds"]) / len(reference["seconds"]),
+    }}
+    for backend in args.backends:
+        print(f"Running {backend}...")
+        report[backend] = compare(reference, run_backend(backend, clips))
+
+    print(f"\n{'backend':<10} {'cos mean':>9} {'cos min':>8} {'top genre':>10} {'genres':>7} {'moods':>6} "
+          f"{'instr':>6} {'energy Δ':>9} {'dance Δ':>8} {'s/track':>8}")
+    print(f"{'torch':<10} {'':>9} {'':>8} {'':>10} {'':>7} {'':>6} {'':>6} {'':>9} {'':>8} "
+          f"{report['torch']['seconds_per_track']:>8.3f}")
+    for backend in args.backends:
+        r = report[backend]
+        print(f"{backend:<10} {r['cosine_mean']:>9.4f} {r['cosine_min']:>8.4f} {r['top_genre_agreement']:>10.1%} "
+              f"{r['genre_jaccard']:>7.2f} {r['mood_jaccard']:>6.2f} {r['instrument_jaccard']:>6.2f} "
+              f"{r['energy_abs_diff']:>9.3f} {r['danceability_abs_diff']:>8.3f} {r['seconds_per_track']:>8.3f}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
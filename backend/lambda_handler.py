@@ -2,10 +2,26 @@
 Lambda handler for MP3 Tagger-Analyzer
 Adapts the FastAPI application to work with AWS Lambda using Mangum
 """
+import os
+
+# Lambda has no separate worker and no loop that outlives a request, so it runs
+# as "all": an upload request analyzes its tracks inline after the response
+# (JobDispatcher.run_inline), as BackgroundTasks did before the job queue.
+# Threads instead of a process pool (Lambda has no /dev/shm), and no preview
+# tier, since the full analysis runs straight away.
+os.environ.setdefault("APP_ROLE", "all")
+os.environ.setdefault("ANALYSIS_EXECUTOR", "thread")
+os.environ.setdefault("PREVIEW_ENABLED", "0")
 
 from mangum import Mangum
 from app.main import app
+from app.services.startup import Startup
 
 # Create Lambda handler
-# Mangum translates API Gateway events to ASGI (FastAPI) format
+# Mangum translates API Gateway events to ASGI (FastAPI) format.
+# lifespan="off": Mangum would run startup/shutdown around every invocation,
+# so startup is completed here, once per container. The model loads on the
+# first analysis instead of in a warm-up.
+Startup.check_role()
+Startup.mark_ready()
 handler = Mangum(app, lifespan="off")
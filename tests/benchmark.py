@@ -0,0 +1,530 @@
+"""
+Performance benchmark for the analysis pipeline and the HTTP API.
+
+    python tests/benchmark.py [--out bench.json] [--compare baseline.json]
+
+Everything runs offline in a temporary DATA_DIR:
+- Fixtures: synthetic click tracks with a known BPM over a sustained triad in
+  a known key, written as WAV / FLAC / MP3 at several lengths (one above
+  STREAMING_THRESHOLD_SECONDS so the windowed path is covered too).
+- Pipeline: each analysis stage (probe, decode, DSP, CLAP embedding, scoring)
+  timed separately, with per-stage peak RSS, then AnalysisService.analyze_track
+  end to end for tracks/sec. CLAP uses a deterministic stub model by default
+  ("--model local" loads the configured checkpoint; "none" skips CLAP).
+- HTTP: /upload, /tracks, /tracks/status and the export endpoints against an
+  in-process app at several library sizes.
+The JSON report (--out) is meant to be kept per version; --compare exits with
+status 1 when a latency or throughput metric regresses beyond --tolerance.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+BACKEND_DIR = ROOT / "backend"
+
+NOTE_INDEX = {"C": 0, "C#": 1, "D": 2, "D#": 3, "E": 4, "F": 5, "F#": 6, "G": 7, "G#": 8, "A": 9, "A#": 10, "B": 11}
+
+# (name, seconds, bpm, key, scale, format); seconds=None means "just above the streaming threshold"
+DEFAULT_FIXTURES = [
+    ("short_wav", 10, 120, "A", "minor", "wav"),
+    ("short_mp3", 30, 95, "D", "major", "mp3"),
+    ("medium_flac", 120, 128, "C", "major", "flac"),
+    ("long_flac", None, 110, "E", "minor", "flac"),
+]
+
+HTTP_REPEATS = 20
+
+
+# --- Measurement helpers ---
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    arr = np.asarray(samples) * 1000.0
+    return {
+        "count": len(samples),
+        "mean_ms": float(arr.mean()),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "max_ms": float(arr.max()),
+    }
+
+
+def reset_peak_rss() -> bool:
+    """Reset the kernel's peak-RSS counter (Linux only) so the next reading covers one stage."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+class StageTimer:
+    """Collects durations and peak RSS per named stage."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.peak_mb: Dict[str, float] = {}
+        self.per_stage_rss = reset_peak_rss()
+
+    def run(self, stage: str, fn: Callable, *args, **kwargs):
+        if self.per_stage_rss:
+            reset_peak_rss()
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+        self.peak_mb[stage] = max(self.peak_mb.get(stage, 0.0), peak_rss_mb())
+        return result
+
+    def report(self) -> Dict[str, Dict]:
+        return {
+            stage: {**percentiles(samples), "peak_rss_mb": round(self.peak_mb[stage], 1)}
+            for stage, samples in self.samples.items()
+        }
+
+
+# --- Fixtures ---
+
+def synth_track(seconds: float, bpm: float, key: str, scale: str, sr: int = 44100) -> np.ndarray:
+    """Clicks on every beat (accented downbeats) over a sustained tonic triad."""
+    rng = np.random.default_rng(int(bpm * 100) + NOTE_INDEX[key])
+    n = int(seconds * sr)
+    t = np.arange(n) / sr
+
+    root = 220.0 * 2 ** ((NOTE_INDEX[key] - 9) / 12.0)  # octave around A3
+    third = 3 if scale == "minor" else 4
+    y = np.zeros(n, dtype=np.float32)
+    for semitones, gain in ((0, 0.5), (third, 0.3), (7, 0.35), (12, 0.2)):
+        y += gain * np.sin(2 * np.pi * root * 2 ** (semitones / 12.0) * t).astype(np.float32)
+    y *= 0.3
+
+    click_len = int(0.03 * sr)
+    click = (np.sin(2 * np.pi * 1500 * np.arange(click_len) / sr) * np.exp(-np.arange(click_len) / (0.005 * sr))).astype(np.float32)
+    beat = 60.0 / bpm
+    for i, start in enumerate(np.arange(0, seconds - 0.05, beat)):
+        s = int(start * sr)
+        y[s:s + click_len] += click * (1.0 if i % 4 == 0 else 0.6)
+
+    y += 0.01 * rng.standard_normal(n).astype(np.float32)
+    return (0.8 * y / np.max(np.abs(y))).astype(np.float32)
+
+
+def write_fixtures(out_dir: Path, specs) -> List[Dict]:
+    import soundfile as sf
+    from app.config import STREAMING_THRESHOLD_SECONDS
+
+    fixtures = []
+    for name, seconds, bpm, key, scale, fmt in specs:
+        if seconds is None:
+            seconds = STREAMING_THRESHOLD_SECONDS + 60
+        if fmt.upper() not in sf.available_formats():
+            print(f"[BENCH] Skipping {name}: libsndfile cannot write {fmt}")
+            continue
+        path = out_dir / f"{name}.{fmt}"
+        sf.write(path, synth_track(seconds, bpm, key, scale), 44100, format=fmt.upper())
+        fixtures.append({
+            "name": name, "path": str(path), "format": fmt, "seconds": seconds,
+            "bpm": bpm, "key": key, "scale": scale, "bytes": path.stat().st_size,
+        })
+    return fixtures
+
+
+# --- Stub CLAP ---
+
+class StubClapProcessor:
+    """Cheap deterministic features: 64 band energies per clip, token ids per text."""
+    FEATURES = 64
+
+    def __call__(self, audios=None, text=None, sampling_rate=None, return_tensors="pt", padding=False):
+        import torch
+        if text is not None:
+            ids = [[sum(map(ord, s)) % 4096] for s in text]
+            return {"input_ids": torch.tensor(ids), "attention_mask": torch.ones(len(ids), 1, dtype=torch.long)}
+        feats = []
+        for y in audios:
+            clip = np.resize(y[:sampling_rate * 10], self.FEATURES * 1024)
+            feats.append(np.abs(clip).reshape(self.FEATURES, -1).mean(axis=1))
+        return {"input_features": torch.tensor(np.stack(feats), dtype=torch.float32)}
+
+
+class StubClapModel:
+    """Random projections in place of the CLAP towers; same interface as ClapModel."""
+    DIM = 512
+
+    def __init__(self):
+        import torch
+        gen = torch.Generator().manual_seed(0)
+        self.audio_proj = torch.randn(StubClapProcessor.FEATURES, self.DIM, generator=gen)
+        self.text_table = torch.randn(4096, self.DIM, generator=gen)
+        self.logit_scale_a = torch.tensor(math.log(33.0))
+
+    def get_audio_features(self, input_features, **_):
+        return input_features @ self.audio_proj
+
+    def get_text_features(self, input_ids, **_):
+        return self.text_table[input_ids[:, 0]]
+
+
+def load_model(kind: str):
+    """(model, processor) for the CLAP stage, or (None, None) when skipped."""
+    if kind == "none":
+        return None, None
+    try:
+        import torch  # noqa: F401
+    except ImportError:
+        print("[BENCH] torch is not installed; CLAP stages are skipped")
+        return None, None
+    from app.services.analysis import AnalysisService
+    if kind == "stub":
+        # Seed the lazily loaded model so the pipeline never touches the network
+        AnalysisService._clap_model, AnalysisService._clap_processor = StubClapModel(), StubClapProcessor()
+    return AnalysisService.get_clap_model()
+
+
+# --- Pipeline benchmark ---
+
+def bench_pipeline(fixtures: List[Dict], model, processor, repeats: int, concurrency: int) -> Dict:
+    from app.config import (
+        CLAP_SAMPLE_RATE, CLAP_WINDOW_COUNT, CLAP_WINDOW_SECONDS, DSP_SAMPLE_RATE,
+        STREAMING_THRESHOLD_SECONDS, STREAM_BLOCK_FRAMES,
+    )
+    from app.services.features import decode, extract_features, load_windows, probe_duration, stream_features
+
+    timer = StageTimer()
+    accuracy = []
+    if model is not None:
+        import torch
+        from app.services.analysis import AnalysisService
+        from app.services.inference_worker import ClapInferenceWorker
+        from app.services.prompt_cache import PromptEmbeddingCache
+        from app.services.vocabulary import ALL_PROMPT_TEXTS, MODEL_ID
+        timer.run("prompt_encode", PromptEmbeddingCache.get, model, processor, MODEL_ID, ALL_PROMPT_TEXTS)
+        worker = ClapInferenceWorker.instance(model, processor)
+
+    # Untimed warm-up: first calls pay for numba JIT and audio library initialisation
+    if fixtures:
+        y, y_dsp = decode(fixtures[0]["path"], CLAP_SAMPLE_RATE)
+        extract_features(y_dsp, DSP_SAMPLE_RATE)
+
+    stage_start = time.perf_counter()
+    runs = 0
+    for fixture in fixtures:
+        for _ in range(repeats):
+            path = fixture["path"]
+            duration = timer.run("probe", probe_duration, path)
+            if duration is not None and duration > STREAMING_THRESHOLD_SECONDS:
+                stats = timer.run("dsp_stream", stream_features, path, STREAM_BLOCK_FRAMES)
+                clips = timer.run("decode_windows", load_windows, path, duration, CLAP_WINDOW_COUNT, CLAP_WINDOW_SECONDS, CLAP_SAMPLE_RATE)
+            else:
+                y, y_dsp = timer.run("decode", decode, path, CLAP_SAMPLE_RATE)
+                stats = timer.run("dsp", extract_features, y_dsp, DSP_SAMPLE_RATE)
+                clips = [y]
+
+            if model is not None:
+                def embed():
+                    return torch.cat([f.result() for f in [worker.submit(c, CLAP_SAMPLE_RATE) for c in clips]])
+                audio_embeds = timer.run("clap_embed", embed)
+                # Same as analysis: tags come from the window-averaged track embedding
+                timer.run("scoring", lambda: AnalysisService.tag_embeddings(audio_embeds.mean(dim=0, keepdim=True)))
+            runs += 1
+        accuracy.append({
+            "fixture": fixture["name"],
+            "expected_bpm": fixture["bpm"],
+            "bpm": round(stats["bpm"], 2),
+            "bpm_confidence": round(stats["bpm_confidence"], 3),
+            "expected_key": f"{fixture['key']} {fixture['scale']}",
+            "key": f"{stats['key']} {stats['key_scale']}",
+        })
+    stage_wall = time.perf_counter() - stage_start
+
+    result = {
+        "stages": timer.report(),
+        "stage_loop": {"tracks": runs, "seconds": stage_wall, "tracks_per_second": runs / stage_wall},
+        "accuracy": accuracy,
+        "per_stage_rss": timer.per_stage_rss,
+    }
+    if model is not None:
+        result["end_to_end"] = bench_end_to_end(fixtures, repeats, concurrency)
+    return result
+
+
+def bench_end_to_end(fixtures: List[Dict], repeats: int, concurrency: int) -> Dict:
+    """AnalysisService.analyze_track on a thread pool sharing the (stub) model."""
+    from app.models.schemas import Track
+    from app.services.analysis import AnalysisService
+
+    tracks = [
+        Track(filename=os.path.basename(f["path"]), filepath=f["path"])
+        for f in fixtures for _ in range(repeats)
+    ]
+    reset_peak_rss()
+    latencies: List[float] = []
+
+    def analyze(track):
+        start = time.perf_counter()
+        result = AnalysisService.analyze_track_sync(track)
+        latencies.append(time.perf_counter() - start)
+        return result.status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        statuses = list(pool.map(analyze, tracks))
+    wall = time.perf_counter() - start
+    return {
+        "tracks": len(tracks),
+        "concurrency": concurrency,
+        "failed": sum(1 for s in statuses if s != "complete"),
+        "seconds": wall,
+        "tracks_per_second": len(tracks) / wall,
+        "latency": percentiles(latencies),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+# --- HTTP benchmark ---
+
+def synthetic_track(i: int, rng: np.random.Generator):
+    from app.models.schemas import Track
+    from app.services.features import KEYS
+    genres = ["Hip Hop", "Trap", "Rock", "Pop", "Jazz", "House", "Ambient", "R&B"]
+    moods = ["Dark", "Happy", "Chill", "Aggressive", "Romantic", "Sad"]
+    return Track(
+        filename=f"track_{i:06d}.mp3",
+        filepath=f"/dev/null/{i}.mp3",
+        status="complete" if rng.random() < 0.9 else "queued",
+        duration=float(rng.uniform(60, 400)),
+        final_bpm=float(rng.integers(70, 170)),
+        final_key=KEYS[int(rng.integers(0, 12))],
+        suggested_genres=list(rng.choice(genres, size=3, replace=False)),
+        suggested_moods=list(rng.choice(moods, size=2, replace=False)),
+    )
+
+
+def wav_bytes(seed: int, seconds: float = 1.0, sr: int = 22050) -> bytes:
+    import soundfile as sf
+    buf = io.BytesIO()
+    tone = np.sin(2 * np.pi * (200 + seed) * np.arange(int(seconds * sr)) / sr).astype(np.float32)
+    sf.write(buf, tone, sr, format="WAV")
+    return buf.getvalue()
+
+
+def bench_http(library_sizes: List[int], repeats: int) -> Dict:
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.services.storage import StorageService
+
+    # No lifespan: requests are measured without the job dispatcher analyzing uploads
+    client = TestClient(app)
+    rng = np.random.default_rng(0)
+    results = {}
+    count = 0
+    ids: List[str] = []
+    upload_seed = 0
+
+    for size in sorted(library_sizes):
+        start = time.perf_counter()
+        while count < size:
+            track = synthetic_track(count, rng)
+            StorageService.save_track(track)
+            ids.append(track.id)
+            count += 1
+        populate = time.perf_counter() - start
+
+        sample_ids = ids[:100]
+        endpoints = {
+            "GET /tracks (all)": lambda: client.get("/api/tracks"),
+            "GET /tracks?limit=50": lambda: client.get("/api/tracks", params={"limit": 50}),
+            "GET /tracks?genre&bpm&limit=50": lambda: client.get(
+                "/api/tracks", params={"genre": "Rock", "bpm_min": 90, "bpm_max": 130, "limit": 50}),
+            "GET /tracks/status (100 ids)": lambda: client.get("/api/tracks/status", params={"ids": ",".join(sample_ids)}),
+            "GET /tracks/{id}": lambda: client.get(f"/api/tracks/{sample_ids[0]}"),
+            "GET /export/csv (100 ids)": lambda: client.get("/api/export/csv", params={"track_ids": ",".join(sample_ids)}),
+            "POST /export csv (all complete)": lambda: client.post("/api/export", json={"format": "csv", "all_complete": True}),
+        }
+
+        timings = {}
+        for name, call in endpoints.items():
+            samples = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                response = call()
+                samples.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{name} returned {response.status_code}: {response.text[:200]}")
+            timings[name] = percentiles(samples)
+
+        samples = []
+        for _ in range(repeats):
+            upload_seed += 1
+            payload = wav_bytes(upload_seed)
+            start = time.perf_counter()
+            response = client.post("/api/upload", files={"file": (f"upload_{upload_seed}.wav", payload, "audio/wav")})
+            samples.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"POST /upload returned {response.status_code}: {response.text[:200]}")
+            ids.append(response.json()["id"])
+            count += 1
+        timings["POST /upload (1s wav)"] = percentiles(samples)
+
+        results[str(size)] = {"populate_seconds": populate, "endpoints": timings}
+        print(f"[BENCH] HTTP at {size} tracks: GET /tracks (all) p50 "
+              f"{timings['GET /tracks (all)']['p50_ms']:.1f} ms")
+    return results
+
+
+# --- Report ---
+
+def environment() -> Dict:
+    from app import config
+    versions = {}
+    for module in ("numpy", "librosa", "soundfile", "fastapi", "pydantic", "torch", "transformers"):
+        try:
+            versions[module] = __import__(module).__version__
+        except Exception:
+            versions[module] = None
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions,
+        "config": {
+            name: getattr(config, name) for name in (
+                "STORAGE_BACKEND", "DSP_SAMPLE_RATE", "CHROMA_MODE", "STREAMING_THRESHOLD_SECONDS",
+                "CLAP_BACKEND", "CLAP_BATCH_SIZE",
+            )
+        },
+    }
+
+
+def headline_metrics(report: Dict) -> Dict[str, tuple]:
+    """Flattened metrics used for regression checks: name -> (value, higher_is_better)."""
+    metrics = {}
+    pipeline = report.get("pipeline", {})
+    for stage, stats in pipeline.get("stages", {}).items():
+        if stats.get("count"):
+            metrics[f"pipeline.{stage}.p50_ms"] = (stats["p50_ms"], False)
+    if "stage_loop" in pipeline:
+        metrics["pipeline.stage_loop.tracks_per_second"] = (pipeline["stage_loop"]["tracks_per_second"], True)
+    if "end_to_end" in pipeline:
+        metrics["pipeline.end_to_end.tracks_per_second"] = (pipeline["end_to_end"]["tracks_per_second"], True)
+    for size, data in report.get("http", {}).items():
+        for name, stats in data["endpoints"].items():
+            metrics[f"http.{size}.{name}.p50_ms"] = (stats["p50_ms"], False)
+    return metrics
+
+
+def compare_reports(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    regressions = []
+    old = headline_metrics(baseline)
+    for name, (value, higher_is_better) in headline_metrics(current).items():
+        if name not in old or not old[name][0]:
+            continue
+        ratio = value / old[name][0]
+        worse = ratio < 1 - tolerance if higher_is_better else ratio > 1 + tolerance
+        if worse:
+            regressions.append(f"{name}: {old[name][0]:.3f} -> {value:.3f} ({ratio - 1:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Baseline JSON report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown (default 0.2 = 20%%)")
+    parser.add_argument("--model", choices=("stub", "local", "none"), default="stub",
+                        help="CLAP for the pipeline: deterministic stub, the configured checkpoint, or skip")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per fixture")
+    parser.add_argument("--concurrency", type=int, default=2, help="Threads for the end-to-end run")
+    parser.add_argument("--library-sizes", default="100,1000,5000", help="Comma-separated track counts for the HTTP run")
+    parser.add_argument("--http-repeats", type=int, default=HTTP_REPEATS)
+    parser.add_argument("--skip-pipeline", action="store_true")
+    parser.add_argument("--skip-http", action="store_true")
+    parser.add_argument("--keep-data", action="store_true", help="Keep the temporary DATA_DIR for inspection")
+    args = parser.parse_args()
+
+    data_dir = Path(tempfile.mkdtemp(prefix="mp3tagger-bench-"))
+    # Must be set before the app modules read their configuration
+    os.environ["DATA_DIR"] = str(data_dir)
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    report: Dict = {"environment": environment()}
+    try:
+        if not args.skip_pipeline:
+            fixture_dir = data_dir / "fixtures"
+            fixture_dir.mkdir(parents=True)
+            print("[BENCH] Writing fixtures...")
+            fixtures = write_fixtures(fixture_dir, DEFAULT_FIXTURES)
+            report["fixtures"] = fixtures
+            model, processor = load_model(args.model)
+            report["model"] = args.model if model is not None else "none"
+            print(f"[BENCH] Pipeline: {len(fixtures)} fixture(s) x {args.repeats}, model={report['model']}")
+            report["pipeline"] = bench_pipeline(fixtures, model, processor, args.repeats, args.concurrency)
+
+        if not args.skip_http:
+            sizes = [int(s) for s in args.library_sizes.split(",") if s]
+            report["http"] = bench_http(sizes, args.http_repeats)
+    finally:
+        if not args.keep_data:
+            import shutil
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    for name, (value, _) in headline_metrics(report).items():
+        print(f"  {name:<70} {value:10.3f}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"[BENCH] Report written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.tolerance)
+        if regressions:
+            print(f"[BENCH] {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("[BENCH] No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
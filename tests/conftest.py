@@ -0,0 +1,14 @@
+"""
+Shared setup for the backend tests. The app reads DATA_DIR (and creates
+directories under it) at import time, so it is pointed at a throwaway
+directory before anything under backend/app is imported.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="mp3-tagger-tests-")
+sys.path.insert(0, str(ROOT / "backend"))
@@ -0,0 +1,137 @@
+"""Bulk edit patches, and user edits surviving analyses that finish after them."""
+import asyncio
+
+import pytest
+
+from app.api import endpoints
+from app.models.schemas import EditPatch, Track, TrackQuery, UserEdits
+from app.services import result_cache
+from app.services.engine import AnalysisEngine
+from app.services.storage import StorageService
+from app.services.storage_backends import JsonStorageBackend, SqliteStorageBackend
+
+
+def make_track(**fields) -> Track:
+    defaults = dict(
+        filename="song.mp3", filepath="/tmp/song.mp3", status="complete", final_bpm=90.0, final_key="C",
+        suggested_genres=["Rock", "Pop"], suggested_moods=["Happy"],
+    )
+    return Track(**{**defaults, **fields})
+
+
+# --- EditPatch.apply ---
+
+def test_patch_starts_from_suggestions_while_there_are_no_edits():
+    track = EditPatch(add_genres=["Jazz"], remove_genres=["pop"]).apply(make_track())
+    assert track.edits.genres == ["Rock", "Jazz"]
+    # Untouched kinds stay unedited, so they keep following the suggestions
+    assert track.edits.moods == []
+    assert track.merged()["moods"] == ["Happy"]
+
+
+def test_patch_builds_on_existing_edits_without_duplicates():
+    track = make_track(edits=UserEdits(genres=["Blues"]))
+    track = EditPatch(add_genres=["blues", "Soul"], add_styles=["Lo-fi"]).apply(track)
+    assert track.edits.genres == ["Blues", "Soul"]
+    assert track.edits.styles == ["Lo-fi"]
+
+
+def test_patch_sets_bpm_key_and_notes():
+    track = EditPatch(bpm=128, key="Am", notes="check intro").apply(make_track())
+    assert (track.edits.bpm, track.edits.key, track.edits.notes) == (128, "Am", "check intro")
+    assert (track.final_bpm, track.final_key) == (128, "Am")
+
+
+def test_empty_patch_changes_nothing():
+    track = EditPatch().apply(make_track(edits=UserEdits(bpm=100, notes="keep")))
+    assert track.edits == UserEdits(bpm=100, notes="keep")
+    assert track.final_bpm == 100
+
+
+# --- Edits vs. analyses finishing later ---
+
+@pytest.fixture(params=["sqlite", "json"])
+def storage(request, tmp_path, monkeypatch):
+    if request.param == "sqlite":
+        backend = SqliteStorageBackend(tmp_path / "library.db")
+    else:
+        backend = JsonStorageBackend(tmp_path / "results", cache_size=16)
+    monkeypatch.setattr(StorageService, "_backend", backend)
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_DIR", tmp_path / "results_cache")
+    return backend
+
+
+def analysis_result(track: Track) -> Track:
+    """What a worker hands back: its snapshot with fresh analysis fields."""
+    result = track.model_copy(deep=True)
+    result.status = "complete"
+    result.final_bpm = 90.0
+    result.final_key = "C"
+    result.suggested_genres = ["Rock"]
+    return result
+
+
+def test_edits_saved_during_analysis_survive_it(storage, monkeypatch):
+    track = make_track(status="queued", final_bpm=0.0, final_key="", content_hash="abc")
+    StorageService.save_track(track)
+
+    async def run(snapshot, profile=False):
+        # The user edits while the worker still holds the old snapshot
+        endpoints.update_edits(snapshot.id, UserEdits(bpm=128, key="Am", genres=["Jazz"]))
+        return analysis_result(snapshot)
+
+    monkeypatch.setattr(AnalysisEngine, "run", run)
+    asyncio.run(endpoints.analyze_and_save(track))
+
+    stored = StorageService.get_track(track.id)
+    assert stored.status == "complete"
+    assert stored.suggested_genres == ["Rock"]
+    assert stored.edits.genres == ["Jazz"]
+    assert (stored.final_bpm, stored.final_key) == (128, "Am")
+
+    # Filters and sorting read the edited values, not the analysis ones
+    assert [t.id for t in StorageService.list_tracks(TrackQuery(bpm_min=120))] == [track.id]
+    assert [t.id for t in StorageService.list_tracks(TrackQuery(key="am"))] == [track.id]
+    assert StorageService.list_tracks(TrackQuery(genre="Rock")) == []
+    assert [t.id for t in StorageService.list_tracks(TrackQuery(genre="jazz"))] == [track.id]
+
+
+def test_bulk_edit_during_analysis_survives_it(storage, monkeypatch):
+    tracks = [make_track(status="queued") for _ in range(3)]
+    StorageService.save_tracks(tracks)
+    ids = [t.id for t in tracks]
+
+    async def run(snapshot, profile=False):
+        StorageService.update_tracks(ids, EditPatch(add_moods=["Dark"], bpm=140).apply)
+        return analysis_result(snapshot)
+
+    monkeypatch.setattr(AnalysisEngine, "run", run)
+    asyncio.run(endpoints.analyze_and_save(tracks[0]))
+
+    for stored in StorageService.get_tracks(ids):
+        assert stored.edits.moods == ["Happy", "Dark"]
+        assert stored.final_bpm == 140
+    assert StorageService.get_track(ids[0]).status == "complete"
+
+
+def test_preview_keeps_edited_bpm_and_key(storage, monkeypatch):
+    track = make_track(status="queued", edits=UserEdits(bpm=128, key="Am"), final_bpm=128, final_key="Am")
+    StorageService.save_track(track)
+
+    async def preview(snapshot):
+        return analysis_result(snapshot)
+
+    monkeypatch.setattr(AnalysisEngine, "preview", preview)
+    asyncio.run(endpoints.run_preview_task(track.id))
+
+    stored = StorageService.get_track(track.id)
+    assert stored.status == "preview"
+    assert (stored.final_bpm, stored.final_key) == (128, "Am")
+
+
+def test_cached_result_keeps_edited_bpm_and_key():
+    track = make_track(status="queued", edits=UserEdits(key="Am"))
+    entry = {"source_track_id": "other", "final_bpm": 90.0, "final_key": "C", "suggested_genres": ["Rock"]}
+    track = result_cache.ResultCache.apply(track, entry)
+    assert (track.final_bpm, track.final_key) == (90.0, "Am")
+    assert track.status == "complete"
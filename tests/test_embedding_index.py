@@ -0,0 +1,93 @@
+"""EmbeddingIndex: add/update, search ordering, growth and reopening from disk."""
+import numpy as np
+import pytest
+
+from app.services import embedding_index
+from app.services.embedding_index import EmbeddingIndex
+
+
+def unit(*values):
+    v = np.asarray(values, dtype=np.float32)
+    return (v / np.linalg.norm(v)).tolist()
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return tmp_path / "index"
+
+
+def seeded(directory):
+    index = EmbeddingIndex(directory)
+    index.add("east", unit(1, 0, 0))
+    index.add("north-east", unit(1, 1, 0))
+    index.add("north", unit(0, 1, 0))
+    index.add("up", unit(0, 0, 1))
+    return index
+
+
+def test_search_orders_by_cosine_similarity(directory):
+    index = seeded(directory)
+    hits = index.search(unit(1, 0.1, 0), limit=3)
+    assert [t for t, _ in hits] == ["east", "north-east", "north"]
+    assert hits[0][1] > hits[1][1] > hits[2][1]
+    # Queries need not be normalized
+    assert index.search([10, 1, 0], limit=3) == hits
+
+
+def test_search_honours_limit_and_exclude(directory):
+    index = seeded(directory)
+    assert [t for t, _ in index.search(unit(1, 0, 0), limit=2, exclude=["east"])] == ["north-east", "north"]
+    assert len(index.search(unit(1, 0, 0), limit=10)) == 4
+
+
+def test_add_replaces_an_existing_embedding(directory):
+    index = seeded(directory)
+    index.add("up", unit(1, 0.2, 0))
+    assert len(index) == 4
+    assert index.search(unit(1, 0.2, 0), limit=1)[0][0] == "up"
+    assert index.get("up") == pytest.approx(unit(1, 0.2, 0), abs=1e-3)
+
+
+def test_get_many_returns_only_indexed_ids(directory):
+    index = seeded(directory)
+    found, matrix = index.get_many(["north", "missing", "east"])
+    assert found == ["north", "east"]
+    assert matrix.shape == (2, 3)
+    assert matrix.dtype == np.float32
+    assert index.get("missing") is None
+
+
+def test_reopened_index_sees_the_same_rows(directory):
+    original = seeded(directory)
+    original.add("north", unit(0, 1, 1))
+    expected = original.search(unit(0, 1, 0.5), limit=4)
+
+    reopened = EmbeddingIndex(directory)
+    assert len(reopened) == 4
+    assert reopened.search(unit(0, 1, 0.5), limit=4) == expected
+    assert reopened.get("north") == pytest.approx(unit(0, 1, 1), abs=1e-3)
+
+
+def test_readers_pick_up_rows_written_by_another_instance(directory):
+    reader = seeded(directory)
+    assert reader.search(unit(1, 0, 0), limit=1)[0][0] == "east"
+
+    EmbeddingIndex(directory).add("exact", unit(1, 0, 0.001))
+    assert reader.search(unit(1, 0, 0.001), limit=1)[0][0] == "exact"
+    assert len(reader) == 5
+
+
+def test_matrix_grows_past_its_initial_capacity(directory, monkeypatch):
+    monkeypatch.setattr(embedding_index, "INITIAL_CAPACITY", 2)
+    index = EmbeddingIndex(directory)
+    for i in range(5):
+        index.add(f"t{i}", unit(1, i, 0))
+    reopened = EmbeddingIndex(directory)
+    assert len(reopened) == 5
+    assert reopened.search(unit(1, 4, 0), limit=1)[0][0] == "t4"
+
+
+def test_dimension_mismatch_is_rejected(directory):
+    index = seeded(directory)
+    with pytest.raises(ValueError):
+        index.add("flat", [1.0, 0.0])
@@ -0,0 +1,88 @@
+"""Export rows in CSV / NDJSON / JSON, selection by IDs or filter, and paging."""
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.schemas import ExportFilter, ExportRequest, Track, UserEdits
+from app.services import export
+from app.services.export import CSV_HEADERS, ExportService
+from app.services.storage import StorageService
+from app.services.storage_backends import SqliteStorageBackend
+
+TRICKY_NOTES = 'Intro says "yo", then\na comma, and ünïcode'
+
+
+@pytest.fixture
+def tracks(tmp_path, monkeypatch):
+    monkeypatch.setattr(StorageService, "_backend", SqliteStorageBackend(tmp_path / "library.db"))
+    monkeypatch.setattr(export, "EXPORT_PAGE_SIZE", 2)
+    start = datetime(2024, 1, 1)
+    library = [
+        Track(
+            filename='Beat, "Final".mp3', filepath="/a.mp3", status="complete", upload_date=start,
+            final_bpm=127.6, final_key="Am", suggested_genres=["House", "Deep House"], suggested_moods=["Dark"],
+            suggested_styles=["Club"], edits=UserEdits(notes=TRICKY_NOTES),
+        ),
+        Track(
+            filename="edited.mp3", filepath="/b.mp3", status="complete", upload_date=start + timedelta(minutes=1),
+            final_bpm=90.0, final_key="C", suggested_genres=["Rock"],
+            edits=UserEdits(bpm=92, key="G", genres=["Blues"]),
+        ),
+        Track(filename="queued.mp3", filepath="/c.mp3", status="queued", upload_date=start + timedelta(minutes=2)),
+    ]
+    for offset, i in enumerate(range(3, 6)):
+        library.append(Track(
+            filename=f"extra{i}.mp3", filepath=f"/{i}.mp3", status="complete",
+            upload_date=start + timedelta(minutes=i), final_bpm=100.0 + offset, suggested_genres=["House"],
+        ))
+    StorageService.save_tracks(library)
+    return library
+
+
+def export_text(**fields) -> str:
+    return "".join(ExportService.stream(ExportRequest(**fields)))
+
+
+def test_csv_quotes_commas_quotes_and_newlines(tracks):
+    body = export_text(format="csv", track_ids=[tracks[0].id, tracks[1].id])
+    rows = list(csv.reader(io.StringIO(body)))
+    assert rows[0] == CSV_HEADERS
+    assert rows[1] == ['Beat, "Final".mp3', "128", "Am", "House, Deep House", "Dark", "Club", TRICKY_NOTES]
+    # Edits win over the analysis
+    assert rows[2] == ["edited.mp3", "92", "G", "Blues", "", "", ""]
+    assert len(rows) == 3
+
+
+def test_ndjson_has_one_object_per_line(tracks):
+    body = export_text(format="ndjson", track_ids=[tracks[1].id, tracks[0].id])
+    lines = body.splitlines()
+    assert len(lines) == 2
+    first, second = (json.loads(line) for line in lines)
+    assert first == {
+        "id": tracks[1].id, "filename": "edited.mp3", "bpm": 92, "key": "G",
+        "genres": ["Blues"], "moods": [], "styles": [], "notes": "",
+    }
+    assert second["notes"] == TRICKY_NOTES
+    assert "ünïcode" in body
+
+
+def test_json_is_one_array_and_empty_selections_stay_valid(tracks):
+    rows = json.loads(export_text(format="json", track_ids=[t.id for t in tracks]))
+    assert [r["id"] for r in rows] == [t.id for t in tracks]
+    assert rows[0]["genres"] == ["House", "Deep House"]
+
+    assert json.loads(export_text(format="json", track_ids=[])) == []
+    assert export_text(format="ndjson", track_ids=["missing"]) == ""
+    assert list(csv.reader(io.StringIO(export_text(format="csv", track_ids=[])))) == [CSV_HEADERS]
+
+
+def test_filtered_export_pages_through_every_match(tracks):
+    rows = json.loads(export_text(format="json", all_complete=True))
+    # Oldest first, across pages of EXPORT_PAGE_SIZE
+    assert [r["filename"] for r in rows] == [t.filename for t in tracks if t.status == "complete"]
+
+    rows = json.loads(export_text(format="json", filter=ExportFilter(genre="house", bpm_min=101)))
+    assert [r["filename"] for r in rows] == ["Beat, \"Final\".mp3", "extra4.mp3", "extra5.mp3"]
@@ -0,0 +1,37 @@
+"""Streamed DSP features agree with the full-decode path."""
+import numpy as np
+import pytest
+
+librosa = pytest.importorskip("librosa")
+sf = pytest.importorskip("soundfile")
+
+from app.config import DSP_SAMPLE_RATE
+from app.services.features import extract_features, stream_features
+
+BPM = 120.0
+SECONDS = 40
+
+
+def click_track(sr: int) -> np.ndarray:
+    """Clicks at BPM over a sustained A major triad."""
+    t = np.arange(int(SECONDS * sr)) / sr
+    chord = sum(np.sin(2 * np.pi * f * t) for f in (220.0, 277.18, 329.63)) * 0.1
+    clicks = librosa.clicks(times=np.arange(0, SECONDS, 60.0 / BPM), sr=sr, length=t.size)
+    return (chord + 0.5 * clicks).astype(np.float32)
+
+
+@pytest.mark.parametrize("sr", [44100, 48000])
+def test_streamed_features_match_full_decode(tmp_path, sr):
+    path = tmp_path / f"clicks_{sr}.wav"
+    sf.write(path, click_track(sr), sr)
+
+    y, _ = librosa.load(path, sr=DSP_SAMPLE_RATE)
+    full = extract_features(y, DSP_SAMPLE_RATE)
+    # Small blocks so the track spans many of them
+    streamed = stream_features(str(path), block_frames=64)
+
+    # beat_track quantizes tempo to whole autocorrelation lags (117.5 / 123.0 BPM around 120)
+    assert full["bpm"] == pytest.approx(BPM, rel=0.03)
+    assert streamed["bpm"] == pytest.approx(full["bpm"], rel=0.02)
+    assert (streamed["key"], streamed["key_scale"]) == (full["key"], full["key_scale"])
+    assert streamed["brightness"] == pytest.approx(full["brightness"], rel=0.1)
@@ -0,0 +1,112 @@
+"""Header-based format detection and zip archive ingest."""
+import os
+import zipfile
+
+import pytest
+
+from app.services.ingest import UploadRejected, UploadWriter, detect_format, extract_archive
+
+MP3 = b"ID3\x04\x00\x00\x00\x00\x00\x00" + b"\x00" * 64
+WAV = b"RIFF\x24\x00\x00\x00WAVEfmt " + b"\x00" * 64
+
+
+def ftyp(brand: bytes) -> bytes:
+    return b"\x00\x00\x00\x20ftyp" + brand + b"\x00" * 20
+
+
+@pytest.mark.parametrize("head, expected", [
+    (MP3, "mp3"),
+    (b"\xff\xfb\x90\x00", "mp3"),
+    (b"fLaC\x00\x00\x00\x22", "flac"),
+    (WAV, "wav"),
+    (ftyp(b"M4A "), "m4a"),
+    (ftyp(b"M4B "), "m4a"),
+    (ftyp(b"mp42"), "m4a"),
+    (ftyp(b"isom"), "m4a"),
+    (ftyp(b"dash"), "m4a"),
+    (b"PK\x03\x04\x14\x00", "zip"),
+])
+def test_detect_format_recognises_supported_headers(head, expected):
+    assert detect_format(head[:12]) == expected
+
+
+@pytest.mark.parametrize("head", [
+    ftyp(b"heic"),      # HEIC image
+    ftyp(b"avif"),      # AVIF image
+    ftyp(b"3gp4"),      # 3GP video
+    ftyp(b"qt  "),      # QuickTime video
+    b"\xff\xf1\x50\x80",  # AAC/ADTS: frame sync with layer bits 00
+    b"%PDF-1.7\n",
+    b"",
+])
+def test_detect_format_rejects_everything_else(head):
+    assert detect_format(head[:12]) is None
+
+
+def test_upload_writer_rejects_non_audio_ftyp(tmp_path):
+    writer = UploadWriter("clip.m4a", tmp_path, max_bytes=1024)
+    with pytest.raises(UploadRejected):
+        writer.feed(ftyp(b"heic"))
+    writer.abort()
+    assert list(tmp_path.iterdir()) == []
+
+
+def make_zip(path, members):
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    return path
+
+
+def ingest(tmp_path, members, max_bytes=1024, max_files=10):
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    archive = make_zip(tmp_path / "batch.zip", members)
+    tracks, rejected = extract_archive(archive, upload_dir, max_bytes, max_files, chunk_size=16)
+    return upload_dir, tracks, rejected
+
+
+def test_extract_archive_ingests_audio_and_skips_metadata(tmp_path):
+    upload_dir, tracks, rejected = ingest(tmp_path, [
+        ("album/one.mp3", MP3),
+        ("album/two.wav", WAV),
+        ("album/", b""),
+        ("__MACOSX/album/._one.mp3", b"junk"),
+        ("album/.DS_Store", b"junk"),
+    ])
+    assert sorted(t.filename for t in tracks) == ["one.mp3", "two.wav"]
+    assert rejected == []
+    assert sorted(p.suffix for p in upload_dir.iterdir()) == [".mp3", ".wav"]
+
+
+def test_extract_archive_keeps_traversal_paths_inside_upload_dir(tmp_path):
+    upload_dir, tracks, rejected = ingest(tmp_path, [("../../escape.mp3", MP3), ("/abs/root.mp3", WAV)])
+    assert sorted(t.filename for t in tracks) == ["escape.mp3", "root.mp3"]
+    for track in tracks:
+        assert os.path.dirname(track.filepath) == str(upload_dir)
+    assert not (tmp_path / "escape.mp3").exists()
+    assert not (tmp_path.parent / "escape.mp3").exists()
+
+
+def test_extract_archive_enforces_member_count(tmp_path):
+    _, tracks, rejected = ingest(tmp_path, [(f"{i}.mp3", MP3 + bytes([i])) for i in range(5)], max_files=3)
+    assert len(tracks) == 3
+    assert [r.status_code for r in rejected] == [413, 413]
+
+
+def test_extract_archive_enforces_member_size(tmp_path):
+    upload_dir, tracks, rejected = ingest(tmp_path, [("big.mp3", MP3 + b"\x00" * 200), ("ok.mp3", MP3)], max_bytes=100)
+    assert [t.filename for t in tracks] == ["ok.mp3"]
+    assert [(r.filename, r.status_code) for r in rejected] == [("big.mp3", 413)]
+    assert not any(p.suffix == ".part" for p in upload_dir.iterdir())
+
+
+def test_extract_archive_rejects_non_audio_members(tmp_path):
+    upload_dir, tracks, rejected = ingest(tmp_path, [
+        ("notes.txt", b"just some text here"),
+        ("cover.mp3", ftyp(b"avif")),
+        ("song.mp3", MP3),
+    ])
+    assert [t.filename for t in tracks] == ["song.mp3"]
+    assert sorted(r.filename for r in rejected) == ["cover.mp3", "notes.txt"]
+    assert len(list(upload_dir.iterdir())) == 1
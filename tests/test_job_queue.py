@@ -0,0 +1,166 @@
+"""JobQueue state transitions (claim, retry with backoff, leases, recovery) and inline draining."""
+import asyncio
+import time
+
+import pytest
+
+from app.services import job_queue
+from app.services.job_queue import JobDispatcher, JobQueue
+
+
+@pytest.fixture(autouse=True)
+def fresh_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOBS_DB", tmp_path / "jobs.db")
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(job_queue, "JOB_RETRY_BACKOFF_SECONDS", 10.0)
+    monkeypatch.setattr(JobQueue, "_conn", None)
+    yield
+    JobQueue._db().close()
+
+
+def job_row(job_id):
+    return dict(JobQueue._db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def make_due(job_id):
+    JobQueue._db().execute("UPDATE jobs SET available_at = 0 WHERE id = ?", (job_id,))
+
+
+def test_enqueue_skips_tracks_with_an_active_job():
+    first = JobQueue.enqueue("a")
+    assert JobQueue.enqueue("a") == first
+    assert JobQueue.enqueue_many(["a", "b", "b", "c"]) == 2
+    # Each queue has its own jobs
+    JobQueue.enqueue("a", queue="preview")
+    assert JobQueue.stats("full")["queued"] == 3
+    assert JobQueue.stats("preview")["queued"] == 1
+
+
+def test_claim_takes_highest_priority_first_and_leases_it():
+    JobQueue.enqueue("low")
+    JobQueue.enqueue("high", priority=5)
+
+    job = JobQueue.claim()
+    assert job["track_id"] == "high"
+    assert job["attempts"] == 1
+    row = job_row(job["id"])
+    assert row["status"] == "running"
+    assert row["owner"] == job_queue.WORKER_ID
+    assert row["lease_until"] > time.time()
+
+    assert JobQueue.claim()["track_id"] == "low"
+    assert JobQueue.claim() is None
+    assert JobQueue.claim("preview") is None
+
+
+def test_complete_marks_done():
+    JobQueue.enqueue("a")
+    job = JobQueue.claim()
+    JobQueue.complete(job)
+    assert job_row(job["id"])["status"] == "done"
+    # A finished track can be queued again
+    assert JobQueue.enqueue("a") != job["id"]
+
+
+def test_fail_retries_with_exponential_backoff_then_gives_up():
+    job_id = JobQueue.enqueue("a")
+
+    job = JobQueue.claim()
+    before = time.time()
+    assert JobQueue.fail(job, "boom") == "retry"
+    row = job_row(job_id)
+    assert row["status"] == "queued"
+    assert row["last_error"] == "boom"
+    assert row["available_at"] == pytest.approx(before + 10, abs=1)
+    # Not due yet
+    assert JobQueue.claim() is None
+
+    make_due(job_id)
+    job = JobQueue.claim()
+    assert job["attempts"] == 2
+    before = time.time()
+    assert JobQueue.fail(job, "boom") == "retry"
+    assert job_row(job_id)["available_at"] == pytest.approx(before + 20, abs=1)
+
+    make_due(job_id)
+    job = JobQueue.claim()
+    assert job["attempts"] == 3
+    assert JobQueue.fail(job, "still broken") == "failed"
+    row = job_row(job_id)
+    assert row["status"] == "failed"
+    assert row["last_error"] == "still broken"
+    assert JobQueue.claim() is None
+
+
+def test_recover_requeues_only_expired_leases():
+    JobQueue.enqueue_many(["live", "dead"])
+    live = JobQueue.claim()
+    dead = JobQueue.claim()
+    JobQueue._db().execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() - 1, dead["id"]))
+
+    assert JobQueue.recover() == 1
+    assert job_row(live["id"])["status"] == "running"
+    row = job_row(dead["id"])
+    assert row["status"] == "queued"
+    assert row["owner"] is None
+
+
+def test_renew_extends_the_lease():
+    JobQueue.enqueue("a")
+    job = JobQueue.claim()
+    JobQueue._db().execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() + 1, job["id"]))
+
+    assert JobQueue.renew([job["id"]]) == 1
+    assert job_row(job["id"])["lease_until"] > time.time() + 1
+    assert JobQueue.recover() == 0
+
+
+def test_worker_that_lost_its_lease_cannot_finish_the_job():
+    JobQueue.enqueue("a")
+    stale = JobQueue.claim()
+    JobQueue._db().execute("UPDATE jobs SET lease_until = 0 WHERE id = ?", (stale["id"],))
+    JobQueue.recover()
+    current = JobQueue.claim()
+    JobQueue._db().execute("UPDATE jobs SET owner = 'other-host:1' WHERE id = ?", (current["id"],))
+
+    JobQueue.complete(stale)
+    assert JobQueue.fail(stale, "late") == "lost"
+    row = job_row(current["id"])
+    assert row["status"] == "running"
+    assert row["owner"] == "other-host:1"
+
+
+def test_failure_after_losing_the_lease_is_not_counted_as_permanent(monkeypatch, capsys):
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 1)
+    JobQueue.enqueue("a")
+
+    async def handler(track_id):
+        # Meanwhile the lease ran out and another worker took the job
+        JobQueue._db().execute("UPDATE jobs SET owner = 'other-host:1', lease_until = ?", (time.time() + 60,))
+        return False
+
+    failures = job_queue.JOB_FAILURES_TOTAL.render()
+    retried = []
+    asyncio.run(JobDispatcher.run_inline({"full": handler}, on_retry=retried.append))
+
+    assert job_queue.JOB_FAILURES_TOTAL.render() == failures
+    assert retried == []
+    assert "failed permanently" not in capsys.readouterr().out
+    assert JobQueue.stats()["running"] == 1
+
+
+def test_run_inline_drains_due_jobs_and_leaves_retries_queued():
+    JobQueue.enqueue_many(["a", "b", "c"])
+    seen = []
+
+    async def handler(track_id):
+        seen.append(track_id)
+        return track_id != "b"
+
+    retried = []
+    ran = asyncio.run(JobDispatcher.run_inline({"full": handler}, on_retry=retried.append))
+
+    assert ran == 3
+    assert seen == ["a", "b", "c"]
+    assert retried == ["b"]
+    assert JobQueue.stats() == {"queued": 1, "running": 0, "done": 2, "failed": 0}
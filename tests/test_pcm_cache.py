@@ -0,0 +1,86 @@
+"""PcmCache: round trips, least-recently-used eviction under PCM_CACHE_MAX_BYTES."""
+import os
+
+import numpy as np
+import pytest
+
+from app.services import pcm_cache
+from app.services.pcm_cache import PcmCache
+
+SAMPLES = 1000
+# One cached signal: float32 samples plus the .npy header
+FILE_BYTES = SAMPLES * 4 + 128
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(pcm_cache, "PCM_CACHE_DIR", tmp_path / "pcm")
+    monkeypatch.setattr(pcm_cache, "PCM_CACHE_MAX_BYTES", 3 * FILE_BYTES)
+    return tmp_path / "pcm"
+
+
+def signal(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(SAMPLES).astype(np.float32)
+
+
+def put_at(content_hash: str, age: int):
+    """Store a signal and backdate it; a larger age is older."""
+    PcmCache.put(content_hash, 22050, signal(len(content_hash)))
+    path = PcmCache._path(content_hash, 22050)
+    ns = 1_000_000_000_000_000_000 - age * 1_000_000_000
+    os.utime(path, ns=(ns, ns))
+
+
+def cached(cache_dir):
+    return sorted(p.name.split("_")[0] for p in cache_dir.glob("*.npy"))
+
+
+def test_round_trip_is_a_read_only_mapping():
+    y = signal(1)
+    PcmCache.put("abc", 48000, y)
+    hit = PcmCache.get("abc", 48000)
+    assert np.array_equal(hit, y)
+    assert not hit.flags.writeable
+    # Keyed by sample rate as well as content
+    assert PcmCache.get("abc", 22050) is None
+
+
+def test_oldest_files_are_evicted_past_the_limit(cache_dir):
+    put_at("a", age=30)
+    put_at("bb", age=20)
+    put_at("ccc", age=10)
+    assert cached(cache_dir) == ["a", "bb", "ccc"]
+
+    PcmCache.put("dddd", 22050, signal(4))
+    assert cached(cache_dir) == ["bb", "ccc", "dddd"]
+    total = sum(p.stat().st_size for p in cache_dir.glob("*.npy"))
+    assert total <= pcm_cache.PCM_CACHE_MAX_BYTES
+
+
+def test_a_hit_makes_a_file_most_recently_used(cache_dir):
+    put_at("a", age=30)
+    put_at("bb", age=20)
+    put_at("ccc", age=10)
+
+    assert PcmCache.get("a", 22050) is not None
+    PcmCache.put("dddd", 22050, signal(4))
+    assert cached(cache_dir) == ["a", "ccc", "dddd"]
+
+
+def test_evict_to_a_smaller_budget(cache_dir):
+    for age, content_hash in enumerate(["new", "mid", "old"]):
+        put_at(content_hash, age=age)
+    assert PcmCache.evict(FILE_BYTES) == 2
+    assert cached(cache_dir) == ["new"]
+    assert PcmCache.evict(0) == 1
+    assert PcmCache.evict(0) == 0
+
+
+def test_oversized_signals_and_disabled_cache_store_nothing(cache_dir, monkeypatch):
+    PcmCache.put("huge", 22050, np.zeros(4 * SAMPLES, dtype=np.float32))
+    assert not cache_dir.exists() or cached(cache_dir) == []
+
+    monkeypatch.setattr(pcm_cache, "PCM_CACHE_MAX_BYTES", 0)
+    PcmCache.put("abc", 22050, signal(1))
+    assert PcmCache.get("abc", 22050) is None
+    assert not cache_dir.exists() or cached(cache_dir) == []
@@ -0,0 +1,101 @@
+"""Duplicate uploads reuse a finished analysis, scoped to ANALYSIS_VERSION."""
+import asyncio
+
+import pytest
+
+from app.api import endpoints
+from app.models.schemas import AnalysisResult, Track, UserEdits
+from app.services import job_queue, result_cache
+from app.services.embedding_index import EmbeddingIndex
+from app.services.job_queue import JobQueue
+from app.services.result_cache import ResultCache
+from app.services.storage import StorageService
+from app.services.storage_backends import SqliteStorageBackend
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    monkeypatch.setattr(StorageService, "_backend", SqliteStorageBackend(tmp_path / "library.db"))
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_DIR", tmp_path / "results_cache")
+    monkeypatch.setattr(job_queue, "JOBS_DB", tmp_path / "jobs.db")
+    monkeypatch.setattr(JobQueue, "_conn", None)
+    monkeypatch.setattr(endpoints, "PREVIEW_ENABLED", False)
+    monkeypatch.setattr(EmbeddingIndex, "_instance", EmbeddingIndex(tmp_path / "index"))
+    yield
+    JobQueue._db().close()
+
+
+def analyzed(content_hash: str = "abc123") -> Track:
+    """The first upload of some audio, after a full analysis."""
+    track = Track(
+        filename="original.mp3", filepath=f"/uploads/{content_hash}.mp3", content_hash=content_hash,
+        status="complete", duration=181.5, final_bpm=124.0, final_key="Am",
+        suggested_genres=["House"], suggested_moods=["Energetic"], suggested_styles=["Club"],
+        analysis=AnalysisResult(bpm=124.0, key="Am", duration=181.5, genres=["House"], moods=["Energetic"]),
+        provenance={"bpm": "full", "key": "full"}, embedding=[0.6, 0.8],
+    )
+    ResultCache.store(track)
+    return track
+
+
+def duplicate(original: Track, **fields) -> Track:
+    return Track(filename="copy.mp3", filepath=original.filepath, content_hash=original.content_hash, **fields)
+
+
+def test_duplicate_upload_reuses_cached_analysis():
+    original = analyzed()
+    copy = duplicate(original, edits=UserEdits(genres=["Deep House"], notes="b-side"))
+
+    endpoints.queue_new_tracks([copy])
+
+    stored = StorageService.get_track(copy.id)
+    assert stored.status == "complete"
+    assert (stored.duration, stored.final_bpm, stored.final_key) == (181.5, 124.0, "Am")
+    assert stored.suggested_genres == ["House"]
+    assert stored.analysis == original.analysis
+    # The cached embedding is indexed (as float16) for the copy, so it shows up in similarity search
+    assert EmbeddingIndex.instance().get(copy.id).tolist() == pytest.approx(original.embedding, abs=1e-3)
+    # Per-track fields stay the copy's own
+    assert (stored.filename, stored.edits.notes) == ("copy.mp3", "b-side")
+    assert stored.merged()["genres"] == ["Deep House"]
+    assert JobQueue.stats()["queued"] == 0
+
+
+def test_queued_duplicate_keeps_edits_and_bpm_override():
+    original = analyzed()
+    copy = duplicate(original, status="queued")
+    StorageService.save_track(copy)
+    # Edited while its job waited; a duplicate finished in the meantime
+    endpoints.update_edits(copy.id, UserEdits(bpm=128, key="F#m", genres=["Techno"]))
+
+    assert asyncio.run(endpoints.run_analysis_task(copy.id)) is True
+
+    stored = StorageService.get_track(copy.id)
+    assert stored.status == "complete"
+    assert (stored.final_bpm, stored.final_key) == (128, "F#m")
+    assert stored.edits.genres == ["Techno"]
+    assert stored.analysis.bpm == 124.0
+    # The cached entry still describes the audio, not the copy's edits
+    assert ResultCache.lookup(original.content_hash)["final_bpm"] == 124.0
+
+
+def test_changed_analysis_version_misses_the_cache(monkeypatch):
+    original = analyzed()
+    assert ResultCache.lookup(original.content_hash) is not None
+
+    monkeypatch.setattr(result_cache, "ANALYSIS_VERSION", "new-vocabulary")
+    assert ResultCache.lookup(original.content_hash) is None
+
+    copy = duplicate(original, status="queued")
+    StorageService.save_track(copy)
+    endpoints.queue_new_tracks([copy])
+
+    assert StorageService.get_track(copy.id).status == "queued"
+    assert JobQueue.stats()["queued"] == 1
+
+
+def test_incomplete_or_unhashed_tracks_are_not_cached():
+    ResultCache.store(Track(filename="a.mp3", filepath="/a.mp3", content_hash="h", status="failed"))
+    ResultCache.store(Track(filename="b.mp3", filepath="/b.mp3", status="complete"))
+    assert ResultCache.lookup("h") is None
+    assert ResultCache.lookup(None) is None
@@ -0,0 +1,149 @@
+"""Library scanner: new, unchanged, touched-but-identical and modified files."""
+import asyncio
+import os
+
+import pytest
+
+from app.api import endpoints
+from app.models.schemas import UserEdits
+from app.services.scanner import LibraryScanner, ScanManifest
+from app.services.storage import StorageService
+from app.services.storage_backends import SqliteStorageBackend
+
+MP3 = b"ID3\x04\x00\x00\x00\x00\x00\x00" + b"\x00" * 64
+
+
+@pytest.fixture
+def analyzed(tmp_path, monkeypatch):
+    """Track IDs passed to the (stubbed) analysis, in call order; IDs in `failing` fail."""
+    monkeypatch.setattr(StorageService, "_backend", SqliteStorageBackend(tmp_path / "library.db"))
+    calls, failing = [], set()
+
+    async def run_analysis_task(track_id):
+        calls.append(track_id)
+        ok = track_id not in failing
+        StorageService.update_track_status(track_id, "complete" if ok else "failed")
+        return ok
+
+    monkeypatch.setattr(endpoints, "run_analysis_task", run_analysis_task)
+    return calls, failing
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "music"
+    (root / "album").mkdir(parents=True)
+    (root / "album" / "one.mp3").write_bytes(MP3 + b"one")
+    (root / "two.mp3").write_bytes(MP3 + b"two")
+    (root / "notes.mp3").write_bytes(b"not really audio")
+    (root / "cover.jpg").write_bytes(b"\xff\xd8\xff")
+    (root / ".hidden").mkdir()
+    (root / ".hidden" / "three.mp3").write_bytes(MP3 + b"three")
+    return root
+
+
+def scan(tmp_path, root, force=False):
+    manifest = ScanManifest(tmp_path / "scan.db")
+    try:
+        return asyncio.run(LibraryScanner(manifest, concurrency=2, force=force).scan([root]))
+    finally:
+        manifest.close()
+
+
+def manifest_entry(tmp_path, path):
+    manifest = ScanManifest(tmp_path / "scan.db")
+    try:
+        return manifest.get(str(path.resolve()))
+    finally:
+        manifest.close()
+
+
+def test_first_scan_analyzes_audio_and_skips_the_rest(tmp_path, library, analyzed):
+    calls, _ = analyzed
+    counts = scan(tmp_path, library)
+    assert (counts["found"], counts["analyzed"], counts["skipped"]) == (3, 2, 1)
+    assert len(calls) == 2
+
+    entry = manifest_entry(tmp_path, library / "two.mp3")
+    track = StorageService.get_track(entry["track_id"])
+    assert entry["status"] == "complete"
+    assert (track.filename, track.filepath, track.status) == ("two.mp3", str((library / "two.mp3").resolve()), "complete")
+    assert track.content_hash == entry["content_hash"]
+
+
+def test_unchanged_files_are_skipped_on_stat_alone(tmp_path, library, analyzed, monkeypatch):
+    calls, _ = analyzed
+    scan(tmp_path, library)
+    calls.clear()
+
+    def no_hashing(path):
+        raise AssertionError(f"{path} was hashed")
+
+    monkeypatch.setattr("app.services.scanner.file_sha256", no_hashing)
+    counts = scan(tmp_path, library)
+    assert (counts["unchanged"], counts["analyzed"]) == (2, 0)
+    assert calls == []
+
+
+def test_touched_but_identical_file_only_updates_the_manifest(tmp_path, library, analyzed):
+    calls, _ = analyzed
+    scan(tmp_path, library)
+    calls.clear()
+    path = library / "two.mp3"
+    before = manifest_entry(tmp_path, path)
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 5_000_000_000))
+
+    counts = scan(tmp_path, library)
+    assert (counts["unchanged"], counts["analyzed"]) == (2, 0)
+    assert calls == []
+    after = manifest_entry(tmp_path, path)
+    assert after["mtime_ns"] == st.st_mtime_ns + 5_000_000_000
+    assert (after["track_id"], after["content_hash"]) == (before["track_id"], before["content_hash"])
+
+
+def test_modified_file_is_reanalyzed_as_the_same_track(tmp_path, library, analyzed):
+    calls, _ = analyzed
+    scan(tmp_path, library)
+    calls.clear()
+    path = library / "album" / "one.mp3"
+    before = manifest_entry(tmp_path, path)
+    endpoints.update_edits(before["track_id"], UserEdits(notes="remaster?"))
+    path.write_bytes(MP3 + b"one, remastered")
+
+    counts = scan(tmp_path, library)
+    assert (counts["unchanged"], counts["analyzed"]) == (1, 1)
+    assert calls == [before["track_id"]]
+    after = manifest_entry(tmp_path, path)
+    assert after["track_id"] == before["track_id"]
+    assert after["content_hash"] != before["content_hash"]
+    assert StorageService.get_track(before["track_id"]).edits.notes == "remaster?"
+
+
+def test_failed_files_are_retried_and_removed_files_reported(tmp_path, library, analyzed):
+    calls, failing = analyzed
+    scan(tmp_path, library)
+    two = manifest_entry(tmp_path, library / "two.mp3")["track_id"]
+    failing.add(two)
+    (library / "two.mp3").write_bytes(MP3 + b"two, changed")
+
+    counts = scan(tmp_path, library)
+    assert counts["failed"] == 1
+    assert manifest_entry(tmp_path, library / "two.mp3")["status"] == "failed"
+
+    # Failed entries are retried even though their stat is unchanged
+    failing.clear()
+    calls.clear()
+    (library / "album" / "one.mp3").unlink()
+    counts = scan(tmp_path, library)
+    assert calls == [two]
+    assert (counts["analyzed"], counts["missing"]) == (1, 1)
+
+
+def test_force_reanalyzes_everything(tmp_path, library, analyzed):
+    calls, _ = analyzed
+    scan(tmp_path, library)
+    calls.clear()
+    counts = scan(tmp_path, library, force=True)
+    assert counts["analyzed"] == 2
+    assert len(calls) == 2
@@ -0,0 +1,95 @@
+"""Single-pass prompt scoring matches the per-group ClapModel path it replaced."""
+import math
+import zlib
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("librosa")
+
+from app.services import prompt_cache
+from app.services.analysis import AnalysisService
+from app.services.prompt_cache import PromptEmbeddingCache
+from app.services.vocabulary import (
+    GENRE_TEXT_MAP, INSTRUMENT_PROMPTS, MOOD_PROMPTS, PROMPT_GROUP_SLICES, PROMPT_GROUPS,
+)
+
+DIM = 32
+
+
+class StubClap:
+    """Deterministic, unnormalized embeddings; forward() mirrors ClapModel.logits_per_audio."""
+
+    def __init__(self):
+        self.logit_scale_a = torch.nn.Parameter(torch.tensor(math.log(30.0)))
+
+    def get_text_features(self, texts):
+        rows = [torch.randn(DIM, generator=torch.Generator().manual_seed(zlib.crc32(t.encode()))) for t in texts]
+        return torch.stack(rows) * 3.0
+
+    def logits_per_audio(self, audio, texts):
+        a = audio / audio.norm(dim=-1, keepdim=True)
+        t = self.get_text_features(texts)
+        t = t / t.norm(dim=-1, keepdim=True)
+        return self.logit_scale_a.exp() * a @ t.t()
+
+
+def stub_processor(text, return_tensors, padding):
+    return {"texts": text}
+
+
+def legacy_tags(model, audio):
+    """Tag selection as analyze_track did it: one forward pass and softmax per prompt group."""
+    probs = {g: model.logits_per_audio(audio, texts).softmax(dim=-1)[0].tolist() for g, texts in PROMPT_GROUPS.items()}
+    genre_scores = {}
+    for idx, score in enumerate(probs["genres"]):
+        genre_scores[GENRE_TEXT_MAP[idx]] = max(genre_scores.get(GENRE_TEXT_MAP[idx], 0.0), score)
+    genres = [g for g, s in sorted(genre_scores.items(), key=lambda x: x[1], reverse=True)[:5] if s > 0.01]
+    moods = [m for m, _ in sorted(zip(MOOD_PROMPTS, probs["moods"]), key=lambda x: x[1], reverse=True)[:5]]
+    instruments = {INSTRUMENT_PROMPTS[i]: round(s, 3) for i, s in enumerate(probs["instruments"]) if s > 0.05}
+    return genres, moods, instruments
+
+
+@pytest.fixture
+def stub_model(monkeypatch, tmp_path):
+    model = StubClap()
+    monkeypatch.setattr(prompt_cache, "PROMPT_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(AnalysisService, "get_clap_model", classmethod(lambda cls: (model, stub_processor)))
+    PromptEmbeddingCache.clear()
+    yield model
+    PromptEmbeddingCache.clear()
+
+
+def audio_batch(n):
+    return torch.randn(n, DIM, generator=torch.Generator().manual_seed(7))
+
+
+def test_score_embeddings_matches_per_group_softmax(stub_model):
+    audio = audio_batch(3)
+    text_embeds = PromptEmbeddingCache.get(stub_model, stub_processor, "stub", sum(PROMPT_GROUPS.values(), []))
+    normalized = audio / audio.norm(dim=-1, keepdim=True)
+    scores = AnalysisService.score_embeddings(normalized, text_embeds, stub_model.logit_scale_a.exp())
+
+    assert set(scores) == set(PROMPT_GROUP_SLICES)
+    for group, texts in PROMPT_GROUPS.items():
+        expected = stub_model.logits_per_audio(audio, texts).softmax(dim=-1)
+        assert scores[group].shape == expected.shape
+        assert torch.allclose(scores[group], expected, atol=1e-6)
+        assert torch.allclose(scores[group].sum(dim=-1), torch.ones(3), atol=1e-6)
+
+
+def test_tags_match_legacy_top_k(stub_model):
+    audio = audio_batch(4)
+    normalized = audio / audio.norm(dim=-1, keepdim=True)
+    tagged = AnalysisService.tag_embeddings(normalized)
+
+    assert len(tagged) == 4
+    for row, tags in enumerate(tagged):
+        genres, moods, instruments = legacy_tags(stub_model, audio[row:row + 1])
+        # tags_from_scores prepends the "<mood> <genre>" fusion tag
+        assert tags["genres"][1:] == genres
+        assert tags["genres"][0] == f"{moods[0]} {genres[0]}"
+        assert tags["moods"] == moods
+        assert tags["instruments"].keys() == instruments.keys()
+        for name, score in instruments.items():
+            assert tags["instruments"][name] == pytest.approx(score, abs=1e-3)
@@ -0,0 +1,96 @@
+"""Track queries (filters, keyset paging) and the JSON -> SQLite migration."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.schemas import Track, TrackQuery, UserEdits
+from app.services.storage_backends import JsonStorageBackend, SqliteStorageBackend
+
+BPMS = [120, 90, 120, 128, 120, 90, 140, 120, 128, 120]
+
+
+def make_library():
+    start = datetime(2024, 1, 1)
+    return [
+        Track(
+            filename=f"track{i:02d}.mp3", filepath=f"/tmp/track{i:02d}.mp3", status="complete",
+            upload_date=start + timedelta(minutes=i), final_bpm=bpm, final_key="Am" if i % 2 else "C",
+            suggested_genres=["House"] if bpm >= 120 else ["Hip Hop"],
+            suggested_moods=["Energetic"] if i % 3 == 0 else ["Chill"],
+        )
+        for i, bpm in enumerate(BPMS)
+    ]
+
+
+@pytest.fixture(params=["sqlite", "json"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        backend = SqliteStorageBackend(tmp_path / "library.db")
+    else:
+        backend = JsonStorageBackend(tmp_path / "results")
+    backend.save_tracks(make_library())
+    return backend
+
+
+def page_through(backend, **fields):
+    ids, cursor = [], None
+    while True:
+        page, cursor = backend.query_tracks(TrackQuery(limit=3, cursor=cursor, **fields))
+        assert len(page) <= 3
+        ids += [t.id for t in page]
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_bpm_paging_has_no_duplicates_or_gaps_across_ties(backend, order):
+    everything, cursor = backend.query_tracks(TrackQuery(sort="bpm", order=order))
+    assert cursor is None
+    bpms = [t.final_bpm for t in everything]
+    assert bpms == sorted(BPMS, reverse=order == "desc")
+
+    # Five tracks share 120 BPM, so that run straddles page boundaries
+    paged = page_through(backend, sort="bpm", order=order)
+    assert len(set(paged)) == len(paged)
+    assert paged == [t.id for t in everything]
+
+
+def test_filters_combine(backend):
+    tracks, _ = backend.query_tracks(TrackQuery(genre="house", mood="ENERGETIC", sort="filename", order="asc"))
+    assert [t.filename for t in tracks] == ["track00.mp3", "track03.mp3", "track06.mp3", "track09.mp3"]
+
+    tracks, _ = backend.query_tracks(TrackQuery(genre="House", bpm_min=125, key="am"))
+    assert sorted(t.filename for t in tracks) == ["track03.mp3"]
+
+    tracks, _ = backend.query_tracks(TrackQuery(genre="Hip Hop", sort="filename", order="asc"))
+    assert [t.filename for t in tracks] == ["track01.mp3", "track05.mp3"]
+
+
+def test_genre_filter_follows_user_edits(backend):
+    track = backend.query_tracks(TrackQuery(genre="Hip Hop", limit=1))[0][0]
+    track.edits = UserEdits(genres=["Jazz"])
+    backend.save_track(track)
+
+    hip_hop, _ = backend.query_tracks(TrackQuery(genre="hip hop"))
+    jazz, _ = backend.query_tracks(TrackQuery(genre="jazz"))
+    assert track.id not in {t.id for t in hip_hop}
+    assert [t.id for t in jazz] == [track.id]
+
+
+def test_migrate_from_json_imports_existing_records_once(tmp_path):
+    results_dir = tmp_path / "results"
+    legacy = JsonStorageBackend(results_dir)
+    library = make_library()
+    library[0].edits = UserEdits(bpm=121, notes="ride out")
+    legacy.save_tracks(library)
+
+    db = SqliteStorageBackend(tmp_path / "library.db", legacy_results_dir=results_dir)
+    assert db.get_tracks([t.id for t in library]) == library
+    tracks, _ = db.query_tracks(TrackQuery(genre="House", mood="Energetic"))
+    assert len(tracks) == 4
+
+    # Already migrated: a new JSON record is not picked up on the next start
+    legacy.save_track(Track(filename="late.mp3", filepath="/tmp/late.mp3"))
+    reopened = SqliteStorageBackend(tmp_path / "library.db", legacy_results_dir=results_dir)
+    assert reopened.migrate_from_json(results_dir) == 0
+    assert len(reopened.query_tracks(TrackQuery())[0]) == len(library)
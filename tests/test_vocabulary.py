@@ -0,0 +1,172 @@
+"""Vocabulary / mapping-rule loading, style mapping and re-scoring on a vocabulary change."""
+import asyncio
+import textwrap
+
+import pytest
+
+from app.models.schemas import AnalysisResult, Track, UserEdits
+from app.services import rescore, vocabulary
+from app.services.embedding_index import EmbeddingIndex
+from app.services.engine import AnalysisEngine
+from app.services.rescore import RescoreJob
+from app.services.storage import StorageService
+from app.services.storage_backends import SqliteStorageBackend
+from app.services.vocabulary import load_mapping_rules, load_vocabulary, map_styles
+
+
+def write(path, text):
+    path.write_text(textwrap.dedent(text), encoding="utf-8")
+    return path
+
+
+VOCABULARY_YAML = """
+    genres:
+      "Hip Hop": ["A hip hop song", "A rap song"]
+      "House": ["House music"]
+    moods:
+      template: "A {} song"
+      labels: ["Dark", "Happy"]
+    instruments:
+      labels: ["Piano"]
+    metrics:
+      energy: ["High energy music", "Low energy music"]
+      danceability: ["Danceable music", "Not danceable music"]
+    thresholds:
+      max_genres: 2
+"""
+
+
+# --- Loading ---
+
+def test_load_vocabulary_fills_templates_and_default_thresholds(tmp_path):
+    vocab = load_vocabulary(write(tmp_path / "vocabulary.yaml", VOCABULARY_YAML))
+    assert vocab["genres"] == {"Hip Hop": ["A hip hop song", "A rap song"], "House": ["House music"]}
+    assert (vocab["moods"], vocab["mood_template"]) == (["Dark", "Happy"], "A {} song")
+    assert vocab["instrument_template"] == "{}"
+    assert vocab["metrics"] == ["High energy music", "Low energy music", "Danceable music", "Not danceable music"]
+    assert vocab["thresholds"]["max_genres"] == 2
+    assert vocab["thresholds"]["max_moods"] == vocabulary.DEFAULT_THRESHOLDS["max_moods"]
+
+
+@pytest.mark.parametrize("broken", [
+    VOCABULARY_YAML.replace('"House": ["House music"]', '"House": []'),
+    VOCABULARY_YAML.replace('energy: ["High energy music", "Low energy music"]', 'energy: ["High energy music"]'),
+    VOCABULARY_YAML.replace('labels: ["Dark", "Happy"]', 'labels: []'),
+    "- just\n- a list\n",
+])
+def test_load_vocabulary_rejects_malformed_files(tmp_path, broken):
+    with pytest.raises(ValueError):
+        load_vocabulary(write(tmp_path / "vocabulary.yaml", broken))
+
+
+def test_load_mapping_rules_normalizes_tags(tmp_path):
+    rules = load_mapping_rules(write(tmp_path / "rules.yaml", """
+        mapping:
+          "Dark Trap":
+            source_tags: ["Trap", "dark", "Hip-Hop"]
+            threshold: 0.6
+          "Lofi":
+            source_tags: ["chill"]
+    """))
+    assert rules == {
+        "Dark Trap": {"source_tags": ["trap", "dark", "hiphop"], "threshold": 0.6},
+        "Lofi": {"source_tags": ["chill"], "threshold": vocabulary.DEFAULT_RULE_THRESHOLD},
+    }
+    assert load_mapping_rules(tmp_path / "missing.yaml") == {}
+    with pytest.raises(ValueError):
+        load_mapping_rules(write(tmp_path / "bad.yaml", "mapping:\n  Empty: {}\n"))
+
+
+# --- map_styles ---
+
+@pytest.fixture
+def rules(tmp_path, monkeypatch):
+    monkeypatch.setattr(vocabulary, "MAPPING_RULES", load_mapping_rules(write(tmp_path / "rules.yaml", """
+        mapping:
+          "Dark Trap":
+            source_tags: ["trap", "dark", "aggressive", "hiphop"]
+            threshold: 0.5
+          "Keys":
+            source_tags: ["piano"]
+            threshold: 1.0
+    """)))
+
+
+def test_map_styles_scores_the_share_of_matched_source_tags(rules):
+    # "Dark Trap" splits into darktrap / dark / trap; "Hip Hop" into hiphop / hip / hop
+    assert map_styles(["Dark Trap"], [], []) == ["Dark Trap"]
+    assert map_styles(["Hip Hop"], ["Aggressive"], ["Piano"]) == ["Dark Trap", "Keys"]
+    # One of four source tags is below the 0.5 threshold
+    assert map_styles(["Trap"], ["Happy"], []) == []
+    assert map_styles([], [], ["piano"]) == ["Keys"]
+
+
+# --- Re-scoring ---
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.setattr(StorageService, "_backend", SqliteStorageBackend(tmp_path / "library.db"))
+    monkeypatch.setattr(EmbeddingIndex, "_instance", EmbeddingIndex(tmp_path / "index"))
+    for attr in ("scanned", "rescored", "missing_embedding"):
+        monkeypatch.setattr(RescoreJob, attr, 0)
+    monkeypatch.setattr(RescoreJob, "state", "running")
+
+    scored = []
+
+    async def tag_embeddings(embeddings):
+        scored.append(len(embeddings))
+        return [{
+            "genres": ["House"], "moods": ["Happy"], "instruments": {"Piano": 0.4},
+            "styles": ["Keys"], "energy": 0.7, "danceability": 0.8,
+        } for _ in embeddings]
+
+    monkeypatch.setattr(AnalysisEngine, "tag_embeddings", tag_embeddings)
+    return scored
+
+
+def add_track(tag_version, embedding=(1.0, 0.0), **fields):
+    track = Track(
+        filename="t.mp3", filepath="/t.mp3", status="complete", tag_version=tag_version,
+        suggested_genres=["Rock"], analysis=AnalysisResult(), **fields,
+    )
+    StorageService.save_track(track)
+    if embedding is not None:
+        EmbeddingIndex.instance().add(track.id, list(embedding))
+    return track
+
+
+def bump_vocabulary(monkeypatch, version):
+    monkeypatch.setattr(vocabulary, "VOCABULARY_VERSION", version)
+    monkeypatch.setattr(rescore, "VOCABULARY_VERSION", version)
+
+
+def test_vocabulary_bump_rescores_stale_tracks_only(library, monkeypatch):
+    old = add_track("v1", edits=UserEdits(genres=["Jazz"]))
+    current = add_track("v2")
+    no_embedding = add_track("v1", embedding=None)
+    bump_vocabulary(monkeypatch, "v2")
+
+    asyncio.run(RescoreJob.run())
+
+    assert RescoreJob.state == "complete"
+    assert (RescoreJob.scanned, RescoreJob.rescored, RescoreJob.missing_embedding) == (3, 1, 1)
+    assert library == [1]
+
+    retagged = StorageService.get_track(old.id)
+    assert retagged.tag_version == "v2"
+    assert (retagged.suggested_genres, retagged.suggested_styles) == (["House"], ["Keys"])
+    assert retagged.analysis.model_tags["instruments"] == {"Piano": 0.4}
+    # Edits are left alone and still win
+    assert retagged.merged()["genres"] == ["Jazz"]
+    assert StorageService.get_track(current.id).suggested_genres == ["Rock"]
+    assert StorageService.get_track(no_embedding.id).tag_version == "v1"
+
+
+def test_forced_rescore_retags_current_tracks_too(library, monkeypatch):
+    bump_vocabulary(monkeypatch, "v2")
+    tracks = [add_track("v2") for _ in range(3)]
+
+    asyncio.run(RescoreJob.run(force=True))
+
+    assert RescoreJob.rescored == 3
+    assert all(StorageService.get_track(t.id).suggested_genres == ["House"] for t in tracks)
@@ -2,6 +2,9 @@ import axios from 'axios';
 
 const API_URL = 'http://127.0.0.1:8000/api';
 
+// 200 UUIDs keep GET /tracks/status well below the ~16KB request line uvicorn accepts
+const STATUS_IDS_PER_REQUEST = 200;
+
 export const client = axios.create({
     baseURL: API_URL,
 });
@@ -9,18 +12,44 @@ export const client = axios.create({
 export interface Track {
     id: string;
     filename: string;
-    status: 'queued' | 'analyzing' | 'complete' | 'failed' | 'error';
+    status: 'queued' | 'preview' | 'analyzing' | 'complete' | 'failed' | 'error';
     duration: number;
     upload_date: string;
     final_bpm: number;
     final_key: string;
     suggested_genres: string[];
     suggested_moods: string[];
+    suggested_styles: string[];
+    // Which tier produced each analyzed field (bpm, key, duration, genres, ...)
+    provenance?: Record<string, 'preview' | 'full'>;
 
     analysis?: any;
     edits?: any;
 }
 
+export interface EditPatch {
+    add_genres?: string[];
+    remove_genres?: string[];
+    add_moods?: string[];
+    remove_moods?: string[];
+    add_styles?: string[];
+    remove_styles?: string[];
+    bpm?: number;
+    key?: string;
+    notes?: string;
+}
+
+export interface TrackStatus {
+    id: string;
+    status: Track['status'];
+    stage?: string;
+    progress?: number;
+}
+
+export type TrackEvent =
+    | { type: 'status'; track_id: string; status: Track['status'] }
+    | { type: 'stage'; track_id: string; stage: string; progress: number };
+
 export const api = {
     uploadFile: async (file: File, onProgress?: (percent: number) => void) => {
         const formData = new FormData();
@@ -40,11 +69,57 @@ export const api = {
         return response.data;
     },
 
+    uploadBatch: async (files: File[], onProgress?: (percent: number) => void) => {
+        const formData = new FormData();
+        files.forEach(file => formData.append('files', file));
+
+        const response = await client.post<{ tracks: Track[]; rejected: { filename: string; reason: string }[] }>('/upload/batch', formData, {
+            headers: {
+                'Content-Type': 'multipart/form-data',
+            },
+            onUploadProgress: (progressEvent) => {
+                if (progressEvent.total && onProgress) {
+                    onProgress(Math.round((progressEvent.loaded * 100) / progressEvent.total));
+                }
+            },
+        });
+        return response.data;
+    },
+
     getTracks: async () => {
         const response = await client.get<{ tracks: Track[] }>('/tracks');
         return response.data.tracks;
     },
 
+    // IDs go in the query string, so large batches are split to stay under the server's request-line limit
+    getTrackStatuses: async (ids: string[]) => {
+        const chunks: string[][] = [];
+        for (let i = 0; i < ids.length; i += STATUS_IDS_PER_REQUEST) {
+            chunks.push(ids.slice(i, i + STATUS_IDS_PER_REQUEST));
+        }
+        const responses = await Promise.all(chunks.map(chunk =>
+            client.get<{ tracks: TrackStatus[] }>('/tracks/status', { params: { ids: chunk.join(',') } })
+        ));
+        return responses.flatMap(response => response.data.tracks);
+    },
+
+    // False when the API process runs no analyses (split api/worker deployment, Lambda): /events has nothing to send
+    hasLiveEvents: async () => {
+        // /ready sits outside /api and answers 503 while warming up; only the flag matters here
+        const response = await axios.get(`${API_URL.replace(/\/api$/, '')}/ready`, { validateStatus: () => true });
+        return Boolean(response.data?.live_events);
+    },
+
+    // Server-sent status/stage events; the browser reconnects on its own and calls onOpen again
+    subscribeEvents: (onEvent: (event: TrackEvent) => void, onOpen?: () => void) => {
+        const source = new EventSource(`${API_URL}/events`);
+        const handler = (e: MessageEvent) => onEvent(JSON.parse(e.data));
+        source.addEventListener('status', handler);
+        source.addEventListener('stage', handler);
+        if (onOpen) source.onopen = onOpen;
+        return source;
+    },
+
     getTrack: async (id: string) => {
         const response = await client.get<Track>(`/tracks/${id}`);
         return response.data;
@@ -55,9 +130,27 @@ export const api = {
         return response.data;
     },
 
-    // Placeholder for export
-    exportCsv: (trackIds: string[]) => {
-        // Direct link usually better for download
-        window.location.href = `${API_URL}/export/csv?track_ids=${trackIds.join(',')}`;
-    }
+    // One patch for many tracks, applied server-side in a single transaction
+    bulkEdit: async (trackIds: string[], patch: EditPatch) => {
+        const response = await client.patch<{ updated: number; missing: string[] }>('/tracks/edits', {
+            track_ids: trackIds,
+            patch,
+        });
+        return response.data;
+    },
+
+    exportTracks: async (trackIds: string[], format: 'csv' | 'ndjson' | 'json' = 'csv') => {
+        // POST keeps large selections out of the URL; the body streams back as a file
+        const response = await client.post<Blob>('/export', { format, track_ids: trackIds }, {
+            responseType: 'blob',
+        });
+        const url = URL.createObjectURL(response.data);
+        const link = document.createElement('a');
+        link.href = url;
+        link.download = `disco_export.${format}`;
+        link.click();
+        URL.revokeObjectURL(url);
+    },
+
+    exportCsv: (trackIds: string[]) => api.exportTracks(trackIds, 'csv'),
 };
@@ -10,6 +10,7 @@ const ResultsPage = () => {
     const [editingTrack, setEditingTrack] = useState<Track | null>(null);
     const [hasChanges, setHasChanges] = useState(false);
     const [showCopied, setShowCopied] = useState(false);
+    const [bulkGenre, setBulkGenre] = useState('');
 
     useEffect(() => {
         loadTracks();
@@ -56,8 +57,10 @@ const ResultsPage = () => {
         const key = edits.key || editingTrack.final_key || editingTrack.analysis?.key_key || '';
         const genres = (edits.genres?.length ? edits.genres : editingTrack.suggested_genres) || [];
         const moods = (edits.moods?.length ? edits.moods : editingTrack.suggested_moods) || [];
+        const styles = (edits.styles?.length ? edits.styles : editingTrack.suggested_styles) || [];
 
-        const text = `BPM: ${Math.round(bpm)} | Key: ${key} | Genres: ${genres.join(', ')} | Moods: ${moods.join(', ')}`;
+        let text = `BPM: ${Math.round(bpm)} | Key: ${key} | Genres: ${genres.join(', ')} | Moods: ${moods.join(', ')}`;
+        if (styles.length) text += ` | Styles: ${styles.join(', ')}`;
         navigator.clipboard.writeText(text);
         setShowCopied(true);
         setTimeout(() => setShowCopied(false), 2000);
@@ -65,6 +68,22 @@ const ResultsPage = () => {
 
     const filteredTracks = tracks.filter(t => t.filename.toLowerCase().includes(filter.toLowerCase()));
 
+    // Tag every track in the filtered list with one request
+    const addGenreToFiltered = async () => {
+        const genre = bulkGenre.trim();
+        if (!genre || filteredTracks.length === 0) return;
+        try {
+            await api.bulkEdit(filteredTracks.map(t => t.id), { add_genres: [genre] });
+            setBulkGenre('');
+            const data = await api.getTracks();
+            setTracks(data);
+            const current = data.find(t => t.id === selectedId);
+            if (current && !hasChanges) selectTrack(current);
+        } catch (e) {
+            console.error(e);
+        }
+    };
+
     // Render helpers
     const renderTagInput = (field: 'genres' | 'moods', label: string) => {
         if (!editingTrack) return null;
@@ -143,6 +162,23 @@ const ResultsPage = () => {
                             onChange={e => setFilter(e.target.value)}
                         />
                     </div>
+                    <div className="flex gap-2 mt-2">
+                        <input
+                            type="text"
+                            placeholder={`Add genre to ${filteredTracks.length} tracks...`}
+                            className="flex-1 min-w-0 bg-background border border-stone-700 rounded-lg px-3 py-1.5 text-xs focus:border-gold outline-none"
+                            value={bulkGenre}
+                            onChange={e => setBulkGenre(e.target.value)}
+                            onKeyDown={e => e.key === 'Enter' && addGenreToFiltered()}
+                        />
+                        <button
+                            onClick={addGenreToFiltered}
+                            disabled={!bulkGenre.trim() || filteredTracks.length === 0}
+                            className="px-3 py-1.5 bg-stone-800 hover:bg-stone-700 disabled:text-stone-500 rounded-lg text-xs font-medium transition-colors"
+                        >
+                            Tag all
+                        </button>
+                    </div>
                 </div>
                 <div className="flex-1 overflow-y-auto p-2 space-y-1">
                     {filteredTracks.map(track => (
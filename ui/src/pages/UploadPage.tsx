@@ -1,97 +1,219 @@
-import React, { useState, useCallback } from 'react';
+import React, { useState, useCallback, useEffect, useRef } from 'react';
 import { Upload, X, FileAudio, Loader2 } from 'lucide-react';
 import { cn } from '../lib/utils';
-import { api } from '../api/client';
+import { api, type Track, type TrackEvent } from '../api/client';
+
+const ACCEPTED_EXTENSIONS = ['.mp3', '.wav', '.flac', '.m4a', '.zip'];
+const isAccepted = (f: File) => ACCEPTED_EXTENSIONS.some(ext => f.name.toLowerCase().endsWith(ext));
+const isArchive = (name: string) => name.toLowerCase().endsWith('.zip');
+// With the API and workers in separate processes there is no event stream
+// (see api.hasLiveEvents), so statuses are also polled while anything is in flight
+const STATUS_POLL_MS = 5000;
 
 interface FileItem {
     id: string; // temp id
-    file: File;
-    status: 'pending' | 'uploading' | 'analyzing' | 'complete' | 'error';
+    name: string;
+    file?: File; // Absent for tracks expanded from an uploaded zip
+    status: 'pending' | 'uploading' | 'analyzing' | 'preview' | 'complete' | 'error';
     progress: number;
     errorMessage?: string;
-    trackId?: string; // Backend track ID for polling
+    trackId?: string; // Backend track ID for progress events
+    stage?: string; // Current analysis stage, from the server
     trackData?: any; // Full track data after analysis
 }
 
 const UploadPage = () => {
     const [queue, setQueue] = useState<FileItem[]>([]);
     const [isDragOver, setIsDragOver] = useState(false);
+    // Backend track ID -> queue item ID for tracks still being analyzed
+    const watched = useRef(new Map<string, string>());
+    // Last status seen by the poll, so an unchanged status is not applied (and re-fetched) again
+    const polled = useRef(new Map<string, Track['status']>());
+
+    const applyStatus = async (trackId: string, status: Track['status']) => {
+        const itemId = watched.current.get(trackId);
+        if (!itemId) return;
+
+        if (status === 'complete') {
+            watched.current.delete(trackId);
+            polled.current.delete(trackId);
+            try {
+                const track = await api.getTrack(trackId);
+                setQueue(prev => prev.map(item =>
+                    item.id === itemId ? { ...item, status: 'complete', progress: 100, stage: undefined, trackData: track } : item
+                ));
+            } catch (error) {
+                console.error("Failed to load track:", error);
+            }
+        } else if (status === 'failed' || status === 'error') {
+            watched.current.delete(trackId);
+            polled.current.delete(trackId);
+            setQueue(prev => prev.map(item =>
+                item.id === itemId ? { ...item, status: 'error', stage: undefined, errorMessage: 'Analysis failed' } : item
+            ));
+        } else if (status === 'preview' || status === 'analyzing') {
+            // Quick excerpt results (BPM, key, coarse genres) while the full analysis runs
+            try {
+                const track = await api.getTrack(trackId);
+                if (!Object.values(track.provenance || {}).includes('preview')) return;
+                setQueue(prev => prev.map(item =>
+                    item.id === itemId && item.status !== 'complete' ? { ...item, status: 'preview', trackData: track } : item
+                ));
+            } catch (error) {
+                console.error("Failed to load track preview:", error);
+            }
+        } else if (status === 'queued') {
+            // Waiting (again) for a worker
+            setQueue(prev => prev.map(item =>
+                item.id === itemId ? { ...item, stage: undefined, progress: 100 } : item
+            ));
+        }
+    };
 
-    const startUpload = async (fileItem: FileItem) => {
+    const applyStage = (trackId: string, stage: string, progress: number) => {
+        const itemId = watched.current.get(trackId);
+        if (!itemId) return;
         setQueue(prev => prev.map(item =>
-            item.id === fileItem.id ? { ...item, status: 'uploading' } : item
+            item.id === itemId ? { ...item, stage, progress: Math.round(progress * 100) } : item
         ));
+    };
 
+    // One bulk status request catches anything that changed while no events were received
+    const syncStatuses = async (changedOnly: boolean) => {
+        const ids = Array.from(watched.current.keys());
+        if (ids.length === 0) return;
         try {
-            const uploadedTrack = await api.uploadFile(fileItem.file, (progress) => {
+            const statuses = await api.getTrackStatuses(ids);
+            statuses.forEach(s => {
+                const changed = polled.current.get(s.id) !== s.status;
+                polled.current.set(s.id, s.status);
+                if (!changedOnly || changed) applyStatus(s.id, s.status);
+                if (s.stage && s.progress !== undefined) applyStage(s.id, s.stage, s.progress);
+            });
+        } catch (error) {
+            console.error("Status sync error:", error);
+        }
+    };
+
+    const reconcile = () => syncStatuses(false);
+
+    const watchTracks = (pairs: [string, string][]) => {
+        pairs.forEach(([itemId, trackId]) => watched.current.set(trackId, itemId));
+        reconcile();
+    };
+
+    // A single event stream for the whole page where the API has one, backed by a bulk status poll
+    useEffect(() => {
+        let source: EventSource | undefined;
+        let closed = false;
+        api.hasLiveEvents()
+            .then(live => {
+                if (!live || closed) return;
+                source = api.subscribeEvents((event: TrackEvent) => {
+                    if (event.type === 'status') {
+                        applyStatus(event.track_id, event.status);
+                    } else {
+                        applyStage(event.track_id, event.stage, event.progress);
+                    }
+                }, reconcile);
+            })
+            .catch(error => console.error("Readiness check failed:", error));
+        const poll = setInterval(() => syncStatuses(true), STATUS_POLL_MS);
+        return () => {
+            closed = true;
+            source?.close();
+            clearInterval(poll);
+        };
+    }, []);
+
+    // One request for the whole drop; the server expands zips and validates each file
+    const startBatchUpload = async (items: FileItem[]) => {
+        const ids = new Set(items.map(i => i.id));
+        setQueue(prev => prev.map(item =>
+            ids.has(item.id) ? { ...item, status: 'uploading' } : item
+        ));
+
+        try {
+            const { tracks, rejected } = await api.uploadBatch(items.map(i => i.file as File), (progress) => {
                 setQueue(prev => prev.map(item =>
-                    item.id === fileItem.id ? { ...item, progress } : item
+                    ids.has(item.id) ? { ...item, progress } : item
                 ));
             });
 
-            // Start polling for analysis status
-            setQueue(prev => prev.map(item =>
-                item.id === fileItem.id ? { ...item, status: 'analyzing', progress: 100, trackId: uploadedTrack.id } : item
-            ));
+            // Match returned tracks back to the dropped files by name
+            const unmatched = [...tracks];
+            const assigned = new Map<string, Track>();
+            items.filter(i => !isArchive(i.name)).forEach(item => {
+                const idx = unmatched.findIndex(t => t.filename === item.name);
+                if (idx >= 0) {
+                    assigned.set(item.id, unmatched[idx]);
+                    unmatched.splice(idx, 1);
+                }
+            });
+            // Whatever is left came out of zip archives
+            const expanded: FileItem[] = unmatched.map(t => ({
+                id: Math.random().toString(36).substr(2, 9),
+                name: t.filename,
+                status: 'analyzing' as const,
+                progress: 100,
+                trackId: t.id,
+            }));
 
-            // Poll every 2 seconds until analysis is complete
-            pollTrackStatus(fileItem.id, uploadedTrack.id);
+            setQueue(prev => [
+                ...prev
+                    .filter(item => !(ids.has(item.id) && isArchive(item.name)))
+                    .map(item => {
+                        if (!ids.has(item.id)) return item;
+                        const track = assigned.get(item.id);
+                        if (track) {
+                            return { ...item, status: 'analyzing' as const, progress: 100, trackId: track.id };
+                        }
+                        const reason = rejected.find(r => r.filename === item.name)?.reason;
+                        return { ...item, status: 'error' as const, progress: 0, errorMessage: reason || 'Upload Failed' };
+                    }),
+                ...expanded,
+            ]);
+
+            // Progress now arrives over the event stream
+            watchTracks([
+                ...Array.from(assigned.entries()).map(([itemId, track]) => [itemId, track.id] as [string, string]),
+                ...expanded.map(item => [item.id, item.trackId as string] as [string, string]),
+            ]);
 
         } catch (error: any) {
             console.error("Upload error:", error);
             const msg = error.response?.data?.detail || error.message || "Upload Failed";
 
             setQueue(prev => prev.map(item =>
-                item.id === fileItem.id ? { ...item, status: 'error', progress: 0, errorMessage: msg } : item
+                ids.has(item.id) ? { ...item, status: 'error', progress: 0, errorMessage: msg } : item
             ));
         }
     };
 
-    const pollTrackStatus = async (fileItemId: string, trackId: string) => {
-        try {
-            const track = await api.getTrack(trackId);
-
-            if (track.status === 'complete') {
-                setQueue(prev => prev.map(item =>
-                    item.id === fileItemId ? { ...item, status: 'complete', progress: 100, trackData: track } : item
-                ));
-            } else if (track.status === 'failed') {
-                setQueue(prev => prev.map(item =>
-                    item.id === fileItemId ? { ...item, status: 'error', errorMessage: 'Analysis failed' } : item
-                ));
-            } else {
-                // Still analyzing, poll again in 2 seconds
-                setTimeout(() => pollTrackStatus(fileItemId, trackId), 2000);
-            }
-        } catch (error) {
-            console.error("Polling error:", error);
-        }
-    };
-
     const handleDrop = useCallback((e: React.DragEvent) => {
         e.preventDefault();
         setIsDragOver(false);
 
         if (e.dataTransfer.files && e.dataTransfer.files.length > 0) {
-            const incomingFiles = Array.from(e.dataTransfer.files)
-                .filter(f => f.name.toLowerCase().endsWith('.mp3'));
+            const incomingFiles = Array.from(e.dataTransfer.files).filter(isAccepted);
 
             // Filter duplicates
             const uniqueFiles = incomingFiles.filter(f =>
-                !queue.some(q => q.file.name === f.name && q.file.size === f.size)
+                !queue.some(q => q.file && q.file.name === f.name && q.file.size === f.size)
             );
 
             if (uniqueFiles.length === 0) return;
 
             const newFiles = uniqueFiles.map(f => ({
                 id: Math.random().toString(36).substr(2, 9),
+                name: f.name,
                 file: f,
                 status: 'pending' as const,
                 progress: 0
             }));
 
             setQueue(prev => [...prev, ...newFiles]);
-            newFiles.forEach(file => startUpload(file));
+            startBatchUpload(newFiles);
         }
     }, [queue]);
 
@@ -113,7 +235,7 @@ const UploadPage = () => {
         <div className="space-y-8">
             <div className="flex justify-between items-center">
                 <h2 className="text-3xl font-bold text-white tracking-tight">Upload Tracks</h2>
-                <span className="text-stone-400 text-sm">Supported format: MP3</span>
+                <span className="text-stone-400 text-sm">Supported formats: MP3, WAV, FLAC, M4A, or a ZIP of them</span>
             </div>
 
             {/* Drop Zone */}
@@ -132,27 +254,27 @@ const UploadPage = () => {
                     <input
                         type="file"
                         multiple
-                        accept=".mp3"
+                        accept={ACCEPTED_EXTENSIONS.join(',')}
                         className="absolute inset-0 w-full h-full opacity-0 cursor-pointer z-10"
                         onChange={(e) => {
                             if (e.target.files?.length) {
-                                const incomingFiles = Array.from(e.target.files)
-                                    .filter(f => f.name.toLowerCase().endsWith('.mp3'));
+                                const incomingFiles = Array.from(e.target.files).filter(isAccepted);
 
                                 // Filter duplicates
                                 const uniqueFiles = incomingFiles.filter(f =>
-                                    !queue.some(q => q.file.name === f.name && q.file.size === f.size)
+                                    !queue.some(q => q.file && q.file.name === f.name && q.file.size === f.size)
                                 );
 
                                 if (uniqueFiles.length > 0) {
                                     const newFiles = uniqueFiles.map(f => ({
                                         id: Math.random().toString(36).substr(2, 9),
+                                        name: f.name,
                                         file: f,
                                         status: 'pending' as const,
                                         progress: 0
                                     }));
                                     setQueue(prev => [...prev, ...newFiles]);
-                                    newFiles.forEach(file => startUpload(file));
+                                    startBatchUpload(newFiles);
                                 }
                                 // Reset input to allow re-uploading the same file
                                 e.target.value = '';
@@ -163,7 +285,7 @@ const UploadPage = () => {
                         <Upload size={32} className={cn("transition-colors", isDragOver ? "text-gold" : "text-stone-500")} />
                     </div>
                     <p className="text-lg font-medium text-stone-300">
-                        Drag and drop MP3 files here
+                        Drag and drop audio files or a zipped folder here
                     </p>
                     <p className="text-stone-500 mt-2 text-sm">
                         or click to select files
@@ -195,16 +317,18 @@ const UploadPage = () => {
                                 <FileAudio className="text-stone-600" size={24} />
                                 <div className="flex-1 min-w-0">
                                     <div className="flex justify-between mb-1">
-                                        <p className="text-sm font-medium text-white truncate">{item.file.name}</p>
+                                        <p className="text-sm font-medium text-white truncate">{item.name}</p>
                                         <div className="flex items-center gap-2">
                                             {item.status === 'uploading' && <Loader2 size={12} className="animate-spin text-gold" />}
                                             <span className={cn("text-xs uppercase font-bold tracking-wider",
                                                 item.status === 'complete' ? "text-green-500" :
                                                     item.status === 'error' ? "text-red-500" :
-                                                        item.status === 'analyzing' ? "text-blue-400" :
+                                                        item.status === 'analyzing' || item.status === 'preview' ? "text-blue-400" :
                                                             "text-stone-500"
                                             )}>
-                                                {item.status === 'error' && item.errorMessage ? `Error: ${item.errorMessage}` : item.status}
+                                                {item.status === 'error' && item.errorMessage
+                                                    ? `Error: ${item.errorMessage}`
+                                                    : (item.status === 'analyzing' || item.status === 'preview') && item.stage ? `${item.status} · ${item.stage}` : item.status}
                                             </span>
                                         </div>
                                     </div>
@@ -214,15 +338,18 @@ const UploadPage = () => {
                                             className={cn(
                                                 "h-full transition-all duration-300",
                                                 item.status === 'error' ? "bg-red-500" : "bg-gold",
-                                                item.status === 'analyzing' ? "animate-pulse" : ""
+                                                (item.status === 'analyzing' || item.status === 'preview') && !item.stage ? "animate-pulse" : ""
                                             )}
-                                            style={{ width: item.status === 'analyzing' ? '100%' : `${item.progress}%` }}
+                                            style={{ width: (item.status === 'analyzing' || item.status === 'preview') && !item.stage ? '100%' : `${item.progress}%` }}
                                         />
                                     </div>
 
                                     {/* Results - Modern Card Design */}
-                                    {item.status === 'complete' && item.trackData && (
+                                    {(item.status === 'complete' || item.status === 'preview') && item.trackData && (
                                         <div className="mt-4 pt-4 border-t border-stone-800/50 space-y-4">
+                                            {item.status === 'preview' && (
+                                                <div className="text-xs text-blue-400/80">Preview from a short excerpt · full analysis pending</div>
+                                            )}
                                             {/* Key Metrics Grid */}
                                             <div className="grid grid-cols-2 md:grid-cols-4 gap-3">
                                                 <div className="bg-gradient-to-br from-gold/10 to-gold/5 border border-gold/20 rounded-lg p-3">
@@ -233,14 +360,18 @@ const UploadPage = () => {
                                                     <div className="text-xs text-green-light/70 font-medium mb-1">Key</div>
                                                     <div className="text-2xl font-bold text-white">{item.trackData.final_key}</div>
                                                 </div>
-                                                <div className="bg-gradient-to-br from-blue/10 to-blue/5 border border-blue/20 rounded-lg p-3">
-                                                    <div className="text-xs text-blue-300/70 font-medium mb-1">Energy</div>
-                                                    <div className="text-2xl font-bold text-white">{Math.round((item.trackData.analysis?.energy || 0))} / 10</div>
-                                                </div>
-                                                <div className="bg-gradient-to-br from-purple/10 to-purple/5 border border-purple/20 rounded-lg p-3">
-                                                    <div className="text-xs text-purple-300/70 font-medium mb-1">Danceability</div>
-                                                    <div className="text-2xl font-bold text-white">{Math.round((item.trackData.analysis?.model_tags?.danceability || 0) * 100)}%</div>
-                                                </div>
+                                                {item.status === 'complete' && (
+                                                    <>
+                                                        <div className="bg-gradient-to-br from-blue/10 to-blue/5 border border-blue/20 rounded-lg p-3">
+                                                            <div className="text-xs text-blue-300/70 font-medium mb-1">Energy</div>
+                                                            <div className="text-2xl font-bold text-white">{Math.round((item.trackData.analysis?.energy || 0))} / 10</div>
+                                                        </div>
+                                                        <div className="bg-gradient-to-br from-purple/10 to-purple/5 border border-purple/20 rounded-lg p-3">
+                                                            <div className="text-xs text-purple-300/70 font-medium mb-1">Danceability</div>
+                                                            <div className="text-2xl font-bold text-white">{Math.round((item.trackData.analysis?.model_tags?.danceability || 0) * 100)}%</div>
+                                                        </div>
+                                                    </>
+                                                )}
                                             </div>
 
                                             {/* Deep Analysis Details (Valence, Tension, Brightness, etc.) */}